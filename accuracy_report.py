@@ -0,0 +1,293 @@
+'''
+Description: accuracy report of every result file of the benchmarks
+against its golden outputs, with the error definitions of util.error
+computed in numpy per sample:
+    hotspot, hotspot_5: relative error, sum over the outputs of
+        |(output - golden) / golden|
+    fft, inversek2j: absolute error, sum over the outputs of
+        |output - golden|
+the result files found for every benchmark and i_h1_h2_o topology are
+    tf: data/train/train_result/<t>.txt (train_dnn.py)
+    cpu: data/inference/inference_result/cpu/<t>.txt (cpu_inference.py),
+        against data/inference/golden.txt
+    npu: data/<arch>/<t>_hex.dat (rtl_sim.py), or data/<arch>/output_hex.dat
+        of the hand-run testbench when nn_config/<arch>/ holds one topology
+    model: data/<arch>/<t>_golden_hex.dat (golden_model.py)
+every pair of files is streamed in chunks, hex decoded on the fly, and the
+mean, max and percentiles of the per-sample error and its histogram are
+accumulated in one pass. percentiles come from the histogram, whose bins
+are HIST_BINS_PER_DECADE per decade, so they are exact to a bin width
+(0.46%). samples whose error is not finite (e.g. NaN goldens) are counted
+apart. results shorter than the golden file, like testbench runs on the
+first inputs, are compared over their length, e.g.
+    python accuracy_report.py -o report.csv -hist histograms.csv
+'''
+import argparse
+import os
+import re
+import glob
+import time
+import numpy as np
+import f_to_h
+import h_to_f
+from pipelined_vector_model import parse_topology
+
+BENCHMARKS = ('fft', 'hotspot', 'hotspot_5', 'inversek2j')
+RELATIVE_ERROR = ('hotspot', 'hotspot_5')
+ARCHITECTURES = ('pipelined_vector', 'vector', 'systolic')
+# number of text lines parsed at a time
+CHUNK_LINES = 65536
+# histogram of the per-sample error: log-spaced bins plus an underflow bin
+# below the first edge and an overflow bin above the last one; 500 bins per
+# decade keep the percentiles within 0.2% of np.percentile on the shipped
+# results (20 were 12% wide and off by up to 3%)
+HIST_BINS_PER_DECADE = 500
+HIST_MIN_EXP = -9
+HIST_MAX_EXP = 6
+HIST_EDGES = 10.0 ** np.linspace(HIST_MIN_EXP, HIST_MAX_EXP,
+        (HIST_MAX_EXP - HIST_MIN_EXP) * HIST_BINS_PER_DECADE + 1)
+PERCENTILES = (50, 90, 99)
+
+def sample_errors(outputs, goldens, benchmark):
+    '''error of every sample, as util.error sums it over a batch
+
+    Args:
+        outputs: [num_rows, num_out] outputs
+        goldens: [num_rows, num_out] golden outputs
+        benchmark: which benchmark
+
+    Returns:
+        errors: [num_rows] float64 array
+    '''
+    diff = outputs.astype(np.float64) - goldens
+    if benchmark in RELATIVE_ERROR or benchmark not in BENCHMARKS:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diff /= goldens
+    return np.abs(diff).sum(axis=1)
+
+def read_text_rows(file_name, width, skip_lines=0, chunk_lines=CHUNK_LINES):
+    '''read a float text file block by block
+
+    Yields:
+        rows: [num_rows, width] float64 array
+    '''
+    carry = np.zeros(0)
+    for values in f_to_h.read_chunks(file_name, skip_lines, chunk_lines):
+        if len(carry):
+            values = np.concatenate((carry, values))
+        num_rows = len(values) // width
+        carry = values[num_rows*width:]
+        if num_rows:
+            yield values[:num_rows*width].reshape(num_rows, width)
+    if len(carry):
+        raise ValueError('%s: %d values left over for %d outputs'
+                % (file_name, len(carry), width))
+
+def read_rows(file_name, width):
+    '''rows of a result file: hex if it ends with _hex.dat, float text
+    otherwise; golden files start with the number of data'''
+    if file_name.endswith('_hex.dat'):
+        return h_to_f.decode_rows(file_name, width)
+    skip_lines = 1 if os.path.basename(file_name) == 'golden.txt' else 0
+    return read_text_rows(file_name, width, skip_lines)
+
+def aligned_chunks(first, second, rest=None):
+    '''pair up two streams of row blocks into blocks of the same length,
+    up to the end of the shorter stream
+
+    Args:
+        first, second: iterators of row blocks
+        rest: if set, list the rows read but not yielded of each stream are
+            appended to at the end
+
+    Yields:
+        a, b: blocks of the same number of rows
+    '''
+    a = b = None
+    while True:
+        if a is None or not len(a):
+            a = next(first, None)
+        if b is None or not len(b):
+            b = next(second, None)
+        if a is None or b is None:
+            if rest is not None:
+                rest.extend((len(a) if a is not None else 0, len(b) if b is not None else 0))
+            return
+        n = min(len(a), len(b))
+        yield a[:n], b[:n]
+        a = a[n:]
+        b = b[n:]
+
+class ErrorStats:
+    '''one-pass statistics of per-sample errors
+    Data member:
+        count: samples with a finite error
+        nonfinite: samples whose error is NaN or infinite
+        total, max: sum and largest finite error
+        hist: counts per bin, [underflow] + HIST_EDGES bins + [overflow]
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.nonfinite = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hist = np.zeros(len(HIST_EDGES) + 1, dtype=np.int64)
+
+    def add(self, errors):
+        finite = np.isfinite(errors)
+        self.nonfinite += len(errors) - int(np.count_nonzero(finite))
+        errors = errors[finite]
+        if not len(errors):
+            return
+        self.count += len(errors)
+        self.total += float(errors.sum())
+        self.max = max(self.max, float(errors.max()))
+        self.hist += np.bincount(np.searchsorted(HIST_EDGES, errors, side='right'),
+                minlength=len(self.hist))
+
+    def mean(self):
+        return self.total / self.count if self.count else float('nan')
+
+    def percentile(self, q):
+        '''q-th percentile, interpolated in log space within its bin'''
+        if not self.count:
+            return float('nan')
+        rank = q / 100.0 * self.count
+        cumulative = np.cumsum(self.hist)
+        b = int(np.searchsorted(cumulative, rank, side='left'))
+        if b == 0:
+            return HIST_EDGES[0]
+        if b == len(HIST_EDGES):
+            return self.max
+        below = cumulative[b-1]
+        share = (rank - below) / float(self.hist[b]) if self.hist[b] else 0.0
+        lo, hi = np.log10(HIST_EDGES[b-1]), np.log10(HIST_EDGES[b])
+        return min(10.0 ** (lo + share * (hi - lo)), self.max)
+
+def compare_files(result_name, golden_name, benchmark, num_out):
+    '''stream a result file against its golden file
+
+    Returns:
+        stats: ErrorStats of the compared samples
+        num_golden: None, or the number of golden samples if the result
+            covers fewer of them
+    '''
+    stats = ErrorStats()
+    goldens = read_rows(golden_name, num_out)
+    rest = []
+    for outputs, golden in aligned_chunks(read_rows(result_name, num_out), goldens, rest):
+        stats.add(sample_errors(outputs, golden, benchmark))
+    # the golden rows past the result, only counted
+    num_golden = stats.count + stats.nonfinite + rest[1]
+    for golden in goldens:
+        num_golden += len(golden)
+    return stats, (num_golden if num_golden != stats.count + stats.nonfinite else None)
+
+def is_topology(name):
+    return re.match(r'^\d+_\d+_\d+_\d+$', name) is not None
+
+def result_files(root, benchmark):
+    '''(source, topology, result file, golden file) of every result of a
+    benchmark whose files exist'''
+    data_dir = os.path.join(root, benchmark, 'data')
+    train_golden = os.path.join(data_dir, 'train', 'golden.txt')
+    inference_golden = os.path.join(data_dir, 'inference', 'golden.txt')
+    found = []
+    for path in sorted(glob.glob(os.path.join(data_dir, 'train', 'train_result', '*.txt'))):
+        topology = os.path.splitext(os.path.basename(path))[0]
+        if is_topology(topology) and os.path.exists(train_golden):
+            found.append(('tf', topology, path, train_golden))
+    cpu_dir = os.path.join(data_dir, 'inference', 'inference_result', 'cpu')
+    for path in sorted(glob.glob(os.path.join(cpu_dir, '*.txt'))):
+        topology = os.path.splitext(os.path.basename(path))[0]
+        if is_topology(topology) and os.path.exists(inference_golden):
+            found.append(('cpu', topology, path, inference_golden))
+    if not os.path.exists(train_golden):
+        return found
+    for arch in ARCHITECTURES:
+        arch_dir = os.path.join(data_dir, arch)
+        for path in sorted(glob.glob(os.path.join(arch_dir, '*_hex.dat'))):
+            name = os.path.basename(path)[:-len('_hex.dat')]
+            if name.endswith('_golden') and is_topology(name[:-len('_golden')]):
+                found.append(('model', name[:-len('_golden')], path, train_golden))
+            elif is_topology(name):
+                found.append(('npu', name, path, train_golden))
+        legacy = os.path.join(arch_dir, 'output_hex.dat')
+        configs = glob.glob(os.path.join(root, benchmark, 'nn_config', arch, '*_hex.dat'))
+        topologies = [ os.path.basename(c)[:-len('_hex.dat')] for c in configs ]
+        topologies = [ t for t in topologies if is_topology(t) ]
+        if os.path.exists(legacy) and len(topologies) == 1:
+            found.append(('npu', topologies[0], legacy, train_golden))
+    return found
+
+def run_report(root, benchmarks):
+    '''compare every result file of the benchmarks
+
+    Returns:
+        rows: list of dicts of benchmark, source, topology, result, metric,
+            samples, nonfinite, golden_samples (None if every golden
+            sample is compared), mean, max, p<q> per PERCENTILES and the
+            ErrorStats
+    '''
+    rows = []
+    for benchmark in benchmarks:
+        for source, topology, result, golden in result_files(root, benchmark):
+            num_out = parse_topology(topology)[-1]
+            stats, num_golden = compare_files(result, golden, benchmark, num_out)
+            row = {
+                'benchmark': benchmark,
+                'source': source,
+                'topology': topology,
+                'result': result,
+                'metric': 'relative' if benchmark in RELATIVE_ERROR else 'absolute',
+                'samples': stats.count,
+                'nonfinite': stats.nonfinite,
+                'golden_samples': num_golden,
+                'mean': stats.mean(),
+                'max': stats.max,
+                'stats': stats,
+            }
+            for q in PERCENTILES:
+                row['p%d' % q] = stats.percentile(q)
+            rows.append(row)
+    return rows
+
+COLUMNS = (('benchmark', 's'), ('source', 's'), ('topology', 's'), ('metric', 's'),
+        ('samples', 'd'), ('nonfinite', 'd'), ('mean', 'g'), ('max', 'g')) \
+        + tuple(('p%d' % q, 'g') for q in PERCENTILES)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=str, action='append', default=None, help='benchmark (default: all)')
+    parser.add_argument('-r', type=str, default='benchmark', help='directory of the benchmarks')
+    parser.add_argument('-o', type=str, default=None, help='also write the report to this csv file')
+    parser.add_argument('-hist', type=str, default=None, help='write the error histograms to this csv file')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    rows = run_report(args.r, args.b or BENCHMARKS)
+    print('%-10s %-6s %-10s %-8s %8s %9s %10s %10s %10s %10s %10s' % tuple(c for c, _ in COLUMNS))
+    for row in rows:
+        print('%-10s %-6s %-10s %-8s %8d %9d %10.4g %10.4g %10.4g %10.4g %10.4g'
+                % tuple(row[c] for c, _ in COLUMNS))
+        if row['golden_samples'] is not None:
+            print('    %s covers %d of %d golden samples' % (row['result'],
+                row['samples'] + row['nonfinite'], row['golden_samples']))
+    print('%d result files in %.2f sec' % (len(rows), time.time() - start_time))
+    if args.o:
+        with open(args.o, 'w') as report:
+            report.write(','.join(c for c, _ in COLUMNS) + ',result\n')
+            for row in rows:
+                report.write(','.join(('%' + f) % row[c] for c, f in COLUMNS)
+                        + ',' + row['result'] + '\n')
+    if args.hist:
+        with open(args.hist, 'w') as hist:
+            hist.write('benchmark,source,topology,low,high,count\n')
+            lows = np.concatenate(([0.0], HIST_EDGES))
+            highs = np.concatenate((HIST_EDGES, [np.inf]))
+            for row in rows:
+                for low, high, count in zip(lows, highs, row['stats'].hist):
+                    if count:
+                        hist.write('%s,%s,%s,%g,%g,%d\n' % (row['benchmark'],
+                            row['source'], row['topology'], low, high, count))
@@ -0,0 +1,92 @@
+'''
+Description: accuracy against activation unit cycles of the activations in
+activation.py, for one benchmark and topology. every activation is trained
+with train_dnn.run_training; the trained weights are then run through the
+numpy emulator on the testing data, and the weights trained with the fast
+sigmoid are also run with each approximation dropped in without
+retraining. the error change is reported next to the cycles the
+activation unit saves per neuron and per inference, e.g.
+    python act_report.py --benchmark=hotspot --hidden1=4 \
+        --data_dir=hotspot/data/train/ --config_dir=hotspot/nn_config/
+--quantize applies to every trial, so activations and number formats can be
+combined.
+'''
+import shutil
+import tempfile
+import tensorflow as tf
+import activation
+import quant_report
+import train_dnn
+import util
+
+flags = tf.app.flags
+FLAGS = flags.FLAGS
+flags.DEFINE_string('activations', 'fast_sigmoid,pwl,lut,hard_sigmoid',
+        'comma separated activations to compare, the fast sigmoid is always the baseline')
+
+def run_report():
+    data_sets = train_dnn.load_datasets()
+    layers = [ n for n in (data_sets.num_in_neuron, FLAGS.hidden1,
+        FLAGS.hidden2, data_sets.num_out_neuron) if n > 0 ]
+    topology = '%d_%d_%d_%d' % (data_sets.num_in_neuron, FLAGS.hidden1,
+            FLAGS.hidden2, data_sets.num_out_neuron)
+    names = [ a for a in FLAGS.activations.split(',') if a != 'fast_sigmoid' ]
+    names = ['fast_sigmoid'] + names
+    # unknown activations fail before any training
+    for name in names:
+        activation.tf_activation(name)
+
+    config_dir = FLAGS.config_dir
+    act = FLAGS.activation
+    work_dir = tempfile.mkdtemp(prefix='act_')
+    results = {}
+    try:
+        FLAGS.config_dir = work_dir + '/'
+        FLAGS.save_output = False
+        in_frac, out_frac = train_dnn.quantization_frac_bits(data_sets)
+        for name in names:
+            FLAGS.activation = name
+            validation_error, test_error = train_dnn.run_training(data_sets)
+            params = util.load_config(work_dir + '/' + topology + '.txt', layers)
+            results[name] = (test_error, params)
+        baseline_params = results['fast_sigmoid'][1]
+        rows = []
+        for name in names:
+            FLAGS.activation = name
+            test_error, params = results[name]
+            emulated = quant_report.emulated_error(params, data_sets.test,
+                    in_frac, out_frac, FLAGS.quantize)
+            drop_in = quant_report.emulated_error(baseline_params, data_sets.test,
+                    in_frac, out_frac, FLAGS.quantize)
+            count = activation.COUNT_ACT[name]
+            base_count = activation.COUNT_ACT['fast_sigmoid']
+            cycles = activation.act_cycles(layers, name, util.NUM_TOTAL_PE)
+            base_cycles = activation.act_cycles(layers, 'fast_sigmoid', util.NUM_TOTAL_PE)
+            rows.append((name, count, base_count - count, cycles, base_cycles - cycles,
+                activation.max_deviation(name), drop_in, test_error, emulated,
+                test_error - results['fast_sigmoid'][0]))
+    finally:
+        FLAGS.config_dir = config_dir
+        FLAGS.activation = act
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    header = ('activation', 'COUNT_ACT', 'saved/neuron', 'act cycles',
+            'saved/inference', 'max deviation', 'drop-in error', 'test error',
+            'emulated', 'error change')
+    print('%s %s %s, %d PEs' % (FLAGS.benchmark, topology, FLAGS.quantize, util.NUM_TOTAL_PE))
+    print('%-12s %9s %12s %10s %15s %13s %13s %10s %10s %12s' % header)
+    for row in rows:
+        print('%-12s %9d %12d %10d %15d %13.4f %13.4f %10.4f %10.4f %+12.4f' % row)
+    if FLAGS.report_file:
+        with open(FLAGS.report_file, 'w') as report:
+            report.write('benchmark,topology,format,' + ','.join(h.replace(' ', '_').replace('/', '_per_')
+                for h in header) + '\n')
+            for row in rows:
+                report.write('%s,%s,%s,%s,%d,%d,%d,%d,%g,%g,%g,%g,%g\n'
+                        % ((FLAGS.benchmark, topology, FLAGS.quantize) + row))
+
+def main(_):
+    run_report()
+
+if __name__ == '__main__':
+    tf.app.run()
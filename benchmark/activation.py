@@ -0,0 +1,121 @@
+'''
+Description: activation functions of the hidden layers and the cost of
+the activation unit of a PE implementing them. pe.v computes the fast
+sigmoid x / (1 + |x|) with an fp_add then an fp_div, COUNT_ACT =
+COUNT_FP_ADD + COUNT_FP_DIV + 2 counts. the approximations below keep its
+odd symmetry and stay within [-1, 1], so they are drop-in replacements:
+    pwl: piecewise-linear interpolation of the fast sigmoid between knots
+        at powers of two; the segment is selected from the exponent of |x|
+        and computed with one fp_mac
+    lut: table of the fast sigmoid addressed by the fixed-point value of
+        |x|, one block RAM read
+    hard_sigmoid: x * 2**-HARD_SHIFT saturated to [-1, 1], an exponent
+        decrement
+every activation has a TensorFlow version for training (the lut passes the
+gradient of the fast sigmoid through its flat steps) and a numpy version
+for vectorized evaluation.
+'''
+import tensorflow as tf
+import numpy as np
+import util
+
+# pe.v latencies
+COUNT_FP_ADD = 2        # 3 cycles
+COUNT_FP_DIV = 18       # 19 cycles
+COUNT_MA = 3            # FP multiply add; 4 cycles
+COUNT_RAM = 1           # block RAM read; 2 cycles
+COUNT_SHIFT = 0         # exponent decrement and saturation; 1 cycle
+
+# COUNT_ACT of each activation unit, counted as pe.v counts the fast sigmoid
+COUNT_ACT = {
+    'fast_sigmoid': COUNT_FP_ADD + COUNT_FP_DIV + 2,
+    'pwl': COUNT_RAM + COUNT_MA + 2,    # slope and offset read, then fp_mac
+    'lut': COUNT_RAM + 2,
+    'hard_sigmoid': COUNT_SHIFT + 2,
+}
+ACTIVATIONS = ('fast_sigmoid', 'pwl', 'lut', 'hard_sigmoid')
+
+# pwl knots of |x|, the fast sigmoid is held constant past the last one
+PWL_KNOTS = np.array([0.0, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0], dtype=np.float32)
+# lut entries over |x| in [0, LUT_RANGE), each the fast sigmoid at the
+# middle of its interval; LUT_RANGE and LUT_SIZE are powers of two, so the
+# address is a bit slice of |x|
+LUT_SIZE = 64
+LUT_RANGE = 8.0
+HARD_SHIFT = 1
+
+def np_fast_sigmoid(x):
+    return x / (np.float32(1.0) + np.abs(x))
+
+PWL_VALUES = np_fast_sigmoid(PWL_KNOTS)
+LUT_VALUES = np_fast_sigmoid(
+        (np.arange(LUT_SIZE, dtype=np.float32) + 0.5) * np.float32(LUT_RANGE / LUT_SIZE))
+
+def lut_index(abs_x):
+    '''lut address of |x|, the last entry past LUT_RANGE'''
+    return np.minimum(np.floor(abs_x * (LUT_SIZE / LUT_RANGE)), LUT_SIZE - 1)
+
+def np_activation(name):
+    '''numpy version of an activation, [num_rows, n] float32 to float32'''
+    if name == 'fast_sigmoid':
+        return np_fast_sigmoid
+    elif name == 'pwl':
+        return lambda x: (np.sign(x) * np.interp(np.abs(x), PWL_KNOTS,
+            PWL_VALUES)).astype(np.float32)
+    elif name == 'lut':
+        return lambda x: (np.sign(x)
+                * LUT_VALUES[lut_index(np.abs(x)).astype(np.int64)]).astype(np.float32)
+    elif name == 'hard_sigmoid':
+        return lambda x: np.clip(x * np.float32(2.0 ** -HARD_SHIFT), -1.0, 1.0)
+    raise ValueError('unknown activation %s' % name)
+
+def tf_pwl(x):
+    abs_x = tf.abs(x)
+    slopes = np.diff(PWL_VALUES) / np.diff(PWL_KNOTS)
+    # sum of ramps: every knot changes the slope, flat past the last knot
+    y = slopes[0] * abs_x
+    for knot, delta in zip(PWL_KNOTS[1:], np.diff(np.append(slopes, 0.0))):
+        y = tf.add(y, float(delta) * tf.nn.relu(abs_x - float(knot)))
+    return tf.sign(x) * y
+
+def tf_lut(x):
+    abs_x = tf.abs(x)
+    index = tf.minimum(tf.floor(abs_x * (LUT_SIZE / LUT_RANGE)), LUT_SIZE - 1)
+    table = tf.constant(LUT_VALUES)
+    y = tf.sign(x) * tf.gather(table, tf.cast(index, tf.int32))
+    # the steps are flat: train with the gradient of the fast sigmoid
+    smooth = util.fast_sigmoid(x)
+    return smooth + tf.stop_gradient(y - smooth)
+
+def tf_hard_sigmoid(x):
+    return tf.clip_by_value(x * 2.0 ** -HARD_SHIFT, -1.0, 1.0)
+
+def tf_activation(name):
+    '''TensorFlow version of an activation, for util.layer'''
+    if name == 'fast_sigmoid':
+        return util.fast_sigmoid
+    elif name == 'pwl':
+        return tf_pwl
+    elif name == 'lut':
+        return tf_lut
+    elif name == 'hard_sigmoid':
+        return tf_hard_sigmoid
+    raise ValueError('unknown activation %s' % name)
+
+def max_deviation(name, limit=64.0, num_points=1 << 20):
+    '''largest |activation - fast sigmoid| over [-limit, limit]'''
+    x = np.linspace(-limit, limit, num_points).astype(np.float32)
+    return float(np.abs(np_activation(name)(x) - np_fast_sigmoid(x)).max())
+
+def act_cycles(layers, name, num_pe):
+    '''cycles the activation unit takes in one inference
+
+    hidden neurons are computed num_pe at a time, every group of PEs runs
+    the activation once
+
+    Args:
+        layers: layer sizes, e.g. [10, 4, 1]
+        name: one of ACTIVATIONS
+        num_pe: NUM_TOTAL_PE
+    '''
+    return sum((n + num_pe - 1) // num_pe for n in layers[1:-1]) * COUNT_ACT[name]
@@ -0,0 +1,126 @@
+'''
+Description: synchronous data-parallel training over local worker
+processes. the training data are split into one shard per worker; every
+step the chief sends the current weights to the workers, every worker
+computes the gradients of the loss on a batch of its own shard, and the
+chief applies their average with its optimizer, as a parameter server
+would. the workers are forked, so they must be started before the chief
+creates a session, and talk to the chief over pipes.
+'''
+import multiprocessing
+import traceback
+import numpy as np
+import tensorflow as tf
+import util
+
+def worker_main(conn, build, shard, batch_size, config):
+    '''loop of a worker process: weights in, gradients and loss out,
+    until the chief sends None or goes away
+
+    Args:
+        conn: end of the pipe to the chief
+        build: function building the network in the default graph,
+            returning input_pl, golden_pl, loss, variables
+        shard: Dataset the batches are drawn from
+        batch_size: batch size of the worker
+        config: tf.ConfigProto of the session
+    '''
+    try:
+        with tf.Graph().as_default():
+            input_pl, golden_pl, loss, variables = build()
+            gradients = tf.gradients(loss, variables)
+            weight_pls = [ tf.placeholder(v.dtype.base_dtype, v.get_shape())
+                    for v in variables ]
+            set_weights = tf.group(*[ tf.assign(v, pl)
+                for v, pl in zip(variables, weight_pls) ])
+            sess = tf.Session(config=config)
+            sess.run(tf.initialize_all_variables())
+            while True:
+                weights = conn.recv()
+                if weights is None:
+                    break
+                sess.run(set_weights, feed_dict=dict(zip(weight_pls, weights)))
+                feed_dict = util.fill_feed_dict(shard, input_pl, golden_pl, batch_size)
+                conn.send(sess.run(gradients + [loss], feed_dict=feed_dict))
+            sess.close()
+    except EOFError:
+        pass
+    except Exception:
+        conn.send(traceback.format_exc())
+    finally:
+        conn.close()
+
+class Workers:
+    '''worker processes computing gradients on shards of the training data
+    Data member:
+        conns: pipe to every worker
+        processes: the worker processes
+    '''
+
+    def __init__(self, build, shards, batch_size, config=None):
+        '''
+        Args:
+            build: function building the network, see worker_main()
+            shards: Dataset of every worker
+            batch_size: batch size of every worker
+            config: tf.ConfigProto of the worker sessions
+        '''
+        self.conns = []
+        self.processes = []
+        for shard in shards:
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker_main,
+                    args=(worker_conn, build, shard, batch_size, config))
+            process.daemon = True
+            process.start()
+            worker_conn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def __len__(self):
+        return len(self.processes)
+
+    def gradients(self, weights):
+        '''gradients of every worker at the given weights, averaged
+
+        Args:
+            weights: list of numpy arrays, the value of every variable
+
+        Returns:
+            gradients: list of the averaged gradient of every variable
+            loss: loss averaged over the workers
+        '''
+        for conn in self.conns:
+            conn.send(weights)
+        results = [ conn.recv() for conn in self.conns ]
+        for result in results:
+            if isinstance(result, str):
+                raise RuntimeError('data-parallel worker failed:\n' + result)
+        gradients = [ np.mean([ r[k] for r in results ], axis=0)
+                for k in xrange(len(weights)) ]
+        return gradients, float(np.mean([ r[-1] for r in results ]))
+
+    def close(self):
+        '''stop the workers and wait for them'''
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except IOError:
+                pass
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.conns = []
+        self.processes = []
+
+def shards(data_set, num_shards, seed=None):
+    '''one contiguous shard of a Dataset per worker, seeded apart
+
+    Args:
+        data_set: training Dataset
+        num_shards: number of workers
+        seed: seed of the shuffling, None for random ones
+    '''
+    return [ data_set.shard(num_shards, index,
+        None if seed is None else seed + index + 1)
+        for index in xrange(num_shards) ]
@@ -1,22 +1,177 @@
-from random import shuffle
+import os
+import struct
+import hashlib
+import itertools
+import numpy as np
+
+# binary cache written next to each text data file
+CACHE_SUFFIX = '.bincache'
+CACHE_MAGIC = b'NPUDSET1'
+# magic, dtype, number of rows, width, source size, source mtime, source md5
+CACHE_HEADER = struct.Struct('<8s4sQQQd16s')
+CACHE_OFFSET = 64
+CACHE_DTYPES = {b'f4\0\0': np.float32, b'i4\0\0': np.int32}
+
+def file_md5(file_name):
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            md5.update(block)
+    return md5.digest()
+
+def parse_text(file_name, type_data):
+    '''parse a data text file: the number of data, then one data per line
+
+    Args:
+        file_name: text file
+        type_data: float or int
+
+    Returns:
+        data: [num_data, width] float32 or int32 array
+    '''
+    with open(file_name) as f:
+        num_data = int(f.readline())
+        first = f.readline()
+        width = len(first.split())
+        values = np.fromstring(first + f.read(), dtype=np.float64, sep=' ')
+    assert(len(values) == num_data * width)
+    dtype = np.float32 if type_data == float else np.int32
+    return values.astype(dtype).reshape(num_data, width)
+
+def read_cache(file_name, type_data, check_hash):
+    '''memory-map the cache of a text file if it is still valid
+
+    Args:
+        file_name: text file the cache was built from
+        type_data: float or int
+        check_hash: if the mtime changed, accept the cache when the md5
+            of the text file still matches (e.g. after a fresh checkout)
+
+    Returns:
+        data: read-only memmap, None if there is no valid cache
+    '''
+    cache_name = file_name + CACHE_SUFFIX
+    try:
+        with open(cache_name, 'rb') as f:
+            header = f.read(CACHE_HEADER.size)
+    except (IOError, OSError):
+        return None
+    if len(header) != CACHE_HEADER.size:
+        return None
+    magic, dtype_code, num_data, width, src_size, src_mtime, src_md5 = \
+            CACHE_HEADER.unpack(header)
+    if magic != CACHE_MAGIC or CACHE_DTYPES.get(dtype_code) is None:
+        return None
+    dtype = CACHE_DTYPES[dtype_code]
+    if dtype != (np.float32 if type_data == float else np.int32):
+        return None
+    stat = os.stat(file_name)
+    if stat.st_size != src_size:
+        return None
+    if stat.st_mtime != src_mtime:
+        if not check_hash or file_md5(file_name) != src_md5:
+            return None
+    if num_data == 0 or width == 0:
+        return np.zeros((num_data, width), dtype=dtype)
+    return np.memmap(cache_name, dtype=dtype, mode='r',
+            offset=CACHE_OFFSET, shape=(num_data, width))
+
+def write_cache(file_name, data):
+    '''write the binary cache of a text file; silently skipped if the
+    data directory is read-only'''
+    cache_name = file_name + CACHE_SUFFIX
+    tmp_name = cache_name + '.%d.tmp' % os.getpid()
+    dtype_code = b'f4\0\0' if data.dtype == np.float32 else b'i4\0\0'
+    stat = os.stat(file_name)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, dtype_code,
+            data.shape[0], data.shape[1],
+            stat.st_size, stat.st_mtime, file_md5(file_name))
+    try:
+        with open(tmp_name, 'wb') as f:
+            f.write(header.ljust(CACHE_OFFSET, b'\0'))
+            f.write(np.ascontiguousarray(data).tobytes())
+        os.rename(tmp_name, cache_name)
+    except (IOError, OSError):
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+def load_data(file_name, type_data, cache=True, check_hash=False):
+    '''load a data text file, through its binary cache if possible
+
+    Args:
+        file_name: text file: the number of data, then one data per line
+        type_data: float or int
+        cache: whether to read and build the binary cache
+        check_hash: validate a stale-looking cache by content hash
+
+    Returns:
+        data: [num_data, width] float32 or int32 array
+    '''
+    if cache:
+        data = read_cache(file_name, type_data, check_hash)
+        if data is not None:
+            return data
+    data = parse_text(file_name, type_data)
+    if cache:
+        write_cache(file_name, data)
+    return data
+
+
+def as_array(data):
+    '''contiguous 2-D array; float data is kept as float32'''
+    data = np.ascontiguousarray(data)
+    if data.dtype == np.float64:
+        data = data.astype(np.float32)
+    return data
+
+def is_mapped(data):
+    '''whether an array is, or is a view on, a memory-mapped file;
+    np.ascontiguousarray and slicing turn a memmap into plain views'''
+    while data is not None:
+        if isinstance(data, np.memmap):
+            return True
+        data = getattr(data, 'base', None)
+    return False
 
 class Dataset:
     '''individual data sets
     Data member:
-        input_data: 2-dimensional input data
-        golden_data: 2-dimensional corresponding output golden data
+        input_data: 2-dimensional input data, numpy array
+        golden_data: 2-dimensional corresponding output golden data, numpy array
         num_touched: indicates the number of touched data
+        order: permutation the data are served in, None for the stored order
+        keep_partial: whether the last, smaller batch of an epoch is served
+        eval_cache: (chunk_size, chunks) of the last eval_chunks call
     '''
-#    input_data
-#    golden_data
-    num_touched = 0
 
-    def __init__(self, in_data, gold_data):
-        self.input_data = in_data
-        self.golden_data = gold_data
+    def __init__(self, in_data, gold_data, seed=None, keep_partial=False):
+        '''
+        Args:
+            in_data: 2-dimensional input data
+            gold_data: 2-dimensional golden data
+            seed: seed of the shuffling, None for a random one
+            keep_partial: serve the last batch of an epoch even if it is
+                smaller than batch_size (default: drop it)
+        '''
+        self.input_data = as_array(in_data)
+        self.golden_data = as_array(gold_data)
+        assert(len(self.input_data) == len(self.golden_data))
+        self.num_touched = 0
+        self.order = None
+        self.keep_partial = keep_partial
+        self.rng = np.random.RandomState(seed)
+        self.eval_cache = None
+
+    def batch(self, start, end):
+        '''data start:end of the current order; views if not shuffled'''
+        if self.order is None:
+            return self.input_data[start:end], self.golden_data[start:end]
+        indices = self.order[start:end]
+        return self.input_data[indices], self.golden_data[indices]
 
     def next_batch(self, batch_size):
-        '''provides a list of untouched data
+        '''provides a batch of untouched data
+        reshuffles the index permutation once every data has been touched
 
         Args:
             batch_size: the number of untouched data to be returned
@@ -26,18 +181,18 @@ class Dataset:
             gold_frac: the untouched fraction of output golden data with size batch_size
         '''
         num_data = len(self.input_data)
+        start = self.num_touched
         self.num_touched += batch_size
-        if self.num_touched >= num_data:
-            indices_shuffle = range(num_data)
-            shuffle(indices_shuffle)
-            self.input_data = [ self.input_data[i] for i in indices_shuffle ]
-            self.golden_data = [ self.golden_data[i] for i in indices_shuffle ]
+        if self.num_touched > num_data:
+            if self.keep_partial and start < num_data:
+                self.num_touched = num_data
+                return self.batch(start, num_data)
+            self.order = self.rng.permutation(num_data)
+            start = 0
             self.num_touched = batch_size
-        in_frac = self.input_data[self.num_touched-batch_size:self.num_touched]
-        gold_frac = self.golden_data[self.num_touched-batch_size:self.num_touched]
         #debug
         #print self.num_touched
-        return in_frac, gold_frac
+        return self.batch(start, self.num_touched)
 
     def max_steps(self, batch_size):
         '''computes the max steps and the corresponding number of data examples
@@ -50,14 +205,75 @@ class Dataset:
             num_ex: number of examples can be used
         '''
         steps_per_epoch = len(self.input_data) // batch_size
+        if self.keep_partial and len(self.input_data) % batch_size:
+            steps_per_epoch += 1
         #debug
         #print "number of input data"
         #print len(self.input_data)
         #print "max steps"
         #print steps_per_epoch
-        num_ex = steps_per_epoch * batch_size
+        num_ex = min(steps_per_epoch * batch_size, len(self.input_data))
         return num_ex, steps_per_epoch
 
+    def eval_chunks(self, chunk_size):
+        '''the whole data in stored order, in chunks of chunk_size (tail included)
+        the chunks are cached, so repeated evaluation converts nothing.
+        memory-mapped data are copied into memory once, in-memory data are
+        served as views
+
+        Args:
+            chunk_size: max number of examples per chunk
+
+        Returns:
+            chunks: list of (in_chunk, gold_chunk)
+        '''
+        if self.eval_cache is None or self.eval_cache[0] != chunk_size:
+            in_memory = not (is_mapped(self.input_data) or is_mapped(self.golden_data))
+            chunks = []
+            for start in xrange(0, len(self.input_data), chunk_size):
+                in_chunk = self.input_data[start:start+chunk_size]
+                gold_chunk = self.golden_data[start:start+chunk_size]
+                if not in_memory:
+                    in_chunk = np.array(in_chunk)
+                    gold_chunk = np.array(gold_chunk)
+                chunks.append((in_chunk, gold_chunk))
+            self.eval_cache = (chunk_size, chunks)
+        return self.eval_cache[1]
+
+    def subsample(self, num_data, seed=None):
+        '''a Dataset of num_data random examples, in stored order
+
+        Args:
+            num_data: number of examples, the whole data if larger
+            seed: seed of the selection, None for a random one
+
+        Returns:
+            subset: Dataset
+        '''
+        if num_data >= len(self.input_data):
+            return self
+        rows = np.sort(np.random.RandomState(seed).choice(
+            len(self.input_data), num_data, replace=False))
+        return Dataset(self.input_data[rows], self.golden_data[rows],
+                seed, self.keep_partial)
+
+    def shard(self, num_shards, index, seed=None):
+        '''one of num_shards contiguous parts of the data, for a
+        data-parallel worker; memory-mapped data are not copied
+
+        Args:
+            num_shards: number of parts
+            index: which part, 0 to num_shards - 1
+            seed: seed of the shuffling of the part, None for a random one
+
+        Returns:
+            shard: Dataset
+        '''
+        bounds = np.linspace(0, len(self.input_data), num_shards + 1).astype(np.int64)
+        start, end = bounds[index], bounds[index + 1]
+        return Dataset(self.input_data[start:end], self.golden_data[start:end],
+                seed, self.keep_partial)
+
     def reset_touched(self):
         self.num_touched = 0
 '''
@@ -80,13 +296,18 @@ class Datasets:
 #    test
 
     #def __init__(self, data_dir, separate, type_input, type_golden, tile_size, num_maps):
-    def __init__(self, data_dir, separate, type_input, type_golden):
+    def __init__(self, data_dir, separate, type_input, type_golden,
+            cache=True, check_hash=False, seed=None, keep_partial=False):
         '''initialize training, validation, and testing data
         Args:
             data_dir: directory of data
             separate: indicates whether the data are already separated into training, validation, and testing
             type_in: type of input data
             type_gold: type of golden data
+            cache: load through (and build) the binary cache next to each text file
+            check_hash: accept a cache whose text file has a new mtime if its md5 still matches
+            seed: seed of the shuffling, None for a random one
+            keep_partial: serve the last partial batch of every epoch
             #for training hotspot (loading data file)
             tile_size: tile size
             num_maps: number of maps
@@ -106,29 +327,26 @@ class Datasets:
         num_maps_str = str(num_maps)
         '''
 
+        def load(name, type_data):
+            return load_data(data_dir + name, type_data, cache, check_hash)
+
+        # train, validate and test get distinct but reproducible seeds
+        if seed is None:
+            seeds = [None] * 4
+        else:
+            seeds = list(np.random.RandomState(seed).randint(2**31, size=4))
+
         if not separate:
             # import input file
-            inFile = open(data_dir+"input.txt")
-            num_in = int(inFile.readline())
-            self.input_data = [ [type_in(i) for i in inputs.strip().split(' ')]
-                    for inputs in inFile.readlines() ]
-            self.num_in_neuron = len(self.input_data[0])
+            self.input_data = load('input.txt', type_in)
+            num_in = len(self.input_data)
+            self.num_in_neuron = self.input_data.shape[1]
             #debug
             print len(self.input_data)
-            assert(num_in == len(self.input_data))
-            #debug
-            #print "num_in"
-            #print num_in
             # import golden file
-            goldFile = open(data_dir+"golden.txt")
-            num_gold = int(goldFile.readline())
-            golden_data = [ [type_gold(i) for i in goldens.strip().split(' ')]
-                    for goldens in goldFile.readlines() ]
-            self.num_out_neuron = len(golden_data[0])
-            assert(num_gold == len(golden_data))
-            #debug
-            #print "num_gold"
-            #print num_gold
+            golden_data = load('golden.txt', type_gold)
+            num_gold = len(golden_data)
+            self.num_out_neuron = golden_data.shape[1]
             '''
             # shuffle
             assert(num_in == num_gold)
@@ -142,71 +360,371 @@ class Datasets:
             validate_size = int(float(num_in) * 0.2)
             test_offset = train_size + validate_size
             self.train = Dataset(self.input_data[0:train_size],
-                    golden_data[0:train_size])
+                    golden_data[0:train_size], seeds[0], keep_partial)
             self.validate = Dataset(self.input_data[train_size:test_offset],
-                    golden_data[train_size:test_offset])
+                    golden_data[train_size:test_offset], seeds[1], keep_partial)
             self.test = Dataset(self.input_data[test_offset:-1],
-                    golden_data[test_offset:-1])
+                    golden_data[test_offset:-1], seeds[2], keep_partial)
         else:
             ### training data ###
-            # import input file
-            train_inFile = open(data_dir + 'train_input.txt')
-            num_train_in = int(train_inFile.readline())
-            train_in_data = [ [type_in(i) for i in inputs.strip().split(' ') ]
-                    for inputs in train_inFile.readlines() ]
-            self.num_in_neuron = len(train_in_data[0])
-            assert(num_train_in == len(train_in_data))
-            # import golden file
-            train_goldFile = open(data_dir + 'train_golden.txt')
-            num_train_gold = int(train_goldFile.readline())
-            train_gold_data = [ [type_gold(i) for i in goldens.strip().split(' ')]
-                    for goldens in train_goldFile.readlines() ]
-            self.num_out_neuron = len(train_gold_data[0])
-            assert(num_train_gold == len(train_gold_data))
+            train_in_data = load('train_input.txt', type_in)
+            self.num_in_neuron = train_in_data.shape[1]
+            train_gold_data = load('train_golden.txt', type_gold)
+            self.num_out_neuron = train_gold_data.shape[1]
             # shuffle
-            assert(num_train_in == num_train_gold)
-            indices_shuffle = range(num_train_in)
-            shuffle(indices_shuffle)
-            train_in_shuffle = [ train_in_data[i] for i in indices_shuffle ]
-            train_gold_shuffle = [ train_gold_data[i] for i in indices_shuffle ]
+            assert(len(train_in_data) == len(train_gold_data))
+            indices_shuffle = np.random.RandomState(seeds[3]).permutation(
+                    len(train_in_data))
             # initialize training data
-            self.train = Dataset(train_in_shuffle, train_gold_shuffle)
+            self.train = Dataset(train_in_data[indices_shuffle],
+                    train_gold_data[indices_shuffle], seeds[0], keep_partial)
 
             ### validation data ###
-            # import input file
-            validate_inFile = open(data_dir + 'validate_input.txt')
-            num_validate_in = int(validate_inFile.readline())
-            validate_in_data = [ [type_in(i) for i in inputs.strip().split(' ') ]
-                    for inputs in validate_inFile.readlines() ]
-            assert(self.num_in_neuron == len(validate_in_data[0]))
-            assert(num_validate_in == len(validate_in_data))
-            # import golden file
-            validate_goldFile = open(data_dir + 'validate_golden.txt')
-            num_validate_gold = int(validate_goldFile.readline())
-            validate_gold_data = [ [type_gold(i) for i in goldens.strip().split(' ')]
-                    for goldens in validate_goldFile.readlines() ]
-            assert(self.num_out_neuron == len(validate_gold_data[0]))
-            assert(num_validate_gold == len(validate_gold_data))
+            validate_in_data = load('validate_input.txt', type_in)
+            assert(self.num_in_neuron == validate_in_data.shape[1])
+            validate_gold_data = load('validate_golden.txt', type_gold)
+            assert(self.num_out_neuron == validate_gold_data.shape[1])
             # initialize validation data
-            assert(num_validate_in == num_validate_gold)
-            self.validate = Dataset(validate_in_data, validate_gold_data)
+            assert(len(validate_in_data) == len(validate_gold_data))
+            self.validate = Dataset(validate_in_data, validate_gold_data,
+                    seeds[1], keep_partial)
 
             ### testing data ###
-            # import input file
-            test_inFile = open(data_dir + 'test_input.txt')
-            num_test_in = int(test_inFile.readline())
-            test_in_data = [ [type_in(i) for i in inputs.strip().split(' ') ]
-                    for inputs in test_inFile.readlines() ]
-            assert(self.num_in_neuron == len(test_in_data[0]))
-            assert(num_test_in == len(test_in_data))
-            # import golden file
-            test_goldFile = open(data_dir + 'test_golden.txt')
-            num_test_gold = int(test_goldFile.readline())
-            test_gold_data = [ [type_gold(i) for i in goldens.strip().split(' ')]
-                    for goldens in test_goldFile.readlines() ]
-            assert(self.num_out_neuron == len(test_gold_data[0]))
-            assert(num_test_gold == len(test_gold_data))
+            test_in_data = load('test_input.txt', type_in)
+            assert(self.num_in_neuron == test_in_data.shape[1])
+            test_gold_data = load('test_golden.txt', type_gold)
+            assert(self.num_out_neuron == test_gold_data.shape[1])
             # initialize testing data
-            assert(num_test_in == num_test_gold)
-            self.test = Dataset(test_in_data, test_gold_data)
+            assert(len(test_in_data) == len(test_gold_data))
+            self.test = Dataset(test_in_data, test_gold_data,
+                    seeds[2], keep_partial)
+
+# rows read from the data files at a time in streaming mode
+STREAM_CHUNK_ROWS = 65536
+# rows held by the shuffle buffer of a StreamDataset
+SHUFFLE_BUFFER_ROWS = 10000
+# hash buckets of the train/validate/test split: 70/20/10
+SPLIT_BUCKETS = (70, 90, 100)
+SPLIT_SALT = np.uint64(0x9e3779b97f4a7c15)
+
+def read_text_chunks(file_name, type_data, chunk_rows=STREAM_CHUNK_ROWS):
+    '''read a data text file block by block
+
+    Args:
+        file_name: text file: the number of data, then one data per line
+        type_data: float or int
+        chunk_rows: number of lines parsed at a time
+
+    Yields:
+        data: [num_rows, width] float32 or int32 array
+    '''
+    dtype = np.float32 if type_data == float else np.int32
+    with open(file_name) as f:
+        f.readline()
+        width = None
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                break
+            if width is None:
+                width = len(lines[0].split())
+            values = np.fromstring(''.join(lines), dtype=np.float64, sep=' ')
+            yield values.astype(dtype).reshape(-1, width)
+
+def read_chunks(file_name, type_data, chunk_rows=STREAM_CHUNK_ROWS, cache=True):
+    '''read a data file block by block, from its binary cache if it is
+    valid, from the text otherwise; nothing is kept in memory
+
+    Yields:
+        data: [num_rows, width] float32 or int32 array
+    '''
+    data = read_cache(file_name, type_data, False) if cache else None
+    if data is None:
+        for chunk in read_text_chunks(file_name, type_data, chunk_rows):
+            yield chunk
+        return
+    for start in xrange(0, len(data), chunk_rows):
+        yield np.array(data[start:start+chunk_rows])
+
+def mix64(x):
+    '''splitmix64 finalizer of a uint64 array'''
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+def split_of(in_chunk):
+    '''split of every row from a hash of its input values: 0 train,
+    1 validate, 2 test. the split of a row depends on nothing but its
+    values, so it is the same for any file order, chunking or seed, and
+    duplicated rows never end up in two splits'''
+    words = np.ascontiguousarray(in_chunk).view(np.uint32).reshape(len(in_chunk), -1)
+    h = np.full(len(in_chunk), SPLIT_SALT, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for column in words.T:
+            h = mix64(h ^ column.astype(np.uint64))
+    return np.searchsorted(SPLIT_BUCKETS, h % np.uint64(100), side='right')
+
+class StreamDataset:
+    '''a data set read from its files on every pass instead of kept in
+    memory, with the next_batch, max_steps and eval_chunks interface of
+    Dataset. batches are shuffled through a bounded shuffle buffer, so the
+    memory used does not grow with the data
+    Data member:
+        in_name, gold_name: input and golden data files
+        split: 0, 1 or 2 to keep the rows split_of assigns to it, None for
+            every row
+        buffer_rows: rows of the shuffle buffer
+        pending: (in_rows, gold_rows) shuffled but not yet served
+        epoch: generator of the shuffled blocks of the current epoch
+    '''
+
+    def __init__(self, in_name, gold_name, type_in, type_gold, split=None,
+            seed=None, keep_partial=False, buffer_rows=SHUFFLE_BUFFER_ROWS,
+            chunk_rows=STREAM_CHUNK_ROWS, cache=True):
+        self.in_name = in_name
+        self.gold_name = gold_name
+        self.type_in = type_in
+        self.type_gold = type_gold
+        self.split = split
+        self.keep_partial = keep_partial
+        self.buffer_rows = buffer_rows
+        self.chunk_rows = chunk_rows
+        self.cache = cache
+        self.rng = np.random.RandomState(seed)
+        self.num_data = None
+        self.pending = None
+        self.epoch = None
+
+    def chunks(self, chunk_rows=None):
+        '''the rows of the data set in stored order, block by block
+
+        Yields:
+            in_chunk, gold_chunk
+        '''
+        chunk_rows = chunk_rows or self.chunk_rows
+        for in_chunk, gold_chunk in itertools.izip(
+                read_chunks(self.in_name, self.type_in, chunk_rows, self.cache),
+                read_chunks(self.gold_name, self.type_gold, chunk_rows, self.cache)):
+            assert(len(in_chunk) == len(gold_chunk))
+            if self.split is not None:
+                rows = split_of(in_chunk) == self.split
+                in_chunk = in_chunk[rows]
+                gold_chunk = gold_chunk[rows]
+            if len(in_chunk):
+                yield in_chunk, gold_chunk
+
+    def shuffled_blocks(self):
+        '''one epoch through the shuffle buffer: once the buffer overflows,
+        random rows of it are served to bring it back to buffer_rows
+
+        Yields:
+            in_rows, gold_rows
+        '''
+        buf_in = buf_gold = None
+        for in_chunk, gold_chunk in self.chunks():
+            if buf_in is None:
+                buf_in, buf_gold = in_chunk, gold_chunk
+            else:
+                buf_in = np.concatenate((buf_in, in_chunk))
+                buf_gold = np.concatenate((buf_gold, gold_chunk))
+            if len(buf_in) > self.buffer_rows:
+                order = self.rng.permutation(len(buf_in))
+                out, keep = order[self.buffer_rows:], order[:self.buffer_rows]
+                yield buf_in[out], buf_gold[out]
+                buf_in, buf_gold = buf_in[keep], buf_gold[keep]
+        if buf_in is not None:
+            order = self.rng.permutation(len(buf_in))
+            yield buf_in[order], buf_gold[order]
+
+    def next_batch(self, batch_size):
+        '''provides a batch of untouched data
+        a new epoch is started once every data has been served; the last,
+        smaller batch of an epoch is dropped unless keep_partial
+
+        Args:
+            batch_size: the number of untouched data to be returned
+
+        Return:
+            in_frac: input data of the batch
+            gold_frac: golden data of the batch
+        '''
+        if self.epoch is None:
+            self.epoch = self.shuffled_blocks()
+        pending_in, pending_gold = self.pending or (None, None)
+        new_epoch = False
+        while pending_in is None or len(pending_in) < batch_size:
+            try:
+                in_rows, gold_rows = next(self.epoch)
+            except StopIteration:
+                self.epoch = self.shuffled_blocks()
+                if pending_in is not None and len(pending_in) and self.keep_partial:
+                    self.pending = None
+                    return pending_in, pending_gold
+                if new_epoch:
+                    raise ValueError('%s has no data in this split' % self.in_name)
+                new_epoch = True
+                pending_in = pending_gold = None
+                continue
+            if pending_in is None:
+                pending_in, pending_gold = in_rows, gold_rows
+            else:
+                pending_in = np.concatenate((pending_in, in_rows))
+                pending_gold = np.concatenate((pending_gold, gold_rows))
+        self.pending = (pending_in[batch_size:], pending_gold[batch_size:])
+        return pending_in[:batch_size], pending_gold[:batch_size]
+
+    def count(self):
+        '''number of data, counted by one pass over the files'''
+        if self.num_data is None:
+            self.num_data = sum(len(in_chunk) for in_chunk, _ in self.chunks())
+        return self.num_data
+
+    def max_steps(self, batch_size):
+        '''computes the max steps and the corresponding number of data examples
+
+        Args:
+            batch_size: batch size
+
+        Returns:
+            num_ex: number of examples can be used
+            steps_per_epoch: max steps of training/validation/testing
+        '''
+        num_data = self.count()
+        steps_per_epoch = num_data // batch_size
+        if self.keep_partial and num_data % batch_size:
+            steps_per_epoch += 1
+        num_ex = min(steps_per_epoch * batch_size, num_data)
+        return num_ex, steps_per_epoch
+
+    def eval_chunks(self, chunk_size):
+        '''the whole data in stored order, in chunks of at most chunk_size
+
+        Yields:
+            in_chunk, gold_chunk
+        '''
+        for in_chunk, gold_chunk in self.chunks():
+            for start in xrange(0, len(in_chunk), chunk_size):
+                yield (in_chunk[start:start+chunk_size],
+                        gold_chunk[start:start+chunk_size])
+
+    def subsample(self, num_data, seed=None):
+        '''a Dataset of num_data random examples, drawn by reservoir
+        sampling in one pass
+
+        Returns:
+            subset: in-memory Dataset
+        '''
+        rng = np.random.RandomState(seed)
+        res_in = res_gold = None
+        seen = 0
+        for in_chunk, gold_chunk in self.chunks():
+            if res_in is None:
+                res_in = np.empty((num_data,) + in_chunk.shape[1:], dtype=in_chunk.dtype)
+                res_gold = np.empty((num_data,) + gold_chunk.shape[1:], dtype=gold_chunk.dtype)
+            # row i of the stream replaces a random slot with probability num_data / (i + 1)
+            index = seen + np.arange(len(in_chunk))
+            slots = np.where(index < num_data, index,
+                    (rng.random_sample(len(in_chunk)) * (index + 1)).astype(np.int64))
+            take = slots < num_data
+            res_in[slots[take]] = in_chunk[take]
+            res_gold[slots[take]] = gold_chunk[take]
+            seen += len(in_chunk)
+        if res_in is None:
+            raise ValueError('%s has no data in this split' % self.in_name)
+        num_data = min(num_data, seen)
+        return Dataset(res_in[:num_data], res_gold[:num_data], seed, self.keep_partial)
+
+class StreamDatasets:
+    '''training, validation and testing StreamDatasets of a data directory
+
+    Data members:
+        train, validate, test: StreamDataset
+        num_in_neuron: number of input neurons
+        num_out_neuron: number of output neurons
+        all: StreamDataset of every row of input.txt, None if separate
+    '''
+
+    def __init__(self, data_dir, separate, type_input, type_golden,
+            cache=True, seed=None, keep_partial=False,
+            buffer_rows=SHUFFLE_BUFFER_ROWS, chunk_rows=STREAM_CHUNK_ROWS):
+        '''
+        Args:
+            data_dir: directory of data
+            separate: the data are in train_/validate_/test_ files instead
+                of one input.txt and golden.txt split 70/20/10 by split_of
+            type_input, type_golden: float or int
+            cache: read the binary cache of a file when it is valid (it is
+                never built in streaming mode)
+            seed: seed of the shuffling, None for a random one
+            keep_partial: serve the last partial batch of every epoch
+            buffer_rows: rows of the shuffle buffer of the training data
+            chunk_rows: rows read from the files at a time
+        '''
+        type_in = float if type_input == 'float' else int
+        type_gold = float if type_golden == 'float' else int
+        if seed is None:
+            seeds = [None] * 3
+        else:
+            seeds = list(np.random.RandomState(seed).randint(2**31, size=3))
+
+        def stream(prefix, split, seed):
+            return StreamDataset(data_dir + prefix + 'input.txt',
+                    data_dir + prefix + 'golden.txt', type_in, type_gold,
+                    split, seed, keep_partial, buffer_rows, chunk_rows, cache)
+
+        if not separate:
+            self.all = stream('', None, None)
+            self.train = stream('', 0, seeds[0])
+            self.validate = stream('', 1, seeds[1])
+            self.test = stream('', 2, seeds[2])
+        else:
+            self.all = None
+            self.train = stream('train_', None, seeds[0])
+            self.validate = stream('validate_', None, seeds[1])
+            self.test = stream('test_', None, seeds[2])
+        in_chunk, gold_chunk = next(self.train.chunks(1))
+        self.num_in_neuron = in_chunk.shape[1]
+        self.num_out_neuron = gold_chunk.shape[1]
+
+def check_epochs(data_set, batch_size, num_epochs=3):
+    '''assert that every epoch of next_batch serves max_steps batches,
+    none of them empty, covering the examples max_steps counts
+
+    Args:
+        data_set: Dataset or StreamDataset
+        batch_size: batch size
+        num_epochs: number of epochs checked
+    '''
+    num_ex, steps_per_epoch = data_set.max_steps(batch_size)
+    for epoch in xrange(num_epochs):
+        served = 0
+        for step in xrange(steps_per_epoch):
+            in_batch, gold_batch = data_set.next_batch(batch_size)
+            assert 0 < len(in_batch) <= batch_size, \
+                    'epoch %d step %d: batch of %d' % (epoch, step, len(in_batch))
+            assert len(in_batch) == len(gold_batch)
+            served += len(in_batch)
+        assert served == num_ex, 'epoch %d: %d of %d examples' % (epoch, served, num_ex)
 
+if __name__ == '__main__':
+    # check_epochs of both data set classes, with and without the partial
+    # batch, on data that do and do not divide into batches
+    import shutil
+    import tempfile
+    work_dir = tempfile.mkdtemp(prefix='dataset_')
+    try:
+        for num_data in (40, 45):
+            data = np.arange(2 * num_data, dtype=np.float32).reshape(num_data, 2)
+            for name in ('input.txt', 'golden.txt'):
+                with open(os.path.join(work_dir, name), 'w') as f:
+                    f.write('%d\n' % num_data)
+                    np.savetxt(f, data, delimiter=' ')
+            for keep_partial in (False, True):
+                check_epochs(Dataset(data, data, 0, keep_partial), 10)
+                check_epochs(StreamDataset(os.path.join(work_dir, 'input.txt'),
+                    os.path.join(work_dir, 'golden.txt'), float, float, seed=0,
+                    keep_partial=keep_partial, buffer_rows=16, chunk_rows=7,
+                    cache=False), 10)
+        print('next_batch serves max_steps batches per epoch')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
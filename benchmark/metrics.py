@@ -0,0 +1,159 @@
+'''
+Description: training instrumentation. the time spent in every phase
+(dataset load, Dataset.next_batch, fill_feed_dict, the gradients of the
+data-parallel workers, the training op, do_eval, saving) is accumulated
+while a Metrics is active and written with the examples/sec and the peak
+RSS as JSON lines, or as CSV if the file name ends with .csv, e.g.
+    {"event": "step", "step": 100, "time": 0.41, "examples": 10000, ...}
+"step" records cover the interval since the previous record, the final
+"summary" record the whole run. fill_feed_dict includes next_batch.
+when no Metrics is active phase() returns a shared no-op context, so the
+instrumented code pays one function call per phase.
+'''
+import json
+import time
+import resource
+
+PHASES = ('load', 'next_batch', 'fill_feed_dict', 'gradients', 'train_op', 'eval', 'save')
+FIELDS = (('event', 'step', 'time', 'examples', 'examples_per_sec', 'peak_rss_mb')
+        + tuple(p + suffix for p in PHASES for suffix in ('_sec', '_count')))
+
+def peak_rss_mb():
+    '''peak resident set size of the process in MB (ru_maxrss is in KB)'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+class Metrics:
+    '''phase timings of a run and the file they are written to
+    Data member:
+        totals, counts: seconds and number of calls per phase, whole run
+        interval_totals, interval_counts: the same since the last record
+    '''
+
+    def __init__(self, file_name):
+        '''
+        Args:
+            file_name: JSON lines file, or CSV file if it ends with .csv
+        '''
+        self.csv = file_name.endswith('.csv')
+        self.out = open(file_name, 'w')
+        if self.csv:
+            self.out.write(','.join(FIELDS) + '\n')
+        self.start_time = time.time()
+        self.last_time = self.start_time
+        self.last_step = 0
+        self.last_examples = 0
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.interval_totals = dict.fromkeys(PHASES, 0.0)
+        self.interval_counts = dict.fromkeys(PHASES, 0)
+
+    def add(self, name, seconds):
+        self.interval_totals[name] += seconds
+        self.interval_counts[name] += 1
+
+    def write(self, record):
+        if self.csv:
+            self.out.write(','.join(str(record.get(f, '')) for f in FIELDS) + '\n')
+        else:
+            self.out.write(json.dumps(record, sort_keys=True) + '\n')
+        self.out.flush()
+
+    def record(self, step, examples, **fields):
+        '''write a record of the interval since the previous one
+
+        Args:
+            step: training step
+            examples: training examples fed since the start of the run
+            fields: additional fields, JSON lines only, e.g. the loss
+        '''
+        now = time.time()
+        for name in PHASES:
+            self.totals[name] += self.interval_totals[name]
+            self.counts[name] += self.interval_counts[name]
+        record = self.fields('step', step, now - self.last_time,
+                examples - self.last_examples,
+                self.interval_totals, self.interval_counts)
+        record['time'] = now - self.start_time
+        if not self.csv:
+            record.update(fields)
+        self.write(record)
+        self.last_time = now
+        self.last_step = step
+        self.last_examples = examples
+        self.interval_totals = dict.fromkeys(PHASES, 0.0)
+        self.interval_counts = dict.fromkeys(PHASES, 0)
+
+    def fields(self, event, step, duration, examples, totals, counts):
+        record = {
+            'event': event,
+            'step': step,
+            'examples': examples,
+            'examples_per_sec': examples / duration if duration > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        for name in PHASES:
+            record[name + '_sec'] = totals[name]
+            record[name + '_count'] = counts[name]
+        return record
+
+    def close(self):
+        '''write the summary record of the whole run, up to the last
+        record, and close the file'''
+        for name in PHASES:
+            self.totals[name] += self.interval_totals[name]
+            self.counts[name] += self.interval_counts[name]
+        self.interval_totals = dict.fromkeys(PHASES, 0.0)
+        self.interval_counts = dict.fromkeys(PHASES, 0)
+        duration = time.time() - self.start_time
+        record = self.fields('summary', self.last_step, duration, self.last_examples,
+                self.totals, self.counts)
+        record['time'] = duration
+        self.write(record)
+        self.out.close()
+
+class Phase(object):
+    '''times the enclosed code as one call of a phase'''
+    __slots__ = ('metrics', 'name', 'start_time')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.time()
+
+    def __exit__(self, *exc_info):
+        self.metrics.add(self.name, time.time() - self.start_time)
+        return False
+
+class NoPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_PHASE = NoPhase()
+# the Metrics phases are recorded into, None if instrumentation is off
+active = None
+
+def phase(name):
+    '''context timing one call of a phase of the active Metrics'''
+    if active is None:
+        return NO_PHASE
+    return Phase(active, name)
+
+def start(file_name):
+    '''make a new Metrics writing to file_name the active one'''
+    global active
+    active = Metrics(file_name)
+    return active
+
+def stop():
+    '''write the summary of the active Metrics and deactivate it'''
+    global active
+    if active is not None:
+        active.close()
+        active = None
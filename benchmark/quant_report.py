@@ -0,0 +1,87 @@
+'''
+Description: accuracy against memory and data bus traffic of the number
+formats in quantize.py, for one benchmark and topology. every format is
+trained quantization-aware with train_dnn.run_training, then the trained
+weights run through the numpy emulator on the testing data and are scored
+with util.error, e.g.
+    python quant_report.py --benchmark=hotspot --hidden1=4 \
+        --data_dir=hotspot/data/train/ --config_dir=hotspot/nn_config/
+'''
+import shutil
+import tempfile
+import numpy as np
+import tensorflow as tf
+import quantize
+import train_dnn
+import util
+
+flags = tf.app.flags
+FLAGS = flags.FLAGS
+flags.DEFINE_string('formats', 'fp32,fp16,bf16,int16,int8', 'comma separated formats to compare')
+flags.DEFINE_string('report_file', None, 'also write the report to this csv file')
+
+def emulated_error(params, data_set, in_frac, out_frac, fmt):
+    '''util.error of the emulated quantized inference on a dataset'''
+    outputs = quantize.emulate(data_set.input_data, params, fmt, in_frac, out_frac,
+            FLAGS.activation)
+    with tf.Graph().as_default():
+        outputs_pl = tf.placeholder(tf.float32, outputs.shape)
+        golden_pl = tf.placeholder(tf.float32, outputs.shape)
+        error = util.error(outputs_pl, golden_pl, FLAGS.benchmark)
+        sess = tf.Session()
+        total = sess.run(error, feed_dict={outputs_pl: outputs,
+            golden_pl: data_set.golden_data.astype(np.float32)})
+        sess.close()
+    return total / float(len(outputs))
+
+def run_report():
+    data_sets = train_dnn.load_datasets()
+    layers = [ n for n in (data_sets.num_in_neuron, FLAGS.hidden1,
+        FLAGS.hidden2, data_sets.num_out_neuron) if n > 0 ]
+    topology = '%d_%d_%d_%d' % (data_sets.num_in_neuron, FLAGS.hidden1,
+            FLAGS.hidden2, data_sets.num_out_neuron)
+    base = quantize.traffic(layers, 'fp32')
+
+    config_dir = FLAGS.config_dir
+    work_dir = tempfile.mkdtemp(prefix='quant_')
+    rows = []
+    try:
+        FLAGS.config_dir = work_dir + '/'
+        FLAGS.save_output = False
+        for fmt in FLAGS.formats.split(','):
+            FLAGS.quantize = fmt
+            validation_error, test_error = train_dnn.run_training(data_sets)
+            params = util.load_config(work_dir + '/' + topology + '.txt', layers)
+            in_frac, out_frac = train_dnn.quantization_frac_bits(data_sets)
+            emulated = emulated_error(params, data_sets.test, in_frac, out_frac, fmt)
+            t = quantize.traffic(layers, fmt)
+            rows.append((fmt, quantize.bits(fmt), test_error, emulated,
+                t['weight_bits'] / 8.0,
+                float(base['weight_bits']) / t['weight_bits'],
+                t['bus_bits'] / 8.0,
+                float(base['bus_bits']) / t['bus_bits'],
+                float(base['resident_bus_bits']) / t['resident_bus_bits']))
+            if fmt != 'fp32':
+                shutil.copy(work_dir + '/' + topology + '_' + fmt + '_hex.dat', config_dir)
+    finally:
+        FLAGS.config_dir = config_dir
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    header = ('format', 'bits', 'test error', 'emulated', 'weight bytes',
+            'weight reduction', 'bus bytes', 'bus reduction', 'resident bus reduction')
+    print('%s %s' % (FLAGS.benchmark, topology))
+    print('%-6s %4s %10s %10s %12s %16s %9s %13s %22s' % header)
+    for row in rows:
+        print('%-6s %4d %10.4f %10.4f %12.0f %15.2fx %9.0f %12.2fx %21.2fx' % row)
+    if FLAGS.report_file:
+        with open(FLAGS.report_file, 'w') as report:
+            report.write('benchmark,topology,' + ','.join(h.replace(' ', '_') for h in header) + '\n')
+            for row in rows:
+                report.write('%s,%s,%s,%d,%g,%g,%g,%g,%g,%g,%g\n'
+                        % ((FLAGS.benchmark, topology) + row))
+
+def main(_):
+    run_report()
+
+if __name__ == '__main__':
+    tf.app.run()
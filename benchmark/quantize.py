@@ -0,0 +1,194 @@
+'''
+Description: reduced-precision number formats for the NPU datapath.
+fixed-point values use a power-of-two scale per tensor (frac_bits
+fractional bits); floating-point formats round every value to fp16 or
+bf16 (bf16 by truncation, as TensorFlow casts). multiply-adds accumulate
+in a wider register in both cases (int32 or fp32), so only the values
+stored in the weight buffers and sent over the data bus are quantized:
+inputs, weights, biases and the output of every layer.
+fake_quant() applies a format in a TensorFlow graph for
+quantization-aware training, emulate() reproduces the quantized
+inference with numpy.
+'''
+import tensorflow as tf
+import numpy as np
+import activation
+
+# format: (kind, bits)
+FORMATS = {
+    'fp32': ('float', 32),
+    'fp16': ('float', 16),
+    'bf16': ('float', 16),
+    'int16': ('fixed', 16),
+    'int8': ('fixed', 8),
+}
+
+def bits(fmt):
+    return FORMATS[fmt][1]
+
+def is_fixed(fmt):
+    return FORMATS[fmt][0] == 'fixed'
+
+def frac_bits(max_abs, fmt):
+    '''fractional bits of the finest fixed-point scale that holds max_abs
+
+    Returns:
+        frac_bits: int, None for floating-point formats
+    '''
+    if not is_fixed(fmt):
+        return None
+    if max_abs <= 0:
+        return bits(fmt) - 1
+    # max_abs = m * 2**e with 0.5 <= m < 1 needs e integer bits
+    return bits(fmt) - 1 - np.frexp(max_abs)[1]
+
+def quantize(x, fmt, frac=None):
+    '''round a numpy array to a format
+
+    Args:
+        x: array
+        fmt: one of FORMATS
+        frac: fractional bits, fixed-point formats only
+
+    Returns:
+        y: float32 array holding the quantized values
+    '''
+    x = np.asarray(x, dtype=np.float32)
+    if fmt == 'fp32':
+        return x
+    elif fmt == 'fp16':
+        return x.astype(np.float16).astype(np.float32)
+    elif fmt == 'bf16':
+        return (x.view(np.uint32) & np.uint32(0xffff0000)).view(np.float32)
+    scale = 2.0 ** frac
+    limit = 2 ** (bits(fmt) - 1)
+    codes = np.clip(np.round(x.astype(np.float64) * scale), -limit, limit - 1)
+    return (codes / scale).astype(np.float32)
+
+def codes(x, fmt, frac=None):
+    '''raw bit patterns of quantized values, as unsigned integers of bits(fmt) bits'''
+    x = quantize(x, fmt, frac)
+    if fmt == 'fp32':
+        return x.view(np.uint32)
+    elif fmt == 'fp16':
+        return x.astype(np.float16).view(np.uint16)
+    elif fmt == 'bf16':
+        return (x.view(np.uint32) >> 16).astype(np.uint16)
+    words = np.round(x.astype(np.float64) * 2.0 ** frac).astype(np.int64)
+    return (words & ((1 << bits(fmt)) - 1)).astype(np.uint32)
+
+def fake_quant(x, fmt, frac=None):
+    '''quantize a tensor in the forward pass, pass the gradient through
+
+    Args:
+        x: float32 tensor
+        fmt: one of FORMATS
+        frac: fractional bits (int or tensor), fixed-point formats only
+    '''
+    if fmt == 'fp32':
+        return x
+    elif fmt == 'fp16':
+        return tf.cast(tf.cast(x, tf.float16), tf.float32)
+    elif fmt == 'bf16':
+        return tf.cast(tf.cast(x, tf.bfloat16), tf.float32)
+    scale = tf.pow(2.0, tf.cast(frac, tf.float32))
+    limit = float(2 ** (bits(fmt) - 1))
+    y = tf.clip_by_value(tf.round(x * scale), -limit, limit - 1) / scale
+    return x + tf.stop_gradient(y - x)
+
+def tensor_frac_bits(x, fmt):
+    '''frac_bits() of the current values of a tensor, as a tensor'''
+    max_abs = tf.maximum(tf.reduce_max(tf.abs(x)), 1e-30)
+    # exponent of frexp: floor(log2(max_abs)) + 1
+    return bits(fmt) - 2 - tf.floor(tf.log(max_abs) / np.log(2.0))
+
+def weight_quantizer(fmt):
+    '''quantizer util.layer applies to its weights and biases'''
+    if fmt == 'fp32':
+        return None
+    def quantizer(x):
+        if is_fixed(fmt):
+            return fake_quant(x, fmt, tensor_frac_bits(x, fmt))
+        return fake_quant(x, fmt)
+    return quantizer
+
+def emulate(inputs, params, fmt, in_frac=None, out_frac=None,
+        act='fast_sigmoid'):
+    '''quantized inference as the datapath would compute it
+
+    hidden layers use an activation of activation.py, whose outputs lie in
+    [-1, 1]
+
+    Args:
+        inputs: [num_data, num_in] array
+        params: list of (W, b) per layer, unquantized
+        fmt: one of FORMATS
+        in_frac: fractional bits of the inputs, fixed-point formats only
+        out_frac: fractional bits of the outputs, fixed-point formats only
+        act: activation of the hidden layers, one of activation.ACTIVATIONS
+
+    Returns:
+        outputs: [num_data, num_out] float32 array
+    '''
+    act_function = activation.np_activation(act)
+    # the accumulator of the multiply-adds is exact for fixed-point codes
+    acc_type = np.float64 if is_fixed(fmt) else np.float32
+    x = quantize(inputs, fmt, in_frac)
+    for k, (W, b) in enumerate(params):
+        w_frac = frac_bits(np.abs(W).max(), fmt)
+        b_frac = frac_bits(np.abs(b).max(), fmt)
+        acc = (np.dot(x.astype(acc_type), quantize(W, fmt, w_frac).astype(acc_type))
+                + quantize(b, fmt, b_frac))
+        if k < len(params) - 1:
+            acc = act_function(acc.astype(np.float32))
+            x = quantize(acc, fmt, frac_bits(0.999, fmt))
+        else:
+            x = quantize(acc, fmt, out_frac)
+    return x
+
+def traffic(layers, fmt):
+    '''storage and data bus traffic of a topology in a format
+
+    Returns:
+        result: dict of
+            weight_bits: weights and biases
+            bus_bits: data bus traffic of one inference as the testbenches
+                send it (configuration, weights, inputs, outputs)
+            resident_bus_bits: data bus traffic with the weights preloaded
+    '''
+    num_w = sum((n_prev + 1) * n for n_prev, n in zip(layers[:-1], layers[1:]))
+    width = bits(fmt)
+    return {
+        'weight_bits': num_w * width,
+        # configuration words keep their own width
+        'bus_bits': 6 * 32 + (num_w + layers[0] + layers[-1]) * width,
+        'resident_bus_bits': (layers[0] + layers[-1]) * width,
+    }
+
+def save_quantized(params, file_name, fmt):
+    '''save quantized weights and biases in data bus order
+
+    per layer, per neuron: weights then bias, one hex code of bits(fmt)
+    bits per line. for fixed-point formats the first line lists the
+    fractional bits of the weights and of the biases of every layer, e.g.
+        // int8 frac_bits 6 7 5 6
+
+    Args:
+        params: list of (W [n_prev, n], b [n]) per layer, unquantized
+        file_name: file to write
+        fmt: one of FORMATS
+    '''
+    words = []
+    fracs = []
+    for W, b in params:
+        w_frac = frac_bits(np.abs(W).max(), fmt)
+        b_frac = frac_bits(np.abs(b).max(), fmt)
+        fracs += [w_frac, b_frac]
+        neurons = np.hstack((codes(W, fmt, w_frac).T,
+            codes(b, fmt, b_frac).reshape(-1, 1)))
+        words.append(neurons.ravel())
+    header = fmt
+    if is_fixed(fmt):
+        header += ' frac_bits ' + ' '.join(str(f) for f in fracs)
+    np.savetxt(file_name, np.concatenate(words), fmt='%%0%dx' % (bits(fmt) // 4),
+            header=header, comments='// ')
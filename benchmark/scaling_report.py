@@ -0,0 +1,101 @@
+'''
+Description: scaling of synchronous data-parallel training from 1 to
+max_workers local worker processes, for one benchmark and topology. every
+worker count trains with train_dnn.run_training in a fresh process; the
+throughput counts the examples of all workers over the time of the
+training steps (gradients, training op and feeding), and the efficiency
+is the speedup over one worker divided by the number of workers, e.g.
+    python scaling_report.py --benchmark=inversek2j --hidden1=8 \
+        --data_dir=inversek2j/data/train/ --config_dir=inversek2j/nn_config/
+    python scaling_report.py --benchmark=hotspot --hidden1=4 \
+        --data_dir=hotspot/data/train/ --config_dir=hotspot/nn_config/
+every worker feeds batch_size examples per step, so max_steps covers
+more data as workers are added. the weights and gradients go over pipes
+every step, which only pays off with large batches or networks.
+'''
+import os
+import json
+import shutil
+import tempfile
+import multiprocessing
+import tensorflow as tf
+import train_dnn
+
+flags = tf.app.flags
+FLAGS = flags.FLAGS
+flags.DEFINE_integer('max_workers', 0, 'largest number of workers, 0 for one per core')
+flags.DEFINE_string('report_file', None, 'also write the report to this csv file')
+
+TRAIN_PHASES = ('fill_feed_dict', 'gradients', 'train_op')
+
+def worker_counts(max_workers):
+    '''1, 2, 4, ... up to max_workers, max_workers included'''
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    return counts + [max_workers]
+
+def run_trial(data_sets, num_workers, work_dir, queue):
+    '''train with num_workers workers, in a process of its own
+
+    Puts on the queue:
+        validation_error, test_error, examples, seconds of the training steps
+    '''
+    try:
+        FLAGS.workers = num_workers
+        FLAGS.config_dir = work_dir + '/'
+        FLAGS.save_output = False
+        FLAGS.metrics_file = os.path.join(work_dir, 'metrics_%d.jsonl' % num_workers)
+        validation_error, test_error = train_dnn.run_training(data_sets)
+        with open(FLAGS.metrics_file) as metrics_file:
+            summary = json.loads(metrics_file.readlines()[-1])
+        queue.put((validation_error, test_error, summary['examples'],
+            sum(summary[p + '_sec'] for p in TRAIN_PHASES)))
+    except Exception as e:
+        queue.put(e)
+
+def run_report():
+    data_sets = train_dnn.load_datasets()
+    topology = train_dnn.topology_name(data_sets, FLAGS.hidden1, FLAGS.hidden2)
+    work_dir = tempfile.mkdtemp(prefix='scaling_')
+    rows = []
+    try:
+        for num_workers in worker_counts(FLAGS.max_workers or multiprocessing.cpu_count()):
+            # not a Pool: its daemonic processes could not fork the workers
+            queue = multiprocessing.Queue()
+            trial = multiprocessing.Process(target=run_trial,
+                    args=(data_sets, num_workers, work_dir, queue))
+            trial.start()
+            result = queue.get()
+            trial.join()
+            if isinstance(result, Exception):
+                raise result
+            validation_error, test_error, examples, seconds = result
+            throughput = examples / seconds if seconds > 0 else 0.0
+            speedup = throughput / rows[0][1] if rows else 1.0
+            rows.append((num_workers, throughput, speedup, speedup / num_workers,
+                validation_error, test_error))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    header = ('workers', 'examples/sec', 'speedup', 'efficiency',
+            'validation error', 'test error')
+    print('%s %s, %d cores' % (FLAGS.benchmark, topology, multiprocessing.cpu_count()))
+    print('%7s %12s %8s %10s %16s %10s' % header)
+    for row in rows:
+        print('%7d %12.0f %7.2fx %10.2f %16.4f %10.4f' % row)
+    if FLAGS.report_file:
+        with open(FLAGS.report_file, 'w') as report:
+            report.write('benchmark,topology,workers,examples_per_sec,speedup,'
+                    'efficiency,validation_error,test_error\n')
+            for row in rows:
+                report.write('%s,%s,%d,%g,%g,%g,%g,%g\n'
+                        % ((FLAGS.benchmark, topology) + row))
+
+def main(_):
+    run_report()
+
+if __name__ == '__main__':
+    tf.app.run()
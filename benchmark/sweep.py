@@ -0,0 +1,283 @@
+'''
+Description: topology/hyperparameter sweep over train_dnn.run_training.
+trials run in a local process pool that shares the dataset through
+shared memory; poor trials are pruned by successive halving on the
+validation error. every trial is recorded in one sqlite results file,
+e.g.
+    sqlite3 sweep.db "select * from trials order by validation_error"
+'''
+import os
+import sys
+import copy
+import time
+import shutil
+import random
+import sqlite3
+import tempfile
+import itertools
+import multiprocessing
+import multiprocessing.sharedctypes
+import numpy as np
+import tensorflow as tf
+import dataset
+import train_dnn
+
+flags = tf.app.flags
+FLAGS = flags.FLAGS
+flags.DEFINE_string('search', 'grid', 'search strategy: grid or random')
+flags.DEFINE_integer('num_trials', 20, 'number of sampled configurations in random search')
+flags.DEFINE_integer('min_steps', 500, 'training steps of the first successive-halving rung')
+flags.DEFINE_integer('eta', 3, 'successive halving keeps the best 1/eta of each rung')
+flags.DEFINE_integer('num_procs', 0, 'number of worker processes, 0 for one per core')
+flags.DEFINE_string('results_file', 'sweep.db', 'sqlite file the trials are recorded in')
+flags.DEFINE_bool('verbose', False, 'show the output of every trial')
+
+# candidate values per benchmark. hidden layers are limited to 32 neurons
+# (MAX_NEURONS_PER_STAGE in pe.v)
+SEARCH_SPACES = {
+    'fft': {
+        'hidden1': [0, 2, 4, 8, 16],
+        'hidden2': [0, 2, 4, 8],
+        'learning_rate': [0.01, 0.02, 0.05, 0.1],
+    },
+    'hotspot': {
+        'hidden1': [0, 4, 8, 16],
+        'hidden2': [0, 4, 8],
+        'learning_rate': [0.01, 0.02, 0.05, 0.1],
+    },
+    'hotspot_5': {
+        'hidden1': [0, 4, 8, 16],
+        'hidden2': [0, 4, 8],
+        'learning_rate': [0.01, 0.02, 0.05, 0.1],
+    },
+    'inversek2j': {
+        'hidden1': [0, 4, 8, 16, 24],
+        'hidden2': [0, 4, 8, 16, 24],
+        'learning_rate': [0.01, 0.02, 0.05, 0.1],
+    },
+}
+
+# the dataset, in shared memory; set before the pool forks
+DATA_SETS = None
+
+def valid_topology(hidden1, hidden2):
+    return hidden1 > 0 or hidden2 == 0
+
+def grid_configs(space):
+    '''every valid (hidden1, hidden2, learning_rate) of a search space'''
+    return [ (h1, h2, lr) for h1, h2, lr in itertools.product(
+                space['hidden1'], space['hidden2'], space['learning_rate'])
+            if valid_topology(h1, h2) ]
+
+def random_configs(space, num_trials, rng):
+    '''num_trials distinct random configurations of a search space
+    the learning rate is drawn log-uniformly over the range of the space
+    '''
+    lr_min = np.log(min(space['learning_rate']))
+    lr_max = np.log(max(space['learning_rate']))
+    configs = set()
+    for i in xrange(num_trials * 100):
+        if len(configs) == num_trials:
+            break
+        h1 = rng.choice(space['hidden1'])
+        h2 = rng.choice(space['hidden2'])
+        if not valid_topology(h1, h2):
+            continue
+        lr = round(float(np.exp(rng.uniform(lr_min, lr_max))), 5)
+        configs.add((h1, h2, lr))
+    return sorted(configs)
+
+def share_array(data):
+    '''copy an array into shared memory
+
+    Returns:
+        view: numpy view of the shared copy
+    '''
+    typecode = 'f' if data.dtype == np.float32 else 'i'
+    shared = multiprocessing.sharedctypes.RawArray(typecode, data.size)
+    view = np.frombuffer(shared, dtype=data.dtype).reshape(data.shape)
+    view[:] = data
+    return view
+
+def share_datasets(data_sets):
+    '''Datasets whose train/validate/test arrays live in shared memory'''
+    shared = copy.copy(data_sets)
+    for name in ('train', 'validate', 'test'):
+        split = getattr(data_sets, name)
+        setattr(shared, name, dataset.Dataset(
+            share_array(split.input_data), share_array(split.golden_data),
+            keep_partial=split.keep_partial))
+    # only needed to save the trained output, which trials do not do
+    shared.input_data = None
+    return shared
+
+def fresh_datasets(seed):
+    '''per-trial Datasets on the shared arrays, with reset batch state'''
+    data_sets = copy.copy(DATA_SETS)
+    for name in ('train', 'validate', 'test'):
+        split = getattr(DATA_SETS, name)
+        setattr(data_sets, name, dataset.Dataset(
+            split.input_data, split.golden_data, seed, split.keep_partial))
+    return data_sets
+
+def init_worker(verbose):
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+def run_trial(trial):
+    '''train one configuration in a worker process, resuming from the
+    checkpoint a previous rung left in trial_dir
+
+    Args:
+        trial: (trial_id, (hidden1, hidden2, learning_rate), steps, trial_dir)
+
+    Returns:
+        result: dict of the trial configuration, errors and wall time
+    '''
+    trial_id, (hidden1, hidden2, learning_rate), steps, trial_dir = trial
+    FLAGS.hidden1 = hidden1
+    FLAGS.hidden2 = hidden2
+    FLAGS.learning_rate = learning_rate
+    FLAGS.max_steps = steps
+    FLAGS.config_dir = trial_dir + '/'
+    FLAGS.log_dir = trial_dir + '/log/'
+    FLAGS.checkpoint_dir = trial_dir + '/checkpoint/'
+    FLAGS.checkpoint_steps = steps
+    FLAGS.resume = True
+    FLAGS.save_output = False
+    if not os.path.isdir(trial_dir):
+        os.makedirs(trial_dir)
+    start_time = time.time()
+    validation_error, test_error = train_dnn.run_training(
+            fresh_datasets(FLAGS.seed))
+    return {
+        'trial_id': trial_id,
+        'hidden1': hidden1,
+        'hidden2': hidden2,
+        'learning_rate': learning_rate,
+        'steps': steps,
+        'validation_error': float(validation_error),
+        'test_error': float(test_error),
+        'wall_time': time.time() - start_time,
+        'trial_dir': trial_dir,
+    }
+
+def open_results(results_file):
+    db = sqlite3.connect(results_file)
+    db.execute('''create table if not exists trials (
+        sweep text, benchmark text, topology text,
+        hidden1 integer, hidden2 integer, learning_rate real,
+        rung integer, steps integer,
+        validation_error real, test_error real, wall_time real)''')
+    return db
+
+def record(db, sweep_id, topology, rung, result):
+    db.execute('insert into trials values (?,?,?,?,?,?,?,?,?,?,?)',
+            (sweep_id, FLAGS.benchmark, topology,
+                result['hidden1'], result['hidden2'], result['learning_rate'],
+                rung, result['steps'],
+                result['validation_error'], result['test_error'],
+                result['wall_time']))
+    db.commit()
+
+def sort_key(result):
+    error = result['validation_error']
+    return float('inf') if np.isnan(error) else error
+
+def successive_halving(pool, configs, min_steps, max_steps, eta, work_dir, report):
+    '''train every configuration for min_steps, keep the best 1/eta, train
+    those eta times longer, and so on up to max_steps. a promoted
+    configuration resumes from its checkpoint, weights and Adagrad state,
+    so a rung only trains the steps its survivors have not done yet
+
+    Args:
+        pool: worker pool
+        configs: list of (hidden1, hidden2, learning_rate)
+        min_steps: training steps of the first rung
+        max_steps: training steps of the last rung
+        eta: reduction factor
+        work_dir: directory for the per-trial outputs
+        report: called with (rung, result) for every finished trial
+
+    Returns:
+        results: results of the last rung, best first
+    '''
+    # one directory per configuration, kept from rung to rung
+    trial_dirs = dict((config, os.path.join(work_dir, 't%d' % i))
+            for i, config in enumerate(configs))
+    rung = 0
+    steps = min(min_steps, max_steps)
+    while True:
+        final = steps >= max_steps
+        trials = [ ('r%d_t%d' % (rung, i), config, steps, trial_dirs[config])
+                for i, config in enumerate(configs) ]
+        results = pool.map(run_trial, trials, chunksize=1)
+        for result in results:
+            report(rung, result)
+        results.sort(key=sort_key)
+        if final:
+            return results
+        configs = [ (r['hidden1'], r['hidden2'], r['learning_rate'])
+                for r in results[:max(1, len(results) // eta)] ]
+        steps = min(steps * eta, max_steps)
+        if len(configs) == 1:
+            steps = max_steps
+        rung += 1
+
+def run_sweep():
+    '''run the sweep described by the flags'''
+    global DATA_SETS
+    assert(FLAGS.search == 'grid' or FLAGS.search == 'random')
+    space = SEARCH_SPACES[FLAGS.benchmark]
+    if FLAGS.search == 'grid':
+        configs = grid_configs(space)
+    else:
+        configs = random_configs(space, FLAGS.num_trials, random.Random(FLAGS.seed))
+
+    DATA_SETS = share_datasets(train_dnn.load_datasets())
+    num_in = DATA_SETS.num_in_neuron
+    num_out = DATA_SETS.num_out_neuron
+
+    def topology(result):
+        return '%d_%d_%d_%d' % (num_in, result['hidden1'], result['hidden2'], num_out)
+
+    sweep_id = time.strftime('%Y%m%d-%H%M%S')
+    db = open_results(FLAGS.results_file)
+
+    def report(rung, result):
+        record(db, sweep_id, topology(result), rung, result)
+        print('rung %d: %s lr=%g steps=%d validation error=%.4f (%.1f sec)'
+                % (rung, topology(result), result['learning_rate'],
+                    result['steps'], result['validation_error'],
+                    result['wall_time']))
+
+    print('%s sweep over %d configurations' % (FLAGS.search, len(configs)))
+    work_dir = tempfile.mkdtemp(prefix='sweep_')
+    pool = multiprocessing.Pool(FLAGS.num_procs or None,
+            init_worker, (FLAGS.verbose,))
+    try:
+        results = successive_halving(pool, configs,
+                FLAGS.min_steps, FLAGS.max_steps, FLAGS.eta, work_dir, report)
+        # the best trial of each topology keeps the config save_config wrote
+        saved = set()
+        for result in results:
+            name = topology(result)
+            if name in saved:
+                continue
+            saved.add(name)
+            shutil.copy(os.path.join(result['trial_dir'], name + '.txt'),
+                    FLAGS.config_dir)
+            print('saved %s (lr=%g): validation error=%.4f, test error=%.4f'
+                    % (name, result['learning_rate'],
+                        result['validation_error'], result['test_error']))
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        db.close()
+
+def main(_):
+    run_sweep()
+
+if __name__ == '__main__':
+    tf.app.run()
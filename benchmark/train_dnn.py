@@ -4,12 +4,19 @@ Date:     02/02/2017
 Description: train with arbitrary hidden layers
 '''
 import argparse
+import os
 import sys
+import time
 import tensorflow as tf
 import numpy as np
+from tensorflow.python.client import timeline
 import util
+import metrics
+import quantize
+import activation
 # import benchmark and corresponding dataset
 import dataset
+import data_parallel
 #import fft.fft as bm # TODO
 #import inversek2j.inversek2j as bm
 #import hotspot.hotspot as bm
@@ -20,10 +27,14 @@ flags.DEFINE_string('benchmark', 'inversek2j', 'benchmark')
 flags.DEFINE_float('learning_rate', 0.02, 'learning rate')
 flags.DEFINE_integer('batch_size', 100, 'batch size')
 flags.DEFINE_integer('max_steps', 2000, 'max training steps')
+flags.DEFINE_integer('eval_chunk_size', 65536,
+        'max number of examples evaluated per sess.run')
 flags.DEFINE_integer('hidden1',
         0, 'number of neurons in hidden layer 1')
 flags.DEFINE_integer('hidden2',
         0, 'number of layers in hidden layer 2')
+flags.DEFINE_string('topologies',
+        None, 'comma separated i_h1_h2_o topologies trained together in one graph instead of hidden1 and hidden2')
 flags.DEFINE_string('data_dir',
         '/home/cosine/spring2017/cs533/project/benchmark/inversek2j/data/train/', 'data directory')
 flags.DEFINE_string('config_dir',
@@ -36,6 +47,58 @@ flags.DEFINE_bool('separate_file',
         False, 'indicates whether training, validation, testing data are in separate files')
 flags.DEFINE_string('log_dir',
         'log/', 'directory to put the log data')
+flags.DEFINE_bool('data_cache',
+        True, 'load data through a binary cache next to the text files')
+flags.DEFINE_bool('cache_check_hash',
+        False, 'revalidate a cache by content hash when the text file mtime changed')
+flags.DEFINE_integer('seed',
+        None, 'seed for shuffling the data, random if not set')
+flags.DEFINE_bool('keep_partial_batch',
+        False, 'serve the last partial batch of every epoch instead of dropping it')
+flags.DEFINE_bool('stream',
+        False, 'read the data files in chunks on every pass instead of loading them; input.txt is split 70/20/10 by a hash of every input row')
+flags.DEFINE_integer('shuffle_buffer',
+        dataset.SHUFFLE_BUFFER_ROWS, 'rows of the shuffle buffer of the training data in stream mode')
+flags.DEFINE_bool('save_output',
+        True, 'save the trained output on the whole data to data_dir/train_result/')
+flags.DEFINE_bool('resident_data',
+        False, 'upload the training/validation data into the graph once and sample batches in-graph')
+flags.DEFINE_string('quantize',
+        'fp32', 'number format of the datapath: fp32, fp16, bf16, int16 or int8; training is quantization-aware')
+flags.DEFINE_string('activation',
+        'fast_sigmoid', 'activation of the hidden layers: fast_sigmoid, pwl, lut or hard_sigmoid')
+flags.DEFINE_string('memory_arch',
+        None, 'also save per-PE weight memory images to config_dir/<memory_arch>/, e.g. pipelined_vector')
+flags.DEFINE_string('checkpoint_dir',
+        None, 'save checkpoints of the weights and the optimizer state to this directory')
+flags.DEFINE_integer('checkpoint_steps',
+        1000, 'training steps between checkpoints')
+flags.DEFINE_bool('resume',
+        False, 'continue from the latest checkpoint in checkpoint_dir up to max_steps')
+flags.DEFINE_integer('eval_steps',
+        100, 'training steps between validation evaluations')
+flags.DEFINE_float('eval_growth',
+        1.0, 'evaluate again after max(eval_steps, (eval_growth - 1) * step) steps, so evaluations thin out as training goes on')
+flags.DEFINE_integer('eval_subsample',
+        0, 'evaluate on this many random validation examples during training, 0 for all; the final evaluation uses all')
+flags.DEFINE_integer('patience',
+        0, 'stop after this many evaluations without improvement and keep the best weights, 0 to train max_steps')
+flags.DEFINE_float('min_delta',
+        0.0, 'smallest decrease of the validation error counted as an improvement')
+flags.DEFINE_string('metrics_file',
+        None, 'write per-phase timings, examples/sec and peak RSS to this JSON lines file, or CSV if it ends with .csv')
+flags.DEFINE_integer('trace_step',
+        -1, 'trace this training step with RunMetadata into log_dir, -1 for none')
+flags.DEFINE_string('warm_start',
+        None, 'initialize from a smaller trained network: a checkpoint_dir or a save_config file named i_h1_h2_o.txt')
+flags.DEFINE_string('warm_start_tower',
+        None, 'i_h1_h2_o of the network to warm-start from when the warm_start checkpoint holds several topologies')
+flags.DEFINE_integer('workers',
+        1, 'train synchronously on this many local worker processes, each on its shard of the training data with batch_size examples per step; the averaged gradients are applied by the chief')
+flags.DEFINE_integer('intra_op_threads',
+        0, 'threads of a single op of every session, 0 to let TensorFlow pick')
+flags.DEFINE_integer('inter_op_threads',
+        0, 'threads running independent ops of every session, 0 to let TensorFlow pick')
 #for hotspot training
 '''
 flags.DEFINE_string('tile_size',
@@ -44,69 +107,294 @@ flags.DEFINE_string('num_maps',
         2, 'number of maps used')
 '''
 
-if FLAGS.hidden1 == 0:
-    assert(FLAGS.hidden2 == 0)
-    NUM_LAYERS = 2
-elif FLAGS.hidden2 == 0:
-    NUM_LAYERS = 3
-else:
-    NUM_LAYERS = 4
+def get_num_layers(hidden1, hidden2):
+    '''number of layers, input and output layers included'''
+    if hidden1 == 0:
+        assert(hidden2 == 0)
+        return 2
+    elif hidden2 == 0:
+        return 3
+    else:
+        return 4
 
-def run_training():
-    '''train the Neural Network'''
-    # sanity check
-    assert(FLAGS.input_data_type == 'float'
-            or FLAGS.input_data_type == 'int')
-    assert(FLAGS.output_data_type == 'float'
-            or FLAGS.output_data_type == 'int')
-    # import the dataset
-    data_sets = dataset.Datasets(FLAGS.data_dir,
-            FLAGS.separate_file,
-            FLAGS.input_data_type, FLAGS.output_data_type)
-    #for hotspot training
+def load_datasets():
+    '''load the dataset described by the flags'''
+    with metrics.phase('load'):
+        if FLAGS.stream:
+            if FLAGS.resident_data:
+                raise ValueError('resident_data needs the data in memory, not stream')
+            return dataset.StreamDatasets(FLAGS.data_dir,
+                    FLAGS.separate_file,
+                    FLAGS.input_data_type, FLAGS.output_data_type,
+                    FLAGS.data_cache, FLAGS.seed, FLAGS.keep_partial_batch,
+                    FLAGS.shuffle_buffer)
+        return dataset.Datasets(FLAGS.data_dir,
+                FLAGS.separate_file,
+                FLAGS.input_data_type, FLAGS.output_data_type,
+                FLAGS.data_cache, FLAGS.cache_check_hash,
+                FLAGS.seed, FLAGS.keep_partial_batch)
+
+def initial_params(data_sets, hidden1, hidden2):
+    '''initial weights and biases of the layers: grown from FLAGS.warm_start,
+    zeros if not set
+
+    Returns:
+        params: list of (W, b) per layer, or a None per layer
+    '''
+    layers = [ n for n in (data_sets.num_in_neuron, hidden1,
+        hidden2, data_sets.num_out_neuron) if n > 0 ]
+    if not FLAGS.warm_start:
+        return [None] * (len(layers) - 1)
+    print('warm start from %s' % FLAGS.warm_start)
+    return util.grow_params(util.load_params(FLAGS.warm_start, FLAGS.warm_start_tower),
+            layers, FLAGS.seed)
+
+def quantization_frac_bits(data_sets):
+    '''fixed-point fractional bits of the inputs and of the outputs,
+    from the range of the training data; the outputs get one bit of
+    headroom since the trained outputs overshoot the golden range
+
+    Returns:
+        in_frac, out_frac: None for floating-point formats
     '''
-    data_sets = dataset.Datasets(FLAGS.data_dir,
-            FLAGS.separate_file,
-            FLAGS.input_data_type, FLAGS.output_data_type,
-            FLAGS.tile_size, FLAGS.num_maps)
+    if not quantize.is_fixed(FLAGS.quantize):
+        return None, None
+    in_max = gold_max = 0.0
+    for in_chunk, gold_chunk in data_sets.train.eval_chunks(FLAGS.eval_chunk_size):
+        in_max = max(in_max, float(np.nanmax(np.abs(in_chunk))))
+        gold_max = max(gold_max, float(np.nanmax(np.abs(gold_chunk))))
+    return (quantize.frac_bits(in_max, FLAGS.quantize),
+            quantize.frac_bits(2.0 * gold_max, FLAGS.quantize))
+
+def topology_name(data_sets, hidden1, hidden2):
+    '''i_h1_h2_o'''
+    return (str(data_sets.num_in_neuron)+"_"+str(hidden1)+"_"+str(hidden2)
+            +"_"+str(data_sets.num_out_neuron))
+
+def parse_topologies(data_sets):
+    '''FLAGS.topologies as a list of (hidden1, hidden2)'''
+    topologies = []
+    for topology in FLAGS.topologies.split(','):
+        num_in, hidden1, hidden2, num_out = [ int(n) for n in topology.split('_') ]
+        if (num_in != data_sets.num_in_neuron or num_out != data_sets.num_out_neuron
+                or (hidden1 == 0 and hidden2 != 0)):
+            raise ValueError('topology %s does not fit %s' % (topology,
+                topology_name(data_sets, 'h1', 'h2')))
+        topologies.append((hidden1, hidden2))
+    return topologies
+
+def layer_functions(input_pl, in_frac, out_frac):
+    '''datapath of FLAGS.quantize and FLAGS.activation
+
+    Returns:
+        layer_input: the input of the first layer
+        hidden_act, output_act: activations of the hidden and output layers
+        quantizer: weight quantizer of util.layer
     '''
+    quantizer = quantize.weight_quantizer(FLAGS.quantize)
+    act_function = activation.tf_activation(FLAGS.activation)
+    if FLAGS.quantize == 'fp32':
+        return input_pl, act_function, None, quantizer
+    layer_input = quantize.fake_quant(input_pl, FLAGS.quantize, in_frac)
+    hidden_frac = quantize.frac_bits(0.999, FLAGS.quantize)
+    hidden_act = lambda x: quantize.fake_quant(act_function(x),
+            FLAGS.quantize, hidden_frac)
+    output_act = lambda x: quantize.fake_quant(x,
+            FLAGS.quantize, out_frac)
+    return layer_input, hidden_act, output_act, quantizer
 
-    with tf.Graph().as_default():
-        # placeholder
+def start_workers(data_sets, hidden1, hidden2, in_frac, out_frac):
+    '''fork FLAGS.workers processes training the network on shards of the
+    training data, see data_parallel.py'''
+    def build():
         input_pl, golden_pl = util.generate_placeholder(
                 data_sets.num_in_neuron,
                 data_sets.num_out_neuron,
                 FLAGS.batch_size,
                 FLAGS.input_data_type,
-                FLAGS.output_data_type
-                )
-        # build graph
-        if FLAGS.hidden1 == 0:
-            assert(FLAGS.hidden2 == 0)
-            outputs = util.layer('output_layer', input_pl,
-                    data_sets.num_in_neuron, data_sets.num_out_neuron, None)
+                FLAGS.output_data_type)
+        layer_input, hidden_act, output_act, quantizer = layer_functions(
+                input_pl, in_frac, out_frac)
+        outputs = build_network(data_sets, layer_input,
+                hidden1, hidden2, hidden_act, output_act, quantizer)
+        loss = util.loss(outputs, golden_pl, FLAGS.benchmark)
+        return input_pl, golden_pl, loss, \
+                tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)
+    return data_parallel.Workers(build,
+            data_parallel.shards(data_sets.train, FLAGS.workers, FLAGS.seed),
+            FLAGS.batch_size,
+            util.session_config(FLAGS.intra_op_threads, FLAGS.inter_op_threads))
+
+def build_network(data_sets, layer_input, hidden1, hidden2,
+        hidden_act, output_act, quantizer):
+    '''layers of one network
+
+    Returns:
+        outputs: output neurons
+    '''
+    initial = initial_params(data_sets, hidden1, hidden2)
+    if hidden1 == 0:
+        assert(hidden2 == 0)
+        outputs = util.layer('output_layer', layer_input,
+                data_sets.num_in_neuron, data_sets.num_out_neuron,
+                output_act, quantizer, initial[0])
+    else:
+        hidden1_units = util.layer('hidden1', layer_input,
+                data_sets.num_in_neuron, hidden1, hidden_act,
+                quantizer, initial[0])
+        if hidden2 == 0:
+            outputs = util.layer('output_layer', hidden1_units,
+                    hidden1, data_sets.num_out_neuron,
+                    output_act, quantizer, initial[1])
         else:
-            hidden1 = util.layer('hidden1', input_pl,
-                    data_sets.num_in_neuron, FLAGS.hidden1, util.fast_sigmoid)
-            if FLAGS.hidden2 == 0:
-                outputs = util.layer('output_layer', hidden1,
-                        FLAGS.hidden1, data_sets.num_out_neuron, None)
-            else:
-                hidden2 = util.layer('hidden2', hidden1,
-                        FLAGS.hidden1, FLAGS.hidden2, util.fast_sigmoid)
-                outputs = util.layer('output_layer', hidden2,
-                        FLAGS.hidden2, data_sets.num_out_neuron, None)
+            hidden2_units = util.layer('hidden2', hidden1_units,
+                    hidden1, hidden2, hidden_act,
+                    quantizer, initial[1])
+            outputs = util.layer('output_layer', hidden2_units,
+                    hidden2, data_sets.num_out_neuron,
+                    output_act, quantizer, initial[2])
+    return outputs
 
-        # loss
-        #loss = bm.loss(outputs, golden_pl)
-        loss = util.loss(outputs, golden_pl, FLAGS.benchmark)
+def save_network(sess, data_sets, input_pl, network):
+    '''save the weights and biases of a trained network and, if
+    FLAGS.save_output, its outputs on the whole data'''
+    # filename for saving
+    savefile = network['name']+".txt"
+
+    # save weights and biases
+    util.save_config(sess, get_num_layers(network['hidden1'], network['hidden2']),
+            FLAGS.config_dir, savefile, network['scope'])
+    if FLAGS.quantize != 'fp32':
+        values = sess.run(network['variables'])
+        quantize.save_quantized(zip(values[0::2], values[1::2]),
+                FLAGS.config_dir+network['name']+"_"+FLAGS.quantize+"_hex.dat",
+                FLAGS.quantize)
+    if FLAGS.memory_arch:
+        util.save_memory_images(sess,
+                FLAGS.config_dir+FLAGS.memory_arch+"/", network['name'],
+                scope=network['scope'])
+
+    # save trained output
+    #util.save_output(sess, data_sets.train, outputs, FLAGS.data_dir)
+    #need to fetch original input data
+    if FLAGS.save_output and FLAGS.stream:
+        # one chunk of outputs in memory at a time
+        with open(FLAGS.data_dir+"train_result/"+savefile, 'w') as output_file:
+            for in_chunk, _ in data_sets.all.eval_chunks(FLAGS.eval_chunk_size):
+                output_save = sess.run(network['outputs'], feed_dict={input_pl: in_chunk})
+                np.savetxt(output_file, output_save, delimiter=" ")
+    elif FLAGS.save_output:
+        output_save = sess.run(network['outputs'], feed_dict={input_pl: data_sets.input_data})
+        np.savetxt(
+                FLAGS.data_dir+"train_result/"+savefile,
+                output_save, delimiter=" ")
+
+def write_trace(summary_writer, run_metadata, step):
+    '''save the RunMetadata of a traced step for TensorBoard and as
+    log_dir/timeline_step<step>.json for chrome://tracing'''
+    summary_writer.add_run_metadata(run_metadata, 'step%d' % step)
+    trace = timeline.Timeline(run_metadata.step_stats)
+    with open(os.path.join(FLAGS.log_dir, 'timeline_step%d.json' % step), 'w') as trace_file:
+        trace_file.write(trace.generate_chrome_trace_format())
+
+def train_networks(data_sets, topologies, towers):
+    '''train networks side by side in one graph
+    every step feeds the same batch to every network and runs all their
+    training ops in one sess.run; with early stopping a network stops
+    training once it ran out of patience, the others go on. with
+    FLAGS.workers > 1 a single network is trained on the averaged
+    gradients of the worker processes instead
+
+    Args:
+        data_sets: loaded Datasets
+        topologies: list of (hidden1, hidden2)
+        towers: build every network in its own tower_<i_h1_h2_o> name
+            scope; a single network may be built unscoped
+
+    Returns:
+        errors: list of (validation_error, test_error) per network
+    '''
+    # sanity check
+    assert(FLAGS.input_data_type == 'float'
+            or FLAGS.input_data_type == 'int')
+    assert(FLAGS.output_data_type == 'float'
+            or FLAGS.output_data_type == 'int')
+    assert(towers or len(topologies) == 1)
+    if FLAGS.workers > 1 and (towers or FLAGS.resident_data or FLAGS.stream):
+        raise ValueError('workers train one network on in-memory data, '
+                'not with topologies, resident_data or stream')
+
+    # quantization of the values stored and sent over the data bus
+    in_frac, out_frac = quantization_frac_bits(data_sets)
+    # forked before this process builds a graph or a session
+    workers = None
+    if FLAGS.workers > 1:
+        workers = start_workers(data_sets, topologies[0][0], topologies[0][1],
+                in_frac, out_frac)
+    examples_per_step = FLAGS.batch_size * max(FLAGS.workers, 1)
+
+    with tf.Graph().as_default():
+        # placeholder
+        if FLAGS.resident_data:
+            # placeholders default to batches sampled from the resident data
+            input_pl, golden_pl, indices_pl, data_init, data_init_feed = \
+                    util.generate_resident_data(data_sets,
+                            FLAGS.batch_size,
+                            FLAGS.input_data_type,
+                            FLAGS.output_data_type)
+        else:
+            input_pl, golden_pl = util.generate_placeholder(
+                    data_sets.num_in_neuron,
+                    data_sets.num_out_neuron,
+                    FLAGS.batch_size,
+                    FLAGS.input_data_type,
+                    FLAGS.output_data_type
+                    )
+        layer_input, hidden_act, output_act, quantizer = layer_functions(
+                input_pl, in_frac, out_frac)
+
+        global_step = tf.Variable(0, trainable=False, name='global_step')
+        networks = []
+        for hidden1, hidden2 in topologies:
+            name = topology_name(data_sets, hidden1, hidden2)
+            network = {
+                'name': name,
+                'hidden1': hidden1,
+                'hidden2': hidden2,
+                'scope': 'tower_'+name+'/' if towers else None,
+                'label': name+' ' if towers else '',
+            }
+            with tf.name_scope(network['scope']):
+                # build graph
+                outputs = build_network(data_sets, layer_input,
+                        hidden1, hidden2, hidden_act, output_act, quantizer)
+
+                # loss
+                #loss = bm.loss(outputs, golden_pl)
+                loss = util.loss(outputs, golden_pl, FLAGS.benchmark)
 
-        # train
-        #train_op = bm.training(loss, FLAGS.learning_rate)
-        train_op = util.training(loss, FLAGS.learning_rate)
+                variables = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES,
+                        network['scope'])
 
-        # accumulated error for one batch of data
-        error = util.error(outputs, golden_pl, FLAGS.benchmark)
+                # train
+                #train_op = bm.training(loss, FLAGS.learning_rate)
+                if workers is not None:
+                    network['gradient_pls'], train_op = util.gradient_training(
+                            loss, variables, FLAGS.learning_rate)
+                else:
+                    train_op = util.training(loss, FLAGS.learning_rate)
+
+                # accumulated error for one batch of data
+                error = util.error(outputs, golden_pl, FLAGS.benchmark)
+            network.update({
+                'outputs': outputs,
+                'loss': loss,
+                'train_op': train_op,
+                'error': error,
+                'variables': variables,
+            })
+            networks.append(network)
+        increment_step = tf.assign_add(global_step, 1)
 
         # summary - not necessary
         summary = tf.merge_all_summaries()
@@ -114,66 +402,251 @@ def run_training():
         # init
         init = tf.initialize_all_variables()
 
+        # early stopping keeps the best weights and biases in memory
+        if FLAGS.patience:
+            for network in networks:
+                best_pls = [ tf.placeholder(v.dtype.base_dtype, v.get_shape())
+                        for v in network['variables'] ]
+                network['best_pls'] = best_pls
+                network['restore_best'] = tf.group(*[ tf.assign(v, pl)
+                    for v, pl in zip(network['variables'], best_pls) ])
+
+        # checkpoints: weights, Adagrad accumulators and global_step
+        if FLAGS.checkpoint_dir:
+            saver = tf.train.Saver(max_to_keep=2)
+            checkpoint_path = os.path.join(FLAGS.checkpoint_dir, 'model.ckpt')
+            if not os.path.isdir(FLAGS.checkpoint_dir):
+                os.makedirs(FLAGS.checkpoint_dir)
+
         # sess
-        sess = tf.Session()
+        sess = tf.Session(config=util.session_config(FLAGS.intra_op_threads,
+            FLAGS.inter_op_threads))
 
         # summary writer - not necessary
         summary_writer = tf.train.SummaryWriter(FLAGS.log_dir, sess.graph)
 
         # everything built, run init
         sess.run(init)
+        if FLAGS.resident_data:
+            sess.run(data_init, feed_dict=data_init_feed)
+        if FLAGS.resume:
+            assert(FLAGS.checkpoint_dir)
+            checkpoint = tf.train.latest_checkpoint(FLAGS.checkpoint_dir)
+            if checkpoint:
+                saver.restore(sess, checkpoint)
+                print('resumed from %s' % checkpoint)
+            else:
+                print('no checkpoint in %s, starting from scratch'
+                        % FLAGS.checkpoint_dir)
+        start_step = int(sess.run(global_step))
 
         # start training
         #_, max_steps = data_sets.train.max_steps(FLAGS.batch_size)
-        for step in xrange(FLAGS.max_steps):
-            feed_dict = util.fill_feed_dict(data_sets.train,
-                    input_pl, golden_pl,
-                    FLAGS.batch_size)
-            sess.run(train_op, feed_dict=feed_dict)
+        # time spent in training steps only, for steps/sec
+        train_duration = 0.0
+        log_duration = 0.0
+        log_steps = 0
+        eval_set = data_sets.validate
+        if FLAGS.eval_subsample:
+            eval_set = eval_set.subsample(FLAGS.eval_subsample, FLAGS.seed)
+        next_eval = start_step
+        for network in networks:
+            network['best_error'] = float('inf')
+            network['best_step'] = None
+            network['best_values'] = None
+            network['num_bad_evals'] = 0
+        training = list(networks)
+        train_ops = [ network['train_op'] for network in training ] + [increment_step]
+        for step in xrange(start_step, FLAGS.max_steps):
+            start_time = time.time()
+            if FLAGS.resident_data:
+                feed_dict = {}
+            elif workers is not None:
+                network = training[0]
+                with metrics.phase('gradients'):
+                    gradients, _ = workers.gradients(sess.run(network['variables']))
+                feed_dict = dict(zip(network['gradient_pls'], gradients))
+            else:
+                with metrics.phase('fill_feed_dict'):
+                    feed_dict = util.fill_feed_dict(data_sets.train,
+                            input_pl, golden_pl,
+                            FLAGS.batch_size)
+            if step == FLAGS.trace_step:
+                run_metadata = tf.RunMetadata()
+                with metrics.phase('train_op'):
+                    sess.run(train_ops, feed_dict=feed_dict,
+                            options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+                            run_metadata=run_metadata)
+                write_trace(summary_writer, run_metadata, step)
+            else:
+                with metrics.phase('train_op'):
+                    sess.run(train_ops, feed_dict=feed_dict)
+            duration = time.time() - start_time
+            train_duration += duration
+            log_duration += duration
+            log_steps += 1
 
-            # print the loss every 100 steps
+            # print the loss every eval_steps steps
             # write the summary
             # evaluate the model
-            if not step % 100:
-                print('step %d: loss = %.2f' % (step,
-                    sess.run(loss, feed_dict=feed_dict) ))
+            if step == next_eval:
+                next_eval = step + max(FLAGS.eval_steps,
+                        int((FLAGS.eval_growth - 1.0) * step))
+                if workers is not None:
+                    # the loss of a training batch, as without workers
+                    feed_dict = util.fill_feed_dict(data_sets.train,
+                            input_pl, golden_pl, FLAGS.batch_size)
+                values = sess.run([ network['loss'] for network in training ]
+                        + [summary], feed_dict=feed_dict)
+                print('step %d: loss = %s (%.1f steps/sec)' % (step,
+                    ', '.join('%.2f' % v for v in values[:-1]),
+                    log_steps / log_duration))
+                log_duration = 0.0
+                log_steps = 0
 
-                summary_str = sess.run(summary, feed_dict=feed_dict)
-                summary_writer.add_summary(summary_str, step)
+                summary_writer.add_summary(values[-1], step)
                 summary_writer.flush()
                 '''
                 print('training data evaluation')
                 util.do_eval(sess, error,
                         input_pl, golden_pl,
-                        FLAGS.batch_size, data_sets.train)
+                        FLAGS.eval_chunk_size, data_sets.train)
                 '''
-                print('validation data evaluation')
-                util.do_eval(sess, error,
+                for network in list(training):
+                    print(network['label'] + 'validation data evaluation')
+                    with metrics.phase('eval'):
+                        if FLAGS.resident_data and eval_set is data_sets.validate:
+                            eval_error = util.do_eval_resident(sess, network['error'],
+                                    indices_pl, len(data_sets.train.input_data),
+                                    FLAGS.eval_chunk_size, eval_set)
+                        else:
+                            eval_error = util.do_eval(sess, network['error'],
+                                    input_pl, golden_pl,
+                                    FLAGS.eval_chunk_size, eval_set)
+
+                    if FLAGS.patience:
+                        if eval_error < network['best_error'] - FLAGS.min_delta:
+                            network['best_error'] = eval_error
+                            network['best_step'] = step
+                            network['best_values'] = sess.run(network['variables'])
+                            network['num_bad_evals'] = 0
+                        else:
+                            network['num_bad_evals'] += 1
+                        if network['num_bad_evals'] >= FLAGS.patience:
+                            print(network['label'] + 'early stopping at step %d' % step)
+                            training.remove(network)
+                train_ops = [ network['train_op'] for network in training ] + [increment_step]
+                if metrics.active:
+                    metrics.active.record(step + 1,
+                            (step + 1 - start_step) * examples_per_step,
+                            loss=[ float(v) for v in values[:-1] ])
+
+            if FLAGS.checkpoint_dir and not (step + 1) % FLAGS.checkpoint_steps:
+                saver.save(sess, checkpoint_path, global_step=step + 1)
+            if not training:
+                break
+        if workers is not None:
+            workers.close()
+
+        for network in networks:
+            if network['best_values'] is not None:
+                print(network['label'] + 'best validation error %.3f at step %d'
+                        % (network['best_error'], network['best_step']))
+                sess.run(network['restore_best'], feed_dict=dict(zip(
+                    network['best_pls'], network['best_values'])))
+        num_steps = int(sess.run(global_step)) - start_step
+        if FLAGS.checkpoint_dir and num_steps and (start_step + num_steps) % FLAGS.checkpoint_steps:
+            saver.save(sess, checkpoint_path, global_step=start_step + num_steps)
+        if num_steps:
+            print('training: %d steps in %.2f sec (%.1f steps/sec)'
+                    % (num_steps, train_duration,
+                        num_steps / train_duration))
+        if num_steps and workers is not None:
+            print('%d workers: %.0f examples/sec' % (FLAGS.workers,
+                num_steps * examples_per_step / train_duration))
+        if metrics.active:
+            metrics.active.record(start_step + num_steps,
+                    num_steps * examples_per_step)
+
+        errors = []
+        for network in networks:
+            # final accuracy
+            with metrics.phase('eval'):
+                print(network['label'] + 'validation data evaluation')
+                validation_error = util.do_eval(sess, network['error'],
                         input_pl, golden_pl,
-                        FLAGS.batch_size, data_sets.validate)
+                        FLAGS.eval_chunk_size, data_sets.validate)
+                print(network['label'] + 'test data evaluation')
+                test_error = util.do_eval(sess, network['error'],
+                input_pl, golden_pl,
+                FLAGS.eval_chunk_size, data_sets.test)
+            errors.append((validation_error, test_error))
 
-        # final accuracy
-        print('test data evaluation')
-        util.do_eval(sess, error,
-        input_pl, golden_pl,
-        FLAGS.batch_size, data_sets.test)
+            with metrics.phase('save'):
+                save_network(sess, data_sets, input_pl, network)
 
-        # filename for saving
-        savefile = str(data_sets.num_in_neuron)+"_"+str(FLAGS.hidden1)+"_"+str(FLAGS.hidden2)+"_"+str(data_sets.num_out_neuron)+".txt"
+        summary_writer.close()
+        sess.close()
+        return errors
 
-        # save weights and biases
-        util.save_config(sess, NUM_LAYERS, FLAGS.config_dir, savefile)
+def run_training(data_sets=None):
+    '''train the Neural Network
 
-        # save trained output
-        #util.save_output(sess, data_sets.train, outputs, FLAGS.data_dir)
-        #need to fetch original input data
-        output_save = sess.run(outputs, feed_dict={input_pl: data_sets.input_data})
-        np.savetxt(
-                FLAGS.data_dir+"train_result/"+savefile,
-                output_save, delimiter=" ")
+    Args:
+        data_sets: already loaded Datasets, loaded from FLAGS.data_dir if None
+
+    Returns:
+        validation_error: final error on the validation data
+        test_error: final error on the testing data
+    '''
+    if FLAGS.metrics_file:
+        metrics.start(FLAGS.metrics_file)
+    try:
+        # import the dataset
+        if data_sets is None:
+            data_sets = load_datasets()
+        #for hotspot training
+        '''
+        data_sets = dataset.Datasets(FLAGS.data_dir,
+                FLAGS.separate_file,
+                FLAGS.input_data_type, FLAGS.output_data_type,
+                FLAGS.tile_size, FLAGS.num_maps)
+        '''
+        return train_networks(data_sets, [(FLAGS.hidden1, FLAGS.hidden2)], False)[0]
+    finally:
+        metrics.stop()
+
+def run_towers(data_sets=None):
+    '''train every topology of FLAGS.topologies as a tower of one graph,
+    each saved by save_config as config_dir/<i_h1_h2_o>.txt
+
+    Args:
+        data_sets: already loaded Datasets, loaded from FLAGS.data_dir if None
+
+    Returns:
+        results: list of (topology, validation_error, test_error)
+    '''
+    if FLAGS.metrics_file:
+        metrics.start(FLAGS.metrics_file)
+    try:
+        if data_sets is None:
+            data_sets = load_datasets()
+        topologies = parse_topologies(data_sets)
+        errors = train_networks(data_sets, topologies, True)
+    finally:
+        metrics.stop()
+    results = [ (topology_name(data_sets, hidden1, hidden2),) + e
+            for (hidden1, hidden2), e in zip(topologies, errors) ]
+    print('%-16s %16s %10s' % ('topology', 'validation error', 'test error'))
+    for result in results:
+        print('%-16s %16.4f %10.4f' % result)
+    return results
 
 def main(_):
-    run_training()
+    if FLAGS.topologies:
+        run_towers()
+    else:
+        run_training()
 
 if __name__ == '__main__':
     '''
@@ -4,11 +4,17 @@ Date:        02/02/2017
 Description: this file contains utility functions used by any
 feed-forward neural network
 '''
+import os
 import tensorflow as tf
 import numpy as np
+import metrics
+
+# pe.v sizing of the weight buffer (ArrWeights) of every PE
+NUM_TOTAL_PE = 8
+WGT_ARR_LEN = 256
 
 def fast_sigmoid(x):
-    return tf.div(x, (tf.add(1, tf.abs(x))))
+    return tf.div(x, (tf.add(1.0, tf.abs(x))))
 
 def generate_placeholder(num_in, num_out, batch_size, type_in, type_out):
     '''generate placeholder for inputs and golden output
@@ -59,7 +65,8 @@ def fill_feed_dict(data_set, input_pl, golden_pl, batch_size):
     Returns:
         feed_dict: the feed dictionary mapping from placeholders to values
     '''
-    input_feed, golden_feed = data_set.next_batch(batch_size)
+    with metrics.phase('next_batch'):
+        input_feed, golden_feed = data_set.next_batch(batch_size)
     feed_dict = {
         input_pl: input_feed,
         golden_pl: golden_feed
@@ -69,7 +76,62 @@ def fill_feed_dict(data_set, input_pl, golden_pl, batch_size):
     #print len(input_feed)
     return feed_dict
 
-def layer(name, input_units, num_in, num_out, activation_function):
+def generate_resident_data(data_sets, batch_size, type_in, type_out):
+    '''upload the training and validation data into the graph once
+    batches are sampled inside the graph, so a training step needs no feed
+
+    Args:
+        data_sets: Datasets; train and validate are uploaded
+        batch_size: batch size
+        type_in: type of inputs, e.g. float
+        type_out: type of outputs
+
+    Returns:
+        input_pl: input placeholder, defaults to a random training batch
+        golden_pl: golden output placeholder, defaults to the matching golden batch
+        indices_pl: rows of the resident data, defaults to random training rows.
+            the validation data follow the training data
+        data_init: op that uploads the data, run it once after init
+        data_init_feed: feed_dict for data_init
+    '''
+    assert(type_in == "int" or type_in == "float")
+    assert(type_out == "int" or type_out == "float")
+    type_in_tf = tf.float32
+    if type_in == "int":
+        type_in_tf = tf.int32
+    type_out_tf = tf.float32
+    if type_out == "int":
+        type_out_tf = tf.int32
+    input_data = np.concatenate((data_sets.train.input_data,
+        data_sets.validate.input_data))
+    golden_data = np.concatenate((data_sets.train.golden_data,
+        data_sets.validate.golden_data))
+    num_train = len(data_sets.train.input_data)
+    with tf.name_scope('resident_data'):
+        # fed once at initialization, so the data never ends up in the GraphDef
+        input_init = tf.placeholder(type_in_tf, input_data.shape)
+        golden_init = tf.placeholder(type_out_tf, golden_data.shape)
+        # not trainable: save_config reads the trainable variables
+        input_var = tf.Variable(input_init, trainable=False, collections=[],
+                name='input_data')
+        golden_var = tf.Variable(golden_init, trainable=False, collections=[],
+                name='golden_data')
+        indices_pl = tf.placeholder_with_default(
+                tf.random_uniform([batch_size], 0, num_train, dtype=tf.int32),
+                [None])
+        input_pl = tf.placeholder_with_default(
+                tf.gather(input_var, indices_pl), [None, input_data.shape[1]])
+        golden_pl = tf.placeholder_with_default(
+                tf.gather(golden_var, indices_pl), [None, golden_data.shape[1]])
+    data_init = tf.group(input_var.initializer, golden_var.initializer)
+    data_init_feed = {
+        input_init: input_data,
+        golden_init: golden_data
+    }
+    return input_pl, golden_pl, indices_pl, data_init, data_init_feed
+
+def layer(name, input_units, num_in, num_out, activation_function,
+        quantizer=None, initial=None):
     '''calculation within a layer
 
     Args:
@@ -79,16 +141,22 @@ def layer(name, input_units, num_in, num_out, activation_function):
         num_out: number of output neurons(neurons within this layer)
         activation_function: the activation_function applied on outputs,
         None if nothing needs to be done
+        quantizer: applied on weights and biases before use, None if
+        nothing needs to be done
+        initial: (weights, biases) initial values, zeros if None
 
     Returns:
         output_units: output neurons(neurons within this layer)
     '''
     with tf.name_scope(name):
         # TODO: weights and biases initialization can be changed
-        weights = tf.Variable(tf.zeros([num_in, num_out]),
-                name='weights')
-        biases = tf.Variable(tf.zeros([num_out]),
-                name='biases')
+        if initial is None:
+            initial = (tf.zeros([num_in, num_out]), tf.zeros([num_out]))
+        weights = tf.Variable(initial[0], name='weights')
+        biases = tf.Variable(initial[1], name='biases')
+        if quantizer:
+            weights = quantizer(weights)
+            biases = quantizer(biases)
         output_units = tf.matmul(input_units, weights) + biases
         if activation_function:
             output_units = activation_function(output_units)
@@ -96,45 +164,74 @@ def layer(name, input_units, num_in, num_out, activation_function):
 
 def do_eval(sess, error,
         input_pl, golden_pl,
-        batch_size, data_set):
+        chunk_size, data_set):
     '''evaluate and print the accuracy for the given whole dataset
+    the data are evaluated in chunks of chunk_size examples (tail included),
+    one sess.run per chunk
 
     Args:
         sess: the session in which the model has been trained
         error: the error for one batch of data (from benchmark)
         input_pl: input placeholder
         golden_pl: golden output placeholder
-        batch_size: batch size
+        chunk_size: max number of examples evaluated per sess.run
         data_set: the data to be evaluated
+
+    Returns:
+        error_mean: the mean error over every example
     '''
     error_sum = 0
-    data_set.reset_touched()
-    # steps_per_epoch is floor(data_size/batch_size)
-    # num_examples is steps_per_epoch * batch_size
-    num_examples, steps_per_epoch = data_set.max_steps(batch_size)
-    for x in xrange(steps_per_epoch):
-        #debug
-        #print "iteration: %d" %x
-        feed_dict = fill_feed_dict(data_set,
-                input_pl, golden_pl,
-                batch_size)
-        error_sess = sess.run(error, feed_dict=feed_dict)
-        #debug
-        #print "error = %f" %error_sess
-        error_sum = error_sum + error_sess
+    num_examples = 0
+    for input_chunk, golden_chunk in data_set.eval_chunks(chunk_size):
+        error_sum += sess.run(error, feed_dict={
+            input_pl: input_chunk,
+            golden_pl: golden_chunk
+            })
+        num_examples += len(input_chunk)
     error_mean = float(error_sum) / float(num_examples)
     print('Number of examples: %d, Error: %.3f'
             % (num_examples, error_mean))
+    return error_mean
+
+def do_eval_resident(sess, error,
+        indices_pl, offset,
+        chunk_size, data_set):
+    '''evaluate and print the accuracy for a dataset uploaded by
+    generate_resident_data; only row indices are fed
+
+    Args:
+        sess: the session in which the model has been trained
+        error: the error for one batch of data (from benchmark)
+        indices_pl: indices placeholder from generate_resident_data
+        offset: first resident row of data_set
+        chunk_size: max number of examples evaluated per sess.run
+        data_set: the data to be evaluated
 
-def save_config(sess, num_layers, sim_dir, filename):
+    Returns:
+        error_mean: the mean error over every example
+    '''
+    error_sum = 0
+    num_examples = len(data_set.input_data)
+    for start in xrange(offset, offset + num_examples, chunk_size):
+        end = min(start + chunk_size, offset + num_examples)
+        error_sum += sess.run(error,
+                feed_dict={indices_pl: np.arange(start, end)})
+    error_mean = float(error_sum) / float(num_examples)
+    print('Number of examples: %d, Error: %.3f'
+            % (num_examples, error_mean))
+    return error_mean
+
+def save_config(sess, num_layers, sim_dir, filename, scope=None):
     '''save weights and biases for simulation use
 
     Args:
         sess: the session in which the model has been trained
         num_layers: number of layers
         sim_dir: directory to save file
+        scope: name scope of the network, e.g. tower_10_4_0_1/, if the
+            graph holds several
     '''
-    W = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)
+    W = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope)
     #W_test = sess.run(W)
     #print W_test
     if num_layers == 2:
@@ -155,6 +252,183 @@ def save_config(sess, num_layers, sim_dir, filename):
             np.savetxt(fileappend, np.append(W_save_h2, b_save_h2), delimiter=" ")
             np.savetxt(fileappend, np.append(W_save_o, b_save_o), delimiter=" ")
 
+def load_config(file_name, layers):
+    '''weights and biases of a file written by save_config
+
+    Args:
+        file_name: file written by save_config
+        layers: layer sizes, e.g. [10, 4, 1]
+
+    Returns:
+        params: list of (W [num_in, num_out], b [num_out]) float32 per layer
+    '''
+    values = np.loadtxt(file_name, dtype=np.float32, ndmin=1)
+    params = []
+    offset = 0
+    for n_prev, n in zip(layers[:-1], layers[1:]):
+        W = values[offset:offset + n_prev*n].reshape(n_prev, n)
+        b = values[offset + n_prev*n:offset + (n_prev+1)*n]
+        params.append((W, b))
+        offset += (n_prev + 1) * n
+    return params
+
+def load_params(path, tower=None):
+    '''weights and biases of a trained network, to warm-start from
+
+    Args:
+        path: checkpoint directory of a train_dnn run (its latest
+            checkpoint is read), or a file written by save_config and named
+            after its topology, e.g. nn_config/10_4_0_1.txt
+        tower: i_h1_h2_o of the network to read from a checkpoint of
+            towers trained together; may be omitted if it holds one tower
+
+    Returns:
+        params: list of (W [num_in, num_out], b [num_out]) float32 per layer
+    '''
+    if os.path.isdir(path):
+        checkpoint = tf.train.latest_checkpoint(path)
+        if checkpoint is None:
+            raise ValueError('no checkpoint in %s' % path)
+        reader = tf.train.NewCheckpointReader(checkpoint)
+        towers = sorted(set(name.split('/')[0][len('tower_'):]
+            for name in reader.get_variable_to_shape_map()
+            if name.startswith('tower_')))
+        if tower is None and len(towers) == 1 and not reader.has_tensor('output_layer/weights'):
+            tower = towers[0]
+        prefix = 'tower_' + tower + '/' if tower else ''
+        params = [ (reader.get_tensor(prefix + name + '/weights'),
+            reader.get_tensor(prefix + name + '/biases'))
+            for name in ('hidden1', 'hidden2', 'output_layer')
+            if reader.has_tensor(prefix + name + '/weights') ]
+        if not params:
+            raise ValueError('no %snetwork in %s%s' % ('tower ' + tower + ' ' if tower else '',
+                checkpoint, ', its towers are ' + ', '.join(towers) if towers else ''))
+        return params
+    topology = os.path.splitext(os.path.basename(path))[0]
+    layers = [ int(n) for n in topology.split('_') if int(n) > 0 ]
+    return load_config(path, layers)
+
+def grow_params(params, layers, seed=None, scale=0.1):
+    '''initial weights and biases of a topology from a smaller trained network
+
+    hidden layers are matched in order and the output layer with the output
+    layer; a trained layer fills the top-left block of the new one. new
+    neurons get small random weights from the previous layer and zero
+    weights to the next one, so they start without changing the outputs.
+    hidden layers the trained network does not have start as the identity
+    of the previous layer, which keeps the outputs close to the trained
+    ones
+
+    Args:
+        params: list of (W, b) per layer of the trained network
+        layers: layer sizes of the new network, e.g. [10, 4, 4, 1]
+        seed: seed of the random weights of new neurons
+        scale: new neurons weights are uniform in [-scale, scale]
+
+    Returns:
+        params: list of (W [num_in, num_out], b [num_out]) float32 per layer
+    '''
+    old_layers = [ W.shape[0] for W, b in params ] + [ len(params[-1][1]) ]
+    old_hidden = params[:-1]
+    num_hidden = len(layers) - 2
+    if (old_layers[0] != layers[0] or old_layers[-1] != layers[-1]
+            or len(old_hidden) > num_hidden):
+        raise ValueError('cannot grow %s into %s' % ('_'.join(str(n) for n in old_layers),
+            '_'.join(str(n) for n in layers)))
+    rng = np.random.RandomState(seed)
+    grown = []
+    for k in xrange(num_hidden + 1):
+        n_prev, n = layers[k], layers[k+1]
+        W = np.zeros((n_prev, n), dtype=np.float32)
+        b = np.zeros(n, dtype=np.float32)
+        if k < len(old_hidden) or (k == num_hidden and (old_hidden or num_hidden == 0)):
+            # the inserted hidden layers pass the last trained one on to
+            # the output layer
+            old_W, old_b = params[min(k, len(params) - 1)]
+            if old_W.shape[0] > n_prev or old_W.shape[1] > n:
+                raise ValueError('cannot grow %s into %s' % ('_'.join(str(n) for n in old_layers),
+                    '_'.join(str(n) for n in layers)))
+            W[:old_W.shape[0], :old_W.shape[1]] = old_W
+            b[:len(old_b)] = old_b
+            old_n = old_W.shape[1]
+        elif k == num_hidden:
+            # no trained hidden layer feeds the output layer
+            b[:] = params[-1][1]
+            old_n = n
+        elif old_hidden:
+            old_n = min(n_prev, n)
+            W[:old_n, :old_n] = np.eye(old_n)
+        else:
+            old_n = 0
+        W[:, old_n:] = rng.uniform(-scale, scale, (n_prev, n - old_n))
+        grown.append((W, b))
+    return grown
+
+def pe_memory_images(params, num_pe=NUM_TOTAL_PE, wgt_arr_len=WGT_ARR_LEN):
+    '''order weights and biases the way the PEs load them
+
+    neuron j of every layer is loaded into PE j % num_pe; each PE stores its
+    neurons layer by layer, every neuron as its weights then its bias
+
+    Args:
+        params: list of (W [num_in, num_out], b [num_out]) per layer
+        num_pe: NUM_TOTAL_PE
+        wgt_arr_len: WGT_ARR_LEN, words of ArrWeights per PE
+
+    Returns:
+        images: [num_pe, wgt_arr_len] float32 ArrWeights contents, zero padded
+        stream: float32 words in the order they are sent over the data bus
+    '''
+    images = [ [] for i in xrange(num_pe) ]
+    stream = []
+    for W, b in params:
+        neurons = np.hstack((np.transpose(W), np.reshape(b, (-1, 1))))
+        for j in xrange(neurons.shape[0]):
+            images[j % num_pe].append(neurons[j])
+            stream.append(neurons[j])
+    padded = np.zeros((num_pe, wgt_arr_len), dtype=np.float32)
+    for i, image in enumerate(images):
+        if not image:
+            continue
+        words = np.concatenate(image)
+        if len(words) > wgt_arr_len:
+            raise ValueError('PE %d needs %d weights, WGT_ARR_LEN is %d'
+                    % (i, len(words), wgt_arr_len))
+        padded[i, :len(words)] = words
+    return padded, np.concatenate(stream).astype(np.float32)
+
+def save_memory_images(sess, sim_dir, topology,
+        num_pe=NUM_TOTAL_PE, wgt_arr_len=WGT_ARR_LEN, scope=None):
+    '''save weights and biases as hardware memory images
+
+    writes, without a text round trip:
+        <topology>_pe_hex.dat: the words in the per-neuron data bus order
+            of PE_LOAD, one hex word per line; not <topology>_hex.dat,
+            which f_to_h.py converts from the tf order of save_config
+        <topology>_pe<i>.mem: ArrWeights of PE i for $readmemh
+        <topology>_pe.bin: ArrWeights of every PE, [num_pe, wgt_arr_len]
+            big-endian float32
+
+    Args:
+        sess: the session in which the model has been trained
+        sim_dir: directory to save the files, e.g. nn_config/pipelined_vector/
+        topology: i_h1_h2_o
+        num_pe: NUM_TOTAL_PE
+        wgt_arr_len: WGT_ARR_LEN
+        scope: name scope of the network, see save_config
+    '''
+    values = sess.run(tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope))
+    params = zip(values[0::2], values[1::2])
+    images, stream = pe_memory_images(params, num_pe, wgt_arr_len)
+    if not os.path.isdir(sim_dir):
+        os.makedirs(sim_dir)
+    np.savetxt(sim_dir+topology+"_pe_hex.dat", stream.view(np.uint32), fmt="%08x")
+    for i in xrange(num_pe):
+        np.savetxt(sim_dir+topology+"_pe"+str(i)+".mem",
+                images[i].view(np.uint32), fmt="%08x",
+                header="PE %d of %s" % (i, topology), comments="// ")
+    images.astype('>f4').tofile(sim_dir+topology+"_pe.bin")
+
 
 def save_output(sess, inputs, outputs, data_dir):
     '''save trained output
@@ -189,7 +463,7 @@ def loss(outputs, goldens, benchmark):
     else:
         return tf.reduce_mean(tf.abs(tf.sub(outputs, goldens)))
 
-def training(loss, learning_rate):
+def training(loss, learning_rate, global_step=None):
     '''sets up the traing ops
     creates a summarizer to track the loss over time in TensorBoard
     creates an optimizer
@@ -197,6 +471,7 @@ def training(loss, learning_rate):
     Args:
         loss: loss tensor, from loss()
         learning_rate: learning rate
+        global_step: variable incremented by every training step, if set
 
     Return:
         train_op: the op that must be passed to the 'sess.run()'
@@ -207,9 +482,37 @@ def training(loss, learning_rate):
     # TODO: optimizer can be modified
     optimizer = tf.train.AdagradOptimizer(learning_rate)
     # op
-    train_op = optimizer.minimize(loss)
+    train_op = optimizer.minimize(loss, global_step=global_step)
     return train_op
 
+def gradient_training(loss, variables, learning_rate, global_step=None):
+    '''sets up the training ops applying gradients computed elsewhere,
+    e.g. averaged over data-parallel workers, with the optimizer of
+    training()
+
+    Args:
+        loss: loss tensor, only summarized
+        variables: the variables the gradients are of
+        learning_rate: learning rate
+        global_step: variable incremented by every training step, if set
+
+    Return:
+        gradient_pls: placeholders of the gradients, one per variable
+        train_op: the op applying the fed gradients
+    '''
+    tf.summary.scalar('loss', loss)
+    optimizer = tf.train.AdagradOptimizer(learning_rate)
+    gradient_pls = [ tf.placeholder(v.dtype.base_dtype, v.get_shape())
+            for v in variables ]
+    train_op = optimizer.apply_gradients(zip(gradient_pls, variables),
+            global_step=global_step)
+    return gradient_pls, train_op
+
+def session_config(intra_op_threads=0, inter_op_threads=0):
+    '''session configuration, 0 threads to let TensorFlow pick'''
+    return tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+            inter_op_parallelism_threads=inter_op_threads)
+
 # benchmark-dependent error function
 def error(outputs, goldens, benchmark):
     '''accumulate the error within one batch of data
@@ -0,0 +1,173 @@
+'''
+Description: CPU baseline of the NPU benchmarks. a weight file of
+nn_config/ and the topology of its config.txt (number of layers, then the
+neurons of the input, hidden 1, hidden 2 and output layers) are run in
+numpy, without TensorFlow, over an input file: blocks of lines are parsed,
+inferred and formatted by a pool of processes, and the outputs are
+streamed in order to data/inference/inference_result/cpu/<topology>.txt,
+one data per line as train_dnn.py writes train_result/, e.g.
+    python cpu_inference.py -b hotspot_5
+    python cpu_inference.py -b hotspot -t 10_4_0_1 -i benchmark/hotspot/data/train/input.txt
+the hidden layers use the fast sigmoid x / (1 + |x|) of the trained
+networks; -exact computes every neuron in the PE order of golden_model.py
+instead of with a matrix product.
+'''
+import argparse
+import os
+import sys
+import time
+import itertools
+import multiprocessing
+from cStringIO import StringIO
+import numpy as np
+import golden_model
+from pipelined_vector_model import parse_topology, default_act
+
+# number of input lines per job
+CHUNK_ROWS = 16384
+
+def read_config(file_name):
+    '''layer sizes of a config.txt, e.g. [26, 1]'''
+    with open(file_name) as f:
+        values = [ int(line) for line in f if line.strip() ]
+    if len(values) != 5:
+        raise ValueError('%s: expected 5 values, got %d' % (file_name, len(values)))
+    num_layers = values[0]
+    layers = [ n for n in values[1:] if n > 0 ]
+    if len(layers) != num_layers or values[2] == 0 and values[3] != 0:
+        raise ValueError('%s: %d layers do not match the neurons %s'
+                % (file_name, num_layers, values[1:]))
+    return layers
+
+def infer(x, params, act):
+    '''run a batch through the network with one matrix product per layer
+
+    Args:
+        x: [num_rows, num_in] float32 inputs
+        params: golden_model.load_weights() of the network
+        act: activation bitmask, see golden_model.infer()
+
+    Returns:
+        y: [num_rows, num_out] float32 outputs
+    '''
+    num_hidden = len(params) - 1
+    for k, (W, b) in enumerate(params):
+        bit = 2 if k == num_hidden else k
+        x = np.dot(x, W)
+        x += b
+        if (act >> bit) & 1:
+            x = golden_model.fast_sigmoid(x)
+    return x
+
+# network of the worker processes, set by init_worker
+worker_net = None
+
+def init_worker(params, act, exact):
+    global worker_net
+    worker_net = (params, act, exact)
+
+def run_block(text):
+    '''parse, infer and format one block of input lines in a worker
+
+    Returns:
+        num_rows: number of data in the block
+        out_text: the outputs, one data per line
+    '''
+    params, act, exact = worker_net
+    num_in = params[0][0].shape[0]
+    values = np.fromstring(text, dtype=np.float64, sep=' ').astype(np.float32)
+    if len(values) % num_in:
+        raise ValueError('%d values in a block of %d input neurons' % (len(values), num_in))
+    x = values.reshape(-1, num_in)
+    if exact:
+        y = golden_model.infer(x, params, act)
+    else:
+        y = infer(x, params, act)
+    out = StringIO()
+    np.savetxt(out, y, delimiter=" ")
+    return len(x), out.getvalue()
+
+def read_blocks(file_name, chunk_rows=CHUNK_ROWS):
+    '''the lines of an input file after the number of data, chunk_rows at a time'''
+    with open(file_name) as f:
+        f.readline()
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                break
+            yield ''.join(lines)
+
+def run(in_name, params, act, out_name, num_procs=None, exact=False,
+        chunk_rows=CHUNK_ROWS):
+    '''run a whole input file through the network
+
+    Args:
+        in_name: input text file whose first line is the number of data
+        params: golden_model.load_weights() of the network
+        act: activation bitmask
+        out_name: output text file, one data per line
+        num_procs: number of worker processes, None for one per core
+        exact: compute in the PE order of golden_model.py
+        chunk_rows: number of lines per job
+
+    Returns:
+        num_data: number of data run
+        seconds: wall time, reading and writing included
+    '''
+    start_time = time.time()
+    num_data = 0
+    with open(out_name, 'w') as out_file:
+        if num_procs == 1:
+            init_worker(params, act, exact)
+            results = itertools.imap(run_block, read_blocks(in_name, chunk_rows))
+            for num_rows, out_text in results:
+                out_file.write(out_text)
+                num_data += num_rows
+        else:
+            pool = multiprocessing.Pool(num_procs, init_worker, (params, act, exact))
+            try:
+                # imap keeps the order and the lines of a few blocks in memory
+                for num_rows, out_text in pool.imap(run_block,
+                        read_blocks(in_name, chunk_rows)):
+                    out_file.write(out_text)
+                    num_data += num_rows
+            finally:
+                pool.close()
+                pool.join()
+    return num_data, time.time() - start_time
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=str, help='benchmark')
+    parser.add_argument('-t', type=str, default=None, help='topology: i_h1_h2_o (default: from nn_config/config.txt)')
+    parser.add_argument('-config', type=str, default=None, help='config.txt (default: nn_config/config.txt)')
+    parser.add_argument('-w', type=str, default=None, help='weight file (default: nn_config/<t>.txt)')
+    parser.add_argument('-l', type=str, default='tf', help='weight layout: tf (save_config files) or neuron')
+    parser.add_argument('-i', type=str, default=None, help='input file (default: data/inference/input.txt)')
+    parser.add_argument('-o', type=str, default=None, help='output file (default: data/inference/inference_result/cpu/<t>.txt)')
+    parser.add_argument('-act', type=int, default=None, help='activation bitmask (default: hidden layers)')
+    parser.add_argument('-j', type=int, default=None, help='number of processes (default: one per core)')
+    parser.add_argument('-c', type=int, default=CHUNK_ROWS, help='number of lines per job')
+    parser.add_argument('-exact', action='store_true', help='compute every neuron in the PE order of golden_model.py')
+    args = parser.parse_args()
+
+    benchmark_dir = "benchmark/"+args.b+"/"
+    if args.t:
+        layers = parse_topology(args.t)
+    else:
+        layers = read_config(args.config or benchmark_dir+"nn_config/config.txt")
+    topology = '_'.join(str(n) for n in (layers[:1] + (layers[1:-1] + [0, 0])[:2] + layers[-1:]))
+    act = default_act(layers) if args.act is None else args.act
+    w_name = args.w or benchmark_dir+"nn_config/"+topology+".txt"
+    in_name = args.i or benchmark_dir+"data/inference/input.txt"
+    out_name = args.o or benchmark_dir+"data/inference/inference_result/cpu/"+topology+".txt"
+    if not os.path.exists(in_name):
+        sys.exit('%s does not exist, pass the input file with -i' % in_name)
+    if os.path.dirname(out_name) and not os.path.isdir(os.path.dirname(out_name)):
+        os.makedirs(os.path.dirname(out_name))
+
+    params = golden_model.load_weights(w_name, layers, args.l)
+    num_data, seconds = run(in_name, params, act, out_name, args.j, args.exact, args.c)
+    print('%s %s: %d data in %.3f sec, %.0f samples/sec, %d processes -> %s'
+            % (args.b, topology, num_data, seconds, num_data / seconds if seconds > 0 else 0.0,
+                args.j or multiprocessing.cpu_count(), out_name))
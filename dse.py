@@ -0,0 +1,266 @@
+'''
+Description: analytic design-space exploration over the three NPU variants.
+for every benchmark topology in benchmark/*/nn_config/ and every
+(NUM_TOTAL_PE, MAX_NEURONS_PER_STAGE, MAX_NUM_STAGES), the cycles per inference, the
+buffer sizes pe.v derives from the parameters (WGT_ARR_LEN,
+ARR_WGT_IND_SIZE, IN_BUF_LEN, OUT_BUF_LEN) and the PE utilization are
+computed for each architecture:
+    vector: one multiply-add per PE every CYCLES_MA+1 cycles
+    pipelined_vector: one multiply-add per PE per cycle; inputs are
+        broadcast to every PE
+    systolic: one multiply-add per PE per cycle; inputs circulate in a ring
+        of NUM_TOTAL_PE PEs, so every neuron takes a multiple of
+        NUM_TOTAL_PE multiply-adds and stores as many weights
+the pipelined_vector cycle counts agree with pipelined_vector_model.py.
+the Pareto front of throughput against PEs and on-chip memory is reported
+per topology, and topologies overflowing the current parameters are
+flagged. points with a hazard, a layer the controller never finishes,
+are kept out of the front and marked in the csv.
+'''
+import argparse
+import os
+import re
+import glob
+from pipelined_vector_model import PE_PARAMS, NPU_PARAMS, CLOCK_MHZ, count_act, default_act
+
+ARCHITECTURES = ('vector', 'pipelined_vector', 'systolic')
+
+# ARR_WGT_IND_SIZE of the RTL, for every architecture
+CURRENT_ARR_WGT_IND_SIZE = 12
+
+def ceil_div(a, b):
+    return (a + b - 1) // b
+
+def index_bits(length):
+    '''number of bits needed to index length words'''
+    return max(1, (length - 1).bit_length())
+
+def buffer_sizes(num_pe, max_neurons, max_stages):
+    '''buffer lengths in words per PE, derived as in pe.v
+
+    Returns:
+        sizes: dict of WGT_ARR_LEN, ARR_WGT_IND_SIZE, IN_BUF_LEN, OUT_BUF_LEN
+            and the total words of all the PEs
+    '''
+    wgt_arr_len = max_neurons * max_neurons * (max_stages - 1) // num_pe
+    in_buf_len = max_neurons
+    out_buf_len = max_neurons // num_pe
+    return {
+        'WGT_ARR_LEN': wgt_arr_len,
+        'ARR_WGT_IND_SIZE': index_bits(wgt_arr_len),
+        'IN_BUF_LEN': in_buf_len,
+        'OUT_BUF_LEN': out_buf_len,
+        'words': num_pe * (wgt_arr_len + in_buf_len + out_buf_len),
+    }
+
+def neuron_macs(arch, n_prev, num_pe):
+    '''multiply-adds one neuron of a layer takes, without the bias'''
+    if arch == 'systolic':
+        return ceil_div(n_prev, num_pe) * num_pe
+    return n_prev
+
+def weight_words(arch, layers, num_pe):
+    '''weight and bias words of the busiest PE; neuron j goes to PE j % NUM_TOTAL_PE'''
+    return sum(ceil_div(n, num_pe) * (neuron_macs(arch, n_prev, num_pe) + 1)
+            for n_prev, n in zip(layers[:-1], layers[1:]))
+
+def compute_cycles(arch, layers, act, num_pe, cycles_ma, cycles_act):
+    '''cycles from the last input word until the outputs can be read (NUM_CALC)
+
+    Args:
+        arch: vector, pipelined_vector or systolic
+        layers: layer sizes
+        act: activation bitmask
+        num_pe: NUM_TOTAL_PE
+        cycles_ma: multiply-add latency - 1 (CYCLES_MA)
+        cycles_act: activation latency - 1 (CYCLES_ACT)
+
+    Returns:
+        num_calc: cycles, the multiply-adds of the first layer overlap
+            with the input words
+    '''
+    num_hidden = len(layers) - 2
+    mac = cycles_ma + 1 if arch == 'vector' else 1
+    cycles = 0
+    for k in range(1, len(layers)):
+        bit = 2 if k == num_hidden + 1 else k - 1
+        act_cycles = cycles_act + 1 if (act >> bit) & 1 else 1
+        per_neuron = (neuron_macs(arch, layers[k-1], num_pe) * mac
+                + cycles_ma + 1 + act_cycles)
+        cycles += ceil_div(layers[k], num_pe) * per_neuron
+    if arch == 'systolic':
+        # the first NUM_TOTAL_PE inputs are loaded before the first layer
+        return cycles - layers[0] + num_pe
+    return cycles - layers[0]
+
+def evaluate(arch, layers, act, num_pe, max_neurons, max_stages=PE_PARAMS['MAX_NUM_STAGES'],
+        cycles_ma=NPU_PARAMS['CYCLES_MA'], cycles_act=NPU_PARAMS['CYCLES_ACT'],
+        clock_mhz=CLOCK_MHZ):
+    '''model one architecture with one set of parameters on one topology
+
+    Returns:
+        point: dict of the parameters, the buffer sizes, num_calc, load
+            (configuration and weight words), latency (cycles per
+            inference with the weights reloaded as the testbenches do),
+            samples_per_sec (weights kept loaded), utilization (share of
+            PE-cycles doing a useful multiply-add while computing),
+            overflows (sizes the parameters cannot hold) and hazards
+            (layers the RTL controller does not finish)
+    '''
+    sizes = buffer_sizes(num_pe, max_neurons, max_stages)
+    num_calc = compute_cycles(arch, layers, act, num_pe, cycles_ma, cycles_act)
+    load = 7 + sum(n * (neuron_macs(arch, n_prev, num_pe) + 1)
+            for n_prev, n in zip(layers[:-1], layers[1:]))
+    resident = layers[0] + 1 + num_calc + layers[-1]
+    macs = sum(n * (n_prev + 1) for n_prev, n in zip(layers[:-1], layers[1:]))
+
+    overflows = []
+    if len(layers) > max_stages:
+        overflows.append('%d stages > MAX_NUM_STAGES=%d' % (len(layers), max_stages))
+    if max(layers) > max_neurons:
+        overflows.append('%d neurons > MAX_NEURONS_PER_STAGE=%d' % (max(layers), max_neurons))
+    words = weight_words(arch, layers, num_pe)
+    if words > sizes['WGT_ARR_LEN']:
+        overflows.append('%d weights per PE > WGT_ARR_LEN=%d' % (words, sizes['WGT_ARR_LEN']))
+    outputs = ceil_div(max(layers[1:]), num_pe)
+    if outputs > sizes['OUT_BUF_LEN']:
+        overflows.append('%d outputs per PE > OUT_BUF_LEN=%d' % (outputs, sizes['OUT_BUF_LEN']))
+    if index_bits(words) > CURRENT_ARR_WGT_IND_SIZE:
+        overflows.append('%d weights per PE need ARR_WGT_IND_SIZE=%d'
+                % (words, index_bits(words)))
+
+    # state_count only advances when PE 0 finishes an activation, so the
+    # controller never leaves a layer needing several iterations without one
+    hazards = []
+    num_hidden = len(layers) - 2
+    for k in range(1, len(layers)):
+        bit = 2 if k == num_hidden + 1 else k - 1
+        if ceil_div(layers[k], num_pe) > 1 and not (act >> bit) & 1:
+            hazards.append('layer %d: %d neurons over %d PEs without activation never finishes'
+                    % (k, layers[k], num_pe))
+
+    point = {
+        'arch': arch,
+        'NUM_TOTAL_PE': num_pe,
+        'MAX_NEURONS_PER_STAGE': max_neurons,
+        'MAX_NUM_STAGES': max_stages,
+        'num_calc': num_calc,
+        'load': load,
+        'latency': load + resident,
+        'samples_per_sec': clock_mhz * 1e6 / resident,
+        'utilization': float(macs) / (num_pe * (num_calc + layers[0])),
+        'overflows': overflows,
+        'hazards': hazards,
+    }
+    point.update(sizes)
+    return point
+
+def pareto_front(points):
+    '''points without hazards no other one beats on throughput, PEs and
+    memory words'''
+    points = [ p for p in points if not p['hazards'] ]
+    def dominates(a, b):
+        better_eq = (a['samples_per_sec'] >= b['samples_per_sec']
+                and a['NUM_TOTAL_PE'] <= b['NUM_TOTAL_PE'] and a['words'] <= b['words'])
+        better = (a['samples_per_sec'] > b['samples_per_sec']
+                or a['NUM_TOTAL_PE'] < b['NUM_TOTAL_PE'] or a['words'] < b['words'])
+        return better_eq and better
+    front = [ p for p in points if not any(dominates(q, p) for q in points) ]
+    return sorted(front, key=lambda p: (p['NUM_TOTAL_PE'], p['words'], -p['samples_per_sec']))
+
+def benchmark_topologies(root='benchmark'):
+    '''(benchmark, i_h1_h2_o) of every topology in benchmark/*/nn_config/'''
+    found = set()
+    for path in glob.glob(os.path.join(root, '*', 'nn_config', '*.txt')):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if re.match(r'^\d+_\d+_\d+_\d+$', name):
+            found.add((path.split(os.sep)[-3], name))
+    return sorted(found)
+
+def sweep(layers, act, pe_counts, max_neurons_list, max_stages_list=None, **kwargs):
+    '''evaluate() every architecture and every valid parameter set
+
+    Returns:
+        points: the points whose parameters hold the topology
+        overflows: the parameters the points left out overflow, e.g.
+            MAX_NUM_STAGES
+    '''
+    points = []
+    overflows = set()
+    for arch in ARCHITECTURES:
+        for num_pe in pe_counts:
+            for max_neurons in max_neurons_list:
+                if num_pe > max_neurons or max_neurons % num_pe:
+                    continue
+                for max_stages in max_stages_list or [PE_PARAMS['MAX_NUM_STAGES']]:
+                    point = evaluate(arch, layers, act, num_pe, max_neurons,
+                            max_stages, **kwargs)
+                    if point['overflows']:
+                        for overflow in point['overflows']:
+                            overflows.update(re.findall(r'([A-Z_]+)=', overflow))
+                    else:
+                        points.append(point)
+    return points, overflows
+
+def int_list(text):
+    return [ int(v) for v in text.split(',') ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('topologies', nargs='*', help='i_h1_h2_o (default: every topology in benchmark/*/nn_config)')
+    parser.add_argument('-p', type=int_list, default=[1, 2, 4, 8, 16, 32], help='NUM_TOTAL_PE values, comma separated')
+    parser.add_argument('-m', type=int_list, default=[8, 16, 32, 64], help='MAX_NEURONS_PER_STAGE values, comma separated')
+    parser.add_argument('-s', type=int_list, default=[PE_PARAMS['MAX_NUM_STAGES'], 4], help='MAX_NUM_STAGES values, comma separated')
+    parser.add_argument('-act', type=int, default=None, help='activation bitmask (default: hidden layers)')
+    parser.add_argument('-match_pe', action='store_true', help='use the PE COUNT_ACT as the activation latency')
+    parser.add_argument('-o', type=str, default=None, help='write every point to this csv file')
+    args = parser.parse_args()
+
+    cycles_act = count_act(PE_PARAMS) if args.match_pe else NPU_PARAMS['CYCLES_ACT']
+    if args.topologies:
+        topologies = [ ('-', t) for t in args.topologies ]
+    else:
+        topologies = benchmark_topologies()
+
+    csv = open(args.o, 'w') if args.o else None
+    if csv:
+        csv.write('benchmark,topology,arch,NUM_TOTAL_PE,MAX_NEURONS_PER_STAGE,'
+                'MAX_NUM_STAGES,WGT_ARR_LEN,ARR_WGT_IND_SIZE,words,num_calc,latency,'
+                'samples_per_sec,utilization,hazards\n')
+    for benchmark, topology in topologies:
+        layers = [ int(n) for n in topology.split('_') if int(n) > 0 ]
+        act = default_act(layers) if args.act is None else args.act
+        print('%s %s' % (benchmark, topology))
+        for arch in ARCHITECTURES:
+            current = evaluate(arch, layers, act, PE_PARAMS['NUM_TOTAL_PE'],
+                    PE_PARAMS['MAX_NEURONS_PER_STAGE'], PE_PARAMS['MAX_NUM_STAGES'],
+                    cycles_act=cycles_act)
+            for overflow in current['overflows']:
+                print('    overflow (%s, current parameters): %s' % (arch, overflow))
+            for hazard in current['hazards']:
+                print('    hazard (%s, current parameters): %s' % (arch, hazard))
+        points, overflows = sweep(layers, act, args.p, args.m, args.s, cycles_act=cycles_act)
+        if csv:
+            for p in points:
+                csv.write('%s,%s,%s,%d,%d,%d,%d,%d,%d,%d,%d,%.1f,%.4f,%s\n' % (benchmark,
+                    topology, p['arch'], p['NUM_TOTAL_PE'], p['MAX_NEURONS_PER_STAGE'],
+                    p['MAX_NUM_STAGES'], p['WGT_ARR_LEN'], p['ARR_WGT_IND_SIZE'], p['words'],
+                    p['num_calc'], p['latency'], p['samples_per_sec'], p['utilization'],
+                    '; '.join(p['hazards'])))
+        front = pareto_front(points)
+        if not points:
+            print('    no parameters in the sweep hold this topology, it overflows %s'
+                    % ', '.join(sorted(overflows)))
+            continue
+        if not front:
+            print('    every parameter set of the sweep that holds this topology has a hazard')
+            continue
+        print('    %-17s %4s %4s %4s %7s %4s %7s %6s %12s %6s' % ('pareto front', 'PE',
+            'MAX', 'STG', 'WGT_ARR', 'IND', 'words', 'calc', 'samples/sec', 'util'))
+        for p in front:
+            print('    %-17s %4d %4d %4d %7d %4d %7d %6d %12.0f %5.1f%%' % (p['arch'],
+                p['NUM_TOTAL_PE'], p['MAX_NEURONS_PER_STAGE'], p['MAX_NUM_STAGES'], p['WGT_ARR_LEN'],
+                p['ARR_WGT_IND_SIZE'], p['words'], p['num_calc'],
+                p['samples_per_sec'], p['utilization'] * 100))
+    if csv:
+        csv.close()
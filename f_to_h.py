@@ -1,57 +1,283 @@
-import struct
-#import numpy
 import argparse
+import os
+import sys
+import glob
+import json
+import shutil
+import binascii
+import itertools
+import multiprocessing
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+from dataset import file_md5
 
-parser = argparse.ArgumentParser()
-parser.add_argument('-b', type=str, help='benchmark')
-parser.add_argument('-a', type=str, help='which architecture: pipelined_vector, vector or systolic')
-parser.add_argument('-t', type=str, help='topology: i_h1_h2_o')
-args = parser.parse_args()
+# number of text lines parsed and converted at a time
+CHUNK_LINES = 65536
 
-#### input f to h ####
-file_name = "benchmark/"+args.b+"/data/"+args.a+"/input"
+# manifest of the artifacts built for a benchmark and architecture, in
+# benchmark/<b>/data/<a>/
+MANIFEST = 'manifest.json'
+BENCHMARKS = ('fft', 'hotspot', 'hotspot_5', 'inversek2j')
+ARCHITECTURES = ('pipelined_vector', 'vector', 'systolic')
 
-in_file = open(file_name+".dat", 'r')
-for i in xrange(1):
-    in_file.readline()
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
 
-numbers = [[float(i) for i in j.split()] for j in in_file.readlines()]
-#print numbers
+def floats_to_hex(values):
+    '''convert floats to big-endian float32 hex lines
 
-in_file.close()
+    Args:
+        values: array-like of floats, converted in row-major order
 
-out_file = open(file_name+"_hex.dat", 'w')
+    Returns:
+        hex_bytes: one 8-digit lowercase hex word per line, same as
+        struct.pack(">f", x).encode("hex") + "\\n" for every x
+    '''
+    raw = np.ascontiguousarray(values, dtype='>f4').view(np.uint8).reshape(-1, 4)
+    out = np.empty((raw.shape[0], 9), dtype=np.uint8)
+    out[:, 0:8:2] = HEX_DIGITS[raw >> 4]
+    out[:, 1:8:2] = HEX_DIGITS[raw & 0x0f]
+    out[:, 8] = ord('\n')
+    return out.tobytes()
 
-for i in xrange(len(numbers)):
-#for i in xrange(1):
-    for j in xrange(len(numbers[0])):
-        #print len(numbers[0])
-        #print numbers[i][j]
-        #print struct.pack(">f", numpy.float32(numbers[i][j])).encode("hex")
-        out_file.write(str(struct.pack(">f", numbers[i][j]).encode("hex")) + "\n")
-    #out_file.write("\n")
+def read_chunks(file_name, skip_lines=0, chunk_lines=CHUNK_LINES):
+    '''read a whitespace-separated float file block by block
 
-out_file.close()
+    Args:
+        file_name: text file to read
+        skip_lines: number of header lines to skip
+        chunk_lines: number of lines parsed at a time
 
+    Yields:
+        numbers: 1-dimensional float64 array of the values in one block
+    '''
+    with open(file_name, 'r') as in_file:
+        for i in range(skip_lines):
+            in_file.readline()
+        while True:
+            lines = list(itertools.islice(in_file, chunk_lines))
+            if not lines:
+                break
+            yield np.fromstring(''.join(lines), dtype=np.float64, sep=' ')
 
-#### config f to h ####
-file_name = "benchmark/"+args.b+"/nn_config/"+args.a+"/"+args.t
+def convert_file(in_name, out_name, skip_lines=0, chunk_lines=CHUNK_LINES):
+    '''convert a float text file to a hex file, one value per line
 
-in_file = open(file_name+".dat", 'r')
+    Args:
+        in_name: float text file
+        out_name: hex file to write
+        skip_lines: number of header lines to skip
+        chunk_lines: number of lines converted at a time
 
-numbers = [[float(i) for i in j.split()] for j in in_file.readlines()]
-#print numbers
+    Returns:
+        num_values: number of hex words written
+    '''
+    num_values = 0
+    with open(out_name, 'wb') as out_file:
+        for numbers in read_chunks(in_name, skip_lines, chunk_lines):
+            out_file.write(floats_to_hex(numbers))
+            num_values += len(numbers)
+    return num_values
 
-in_file.close()
+def convert(benchmark, architecture, topology, chunk_lines=CHUNK_LINES):
+    '''convert both the input file and the weight file of one benchmark
 
-out_file = open(file_name+"_hex.dat", 'w')
+    Args:
+        benchmark: benchmark name, e.g. hotspot
+        architecture: pipelined_vector, vector or systolic
+        topology: i_h1_h2_o
+        chunk_lines: number of lines converted at a time
 
-for i in xrange(len(numbers)):
-    for j in xrange(len(numbers[0])):
-        #print len(numbers[0])
-        #print numbers[i][j]
-        #print struct.pack(">f", numpy.float32(numbers[i][j])).encode("hex")
-        out_file.write(str(struct.pack(">f", numbers[i][j]).encode("hex")) + "\n")
-    #out_file.write("\n")
+    Returns:
+        num_in: number of input hex words written
+        num_w: number of weight hex words written
+    '''
+    #### input f to h ####
+    file_name = "benchmark/"+benchmark+"/data/"+architecture+"/input"
+    # the first line is the number of data
+    num_in = convert_file(file_name+".dat", file_name+"_hex.dat", 1, chunk_lines)
 
-out_file.close()
+    #### config f to h ####
+    file_name = "benchmark/"+benchmark+"/nn_config/"+architecture+"/"+topology
+    num_w = convert_file(file_name+".dat", file_name+"_hex.dat", 0, chunk_lines)
+    return num_in, num_w
+
+def convert_job(job):
+    '''unpack one (benchmark, architecture, topology, chunk_lines) job for Pool.map'''
+    return convert(*job)
+
+def convert_all(triples, num_procs=None, chunk_lines=CHUNK_LINES):
+    '''convert several benchmark/architecture/topology triples in parallel
+
+    Args:
+        triples: list of (benchmark, architecture, topology) tuples
+        num_procs: number of worker processes, None for one per core
+        chunk_lines: number of lines converted at a time
+
+    Returns:
+        counts: list of (num_in, num_w) for every triple
+    '''
+    jobs = [ tuple(triple) + (chunk_lines,) for triple in triples ]
+    if len(jobs) == 1 or num_procs == 1:
+        return [ convert_job(job) for job in jobs ]
+    pool = multiprocessing.Pool(num_procs)
+    try:
+        return pool.map(convert_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def file_stat(file_name):
+    stat = os.stat(file_name)
+    return [stat.st_size, stat.st_mtime]
+
+def load_manifest(file_name):
+    try:
+        with open(file_name) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def save_manifest(file_name, manifest):
+    tmp_name = file_name + '.%d.tmp' % os.getpid()
+    with open(tmp_name, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(tmp_name, file_name)
+
+def source_md5(manifest, source):
+    '''content hash of a source file, rehashed only if its size or mtime
+    changed since the manifest recorded it'''
+    stat = file_stat(source)
+    known = manifest.setdefault('sources', {}).get(source)
+    if known is None or known['stat'] != stat:
+        known = {'stat': stat, 'md5': binascii.hexlify(file_md5(source))}
+        manifest['sources'][source] = known
+    return known['md5']
+
+def is_stale(manifest, target, md5):
+    '''whether target is missing, was changed since it was built, or was
+    built from another version of its source'''
+    record = manifest.setdefault('targets', {}).get(target)
+    return (record is None or record['source_md5'] != md5
+            or not os.path.exists(target) or file_stat(target) != record['stat'])
+
+def record_target(manifest, target, md5):
+    manifest['targets'][target] = {'source_md5': md5, 'stat': file_stat(target)}
+
+def build(benchmark, architecture, topologies, chunk_lines=CHUNK_LINES, force=False):
+    '''bring the hardware files of a benchmark and architecture up to date:
+        data/train/input.txt -> data/<a>/input.dat -> data/<a>/input_hex.dat
+        nn_config/<t>.txt -> nn_config/<a>/<t>.dat -> nn_config/<a>/<t>_hex.dat
+    a file is copied or converted only if it is missing, was changed, or
+    its source has another content hash than the one it was built from;
+    the hashes are kept in data/<a>/manifest.json. the per-neuron images
+    train_dnn.py --memory_arch writes are <t>_pe_hex.dat, not built here
+
+    Args:
+        benchmark: benchmark name, e.g. hotspot
+        architecture: pipelined_vector, vector or systolic
+        topologies: list of i_h1_h2_o
+        chunk_lines: number of lines converted at a time
+        force: rebuild every file
+
+    Returns:
+        rebuilt: list of the files written
+        missing: list of the sources that do not exist
+    '''
+    root = "benchmark/"+benchmark+"/"
+    data_dir = root+"data/"+architecture+"/"
+    config_dir = root+"nn_config/"+architecture+"/"
+    chains = [ (root+"data/train/input.txt", data_dir+"input", 1) ]
+    chains += [ (root+"nn_config/"+t+".txt", config_dir+t, 0) for t in topologies ]
+    manifest_name = data_dir+MANIFEST
+    manifest = {} if force else load_manifest(manifest_name)
+    rebuilt = []
+    missing = []
+    for source, name, skip_lines in chains:
+        if not os.path.exists(source):
+            missing.append(source)
+            continue
+        md5 = source_md5(manifest, source)
+        if is_stale(manifest, name+".dat", md5):
+            if not os.path.isdir(os.path.dirname(name)):
+                os.makedirs(os.path.dirname(name))
+            shutil.copyfile(source, name+".dat")
+            record_target(manifest, name+".dat", md5)
+            rebuilt.append(name+".dat")
+        if is_stale(manifest, name+"_hex.dat", md5) or name+".dat" in rebuilt:
+            convert_file(name+".dat", name+"_hex.dat", skip_lines, chunk_lines)
+            record_target(manifest, name+"_hex.dat", md5)
+            rebuilt.append(name+"_hex.dat")
+    if rebuilt or os.path.isdir(data_dir):
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir)
+        save_manifest(manifest_name, manifest)
+    return rebuilt, missing
+
+def build_job(job):
+    '''unpack one (benchmark, architecture, topologies, chunk_lines, force) job for Pool.map'''
+    return build(*job)
+
+def build_all(triples, num_procs=None, chunk_lines=CHUNK_LINES, force=False):
+    '''build() several benchmark/architecture/topology triples in parallel;
+    the topologies of one benchmark and architecture share their input
+    files, so they are built by the same job
+
+    Returns:
+        results: list of ((benchmark, architecture), rebuilt, missing)
+    '''
+    groups = {}
+    for benchmark, architecture, topology in triples:
+        groups.setdefault((benchmark, architecture), []).append(topology)
+    keys = sorted(groups)
+    jobs = [ key + (groups[key], chunk_lines, force) for key in keys ]
+    if len(jobs) == 1 or num_procs == 1:
+        results = [ build_job(job) for job in jobs ]
+    else:
+        pool = multiprocessing.Pool(num_procs)
+        try:
+            results = pool.map(build_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return [ (key,) + tuple(result) for key, result in zip(keys, results) ]
+
+def all_triples(architectures=ARCHITECTURES):
+    '''every benchmark, architecture and nn_config/<i_h1_h2_o>.txt topology'''
+    triples = []
+    for benchmark in BENCHMARKS:
+        for name in sorted(glob.glob("benchmark/"+benchmark+"/nn_config/*.txt")):
+            topology = os.path.basename(name)[:-4]
+            if all(n.isdigit() for n in topology.split('_')) and len(topology.split('_')) == 4:
+                for architecture in architectures:
+                    triples.append((benchmark, architecture, topology))
+    return triples
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=str, action='append', help='benchmark')
+    parser.add_argument('-a', type=str, action='append', help='which architecture: pipelined_vector, vector or systolic')
+    parser.add_argument('-t', type=str, action='append', help='topology: i_h1_h2_o')
+    parser.add_argument('-j', type=int, default=None, help='number of parallel processes (default: one per core)')
+    parser.add_argument('-c', type=int, default=CHUNK_LINES, help='number of lines converted at a time')
+    parser.add_argument('-update', action='store_true', help='copy the sources and convert only what changed since the last build')
+    parser.add_argument('-all', action='store_true', help='update every benchmark and topology, for the -a architectures (default: all)')
+    parser.add_argument('-force', action='store_true', help='with -update or -all, rebuild everything')
+    args = parser.parse_args()
+
+    if args.all or args.update:
+        if args.all:
+            triples = all_triples(args.a or ARCHITECTURES)
+        else:
+            assert(args.b and args.a and args.t)
+            assert(len(args.b) == len(args.a) == len(args.t))
+            triples = zip(args.b, args.a, args.t)
+        for (benchmark, architecture), rebuilt, missing in build_all(triples,
+                args.j, args.c, args.force):
+            print('%s %s: %s' % (benchmark, architecture, ', '.join(rebuilt) or 'up to date'))
+            for source in missing:
+                print('    %s does not exist, skipped' % source)
+    else:
+        # -b, -a and -t may be repeated; the n-th of each form one conversion
+        assert(args.b and args.a and args.t)
+        assert(len(args.b) == len(args.a) == len(args.t))
+        convert_all(zip(args.b, args.a, args.t), args.j, args.c)
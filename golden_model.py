@@ -0,0 +1,226 @@
+'''
+Description: bit-accurate reference model of the NPU datapath.
+every neuron is computed the way a PE does it: a float32 multiply-add per
+input in input order starting from 0, then the bias added as 1 * bias, then
+the fast sigmoid x / (1 + |x|) built from one fp_add and one fp_div if the
+ACT bit of the layer is set. inference is batched with numpy, so a whole
+dataset is checked in seconds, e.g.
+    python golden_model.py -b hotspot -a pipelined_vector -t 10_0_0_1
+writes the expected outputs next to the testbench output and compares them
+if the testbench output exists.
+'''
+import argparse
+import os
+import numpy as np
+import f_to_h
+import h_to_f
+from pipelined_vector_model import parse_topology, default_act
+
+# number of rows run through the model at a time
+CHUNK_ROWS = 65536
+
+def load_weights(file_name, layers, layout='neuron'):
+    '''load a weight file
+
+    Args:
+        file_name: float text file or, if it ends with _hex.dat, hex file
+        layers: layer sizes, e.g. [10, 4, 1]
+        layout: neuron: per layer, per neuron: weights then bias (the
+                    order documented in nn_config/README and the one the
+                    PEs load)
+                tf: per layer: the [in, out] weight matrix row by row, then
+                    the biases (the order util.save_config writes)
+
+    Returns:
+        params: list of (W [n_prev, n], b [n]) float32 per layer
+    '''
+    if file_name.endswith('_hex.dat'):
+        values = h_to_f.load(file_name).ravel()
+    else:
+        values = np.loadtxt(file_name, dtype=np.float64, ndmin=1).astype(np.float32)
+    num_w = sum((layers[k] + 1) * layers[k+1] for k in range(len(layers) - 1))
+    if len(values) != num_w:
+        raise ValueError('%s has %d values, %s needs %d' % (file_name,
+            len(values), '_'.join(str(n) for n in layers), num_w))
+    params = []
+    offset = 0
+    for n_prev, n in zip(layers[:-1], layers[1:]):
+        block = values[offset:offset + (n_prev + 1) * n]
+        offset += len(block)
+        if layout == 'neuron':
+            block = block.reshape(n, n_prev + 1)
+            params.append((block[:, :-1].T.copy(), block[:, -1].copy()))
+        elif layout == 'tf':
+            params.append((block[:-n].reshape(n_prev, n).copy(), block[-n:].copy()))
+        else:
+            raise ValueError('unknown layout %s' % layout)
+    return params
+
+def read_inputs(file_name, num_in, chunk_rows=CHUNK_ROWS):
+    '''read an input file block by block
+
+    Args:
+        file_name: float text file whose first line is the number of data
+            or, if it ends with _hex.dat, hex file
+        num_in: number of input neurons
+        chunk_rows: approximate number of rows read at a time
+
+    Yields:
+        inputs: [num_rows, num_in] float32 array
+    '''
+    if file_name.endswith('_hex.dat'):
+        for rows in h_to_f.decode_rows(file_name, num_in, chunk_rows * num_in * 9):
+            yield rows
+        return
+    carry = np.zeros(0, dtype=np.float32)
+    for values in f_to_h.read_chunks(file_name, 1, chunk_rows):
+        values = np.concatenate((carry, values.astype(np.float32)))
+        num_rows = len(values) // num_in
+        carry = values[num_rows*num_in:]
+        if num_rows:
+            yield values[:num_rows*num_in].reshape(num_rows, num_in)
+    if len(carry):
+        raise ValueError('%d values left over for %d input neurons'
+                % (len(carry), num_in))
+
+def fast_sigmoid(x):
+    '''x / (1 + |x|), rounded to float32 after the add and the divide'''
+    return x / (np.float32(1.0) + np.abs(x))
+
+def layer(x, W, b, act, fused=False):
+    '''one layer of PEs
+
+    Args:
+        x: [num_rows, n_prev] float32 inputs
+        W: [n_prev, n] float32 weights
+        b: [n] float32 biases
+        act: apply the fast sigmoid
+        fused: round once per multiply-add instead of after the multiply
+            and after the add
+
+    Returns:
+        y: [num_rows, n] float32 outputs
+    '''
+    acc = np.zeros((x.shape[0], W.shape[1]), dtype=np.float32)
+    for k in range(W.shape[0]):
+        if fused:
+            # float32 products are exact in float64
+            acc = (acc.astype(np.float64)
+                    + x[:, k:k+1].astype(np.float64) * W[k].astype(np.float64)
+                    ).astype(np.float32)
+        else:
+            acc += x[:, k:k+1] * W[k]
+    acc += b
+    if act:
+        acc = fast_sigmoid(acc)
+    return acc
+
+def infer(x, params, act, fused=False):
+    '''run a batch through the network
+
+    Args:
+        x: [num_rows, num_in] float32 inputs
+        params: load_weights() of the network
+        act: activation bitmask: bit 0 hidden layer 1, bit 1 hidden layer 2,
+            bit 2 output layer (ACT of the testbenches)
+        fused: see layer()
+
+    Returns:
+        y: [num_rows, num_out] float32 outputs
+    '''
+    num_hidden = len(params) - 1
+    for k, (W, b) in enumerate(params):
+        bit = 2 if k == num_hidden else k
+        x = layer(x, W, b, (act >> bit) & 1, fused)
+    return x
+
+def run(in_name, params, act, out_name=None, fused=False, chunk_rows=CHUNK_ROWS):
+    '''run a whole input file through the model
+
+    Args:
+        in_name: input file, see read_inputs()
+        params: load_weights() of the network
+        act: activation bitmask
+        out_name: if set, write <out_name>.dat (floats, one data per line)
+            and <out_name>_hex.dat (one hex word per line)
+
+    Returns:
+        outputs: [num_data, num_out] float32 array
+    '''
+    num_in = params[0][0].shape[0]
+    outputs = []
+    out_file = hex_file = None
+    if out_name:
+        out_file = open(out_name + '.dat', 'w')
+        hex_file = open(out_name + '_hex.dat', 'wb')
+    try:
+        for x in read_inputs(in_name, num_in, chunk_rows):
+            y = infer(x, params, act, fused)
+            outputs.append(y)
+            if out_name:
+                np.savetxt(out_file, y, delimiter=" ")
+                hex_file.write(f_to_h.floats_to_hex(y))
+    finally:
+        if out_name:
+            out_file.close()
+            hex_file.close()
+    if not outputs:
+        return np.zeros((0, params[-1][1].shape[0]), dtype=np.float32)
+    return np.concatenate(outputs)
+
+def compare(expected, actual):
+    '''compare the model outputs with testbench outputs bit for bit
+
+    Args:
+        expected: [num_data, num_out] float32 array
+        actual: [num_data, num_out] float32 array, NaN for x/z words
+
+    Returns:
+        stats: dict of num_data, num_exact (identical words), num_unknown
+            (x/z words), max_ulp (largest distance in units in the last place)
+    '''
+    num_data = min(len(expected), len(actual))
+    expected = expected[:num_data]
+    actual = actual[:num_data]
+    e_bits = expected.view(np.int32).astype(np.int64)
+    a_bits = actual.view(np.int32).astype(np.int64)
+    # map the sign-magnitude float order to a monotonic integer order
+    e_bits = np.where(e_bits < 0, -(e_bits & 0x7fffffff), e_bits)
+    a_bits = np.where(a_bits < 0, -(a_bits & 0x7fffffff), a_bits)
+    unknown = np.isnan(actual)
+    ulp = np.abs(e_bits - a_bits)[~unknown]
+    return {
+        'num_data': num_data,
+        'num_exact': int(np.count_nonzero(expected.view(np.uint32) == actual.view(np.uint32))),
+        'num_unknown': int(np.count_nonzero(unknown)),
+        'max_ulp': int(ulp.max()) if len(ulp) else 0,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=str, help='benchmark')
+    parser.add_argument('-a', type=str, default='pipelined_vector', help='which architecture: pipelined_vector, vector or systolic')
+    parser.add_argument('-t', type=str, help='topology: i_h1_h2_o')
+    parser.add_argument('-act', type=int, default=None, help='activation bitmask (default: hidden layers)')
+    parser.add_argument('-l', type=str, default='neuron', help='weight layout: neuron or tf')
+    parser.add_argument('-w', type=str, default=None, help='weight file (default: nn_config/<a>/<t>.dat)')
+    parser.add_argument('-i', type=str, default=None, help='input file (default: data/<a>/input.dat)')
+    parser.add_argument('-c', type=str, default=None, help='testbench output to compare with (default: data/<a>/<t>_hex.dat if present)')
+    parser.add_argument('-fused', action='store_true', help='round once per multiply-add')
+    args = parser.parse_args()
+
+    layers = parse_topology(args.t)
+    act = default_act(layers) if args.act is None else args.act
+    data_dir = "benchmark/"+args.b+"/data/"+args.a+"/"
+    w_name = args.w or "benchmark/"+args.b+"/nn_config/"+args.a+"/"+args.t+".dat"
+    in_name = args.i or data_dir+"input.dat"
+    cmp_name = args.c or data_dir+args.t+"_hex.dat"
+
+    params = load_weights(w_name, layers, args.l)
+    outputs = run(in_name, params, act, data_dir+args.t+"_golden", args.fused)
+    print('%d outputs written to %s%s_golden.dat' % (len(outputs), data_dir, args.t))
+    if os.path.exists(cmp_name):
+        stats = compare(outputs, h_to_f.load(cmp_name, layers[-1]))
+        print('%s: %d/%d data, %d exact words, %d unknown words, max %d ulp'
+                % (cmp_name, stats['num_data'], len(outputs),
+                    stats['num_exact'], stats['num_unknown'], stats['max_ulp']))
@@ -1,32 +1,174 @@
-import struct
-#import numpy
 import argparse
+import os
+import numpy as np
 
-parser = argparse.ArgumentParser()
-parser.add_argument('-b', type=str, help='benchmark')
-#parser.add_argument('-t', type=str, help='type of the file: data or nn_config')
-parser.add_argument('-a', type=str, help='which architecture: pipelined_vector, vector or systolic')
-parser.add_argument('-f', type=str, help='filename: i_h1_h2_o')
-args = parser.parse_args()
+# number of bytes of the hex file decoded at a time
+CHUNK_BYTES = 1 << 22
 
-file_name = "benchmark/"+args.b+"/data/"+args.a+"/"+args.f
+# quiet NaN used for words the simulator left undriven (x or z digits)
+UNKNOWN_WORD = 0x7fc00000
 
-in_file = open(file_name+".dat", 'r')
+HEX_VALUES = np.full(256, 255, dtype=np.uint8)
+for i, c in enumerate('0123456789abcdef'):
+    HEX_VALUES[ord(c)] = i
+    HEX_VALUES[ord(c.upper())] = i
+for c in 'xXzZ':
+    HEX_VALUES[ord(c)] = 16
 
-# TODO: not finished. start from here
-numbers = [[float(i) for i in j.split()] for j in in_file.readlines()]
-#print numbers
+WHITESPACE = np.zeros(256, dtype=bool)
+for c in ' \t\r\n':
+    WHITESPACE[ord(c)] = True
 
-in_file.close()
+SHIFTS = np.arange(28, -4, -4, dtype=np.uint32)
 
-out_file = open(file_name+"_hex.dat", 'w')
+def decode_block(block):
+    '''decode a block of whitespace-separated 8-digit hex words
 
-for i in xrange(len(numbers)):
-    for j in xrange(len(numbers[0])):
-        #print len(numbers[0])
-        #print numbers[i][j]
-        #print struct.pack(">f", numpy.float32(numbers[i][j])).encode("hex")
-        out_file.write(str(struct.pack(">f", numbers[i][j]).encode("hex")) + "\n")
-    #out_file.write("\n")
+    Args:
+        block: uint8 array holding whole words only
 
-out_file.close()
+    Returns:
+        values: 1-dimensional float32 array, NaN for x/z words
+    '''
+    is_word = ~WHITESPACE[block]
+    edges = np.diff(np.concatenate(([0], is_word.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if np.any(ends - starts != 8):
+        raise ValueError('hex words must have exactly 8 digits')
+    nibbles = HEX_VALUES[block[is_word]].reshape(-1, 8)
+    if np.any(nibbles == 255):
+        raise ValueError('invalid hex digit')
+    unknown = np.any(nibbles == 16, axis=1)
+    words = (nibbles.astype(np.uint32) << SHIFTS).sum(axis=1, dtype=np.uint32)
+    words[unknown] = UNKNOWN_WORD
+    return words.view(np.float32)
+
+def decode_chunks(file_name, chunk_bytes=CHUNK_BYTES):
+    '''memory-map a hex file and decode it block by block
+
+    Args:
+        file_name: hex file written by f_to_h.py or a testbench
+        chunk_bytes: approximate number of bytes decoded at a time
+
+    Yields:
+        values: 1-dimensional float32 array of the words in one block
+    '''
+    if os.path.getsize(file_name) == 0:
+        return
+    buf = np.memmap(file_name, dtype=np.uint8, mode='r')
+    size = len(buf)
+    start = 0
+    while start < size:
+        end = min(start + chunk_bytes, size)
+        if end < size:
+            # cut the block after the last whitespace so no word is split
+            breaks = np.flatnonzero(WHITESPACE[buf[start:end]])
+            if len(breaks):
+                end = start + breaks[-1] + 1
+            else:
+                end = size
+        yield decode_block(np.asarray(buf[start:end]))
+        start = end
+    del buf
+
+def decode_rows(file_name, num_out, chunk_bytes=CHUNK_BYTES):
+    '''decode a hex file into rows of num_out values
+
+    Args:
+        file_name: hex file
+        num_out: number of output neurons, i.e. values per row
+        chunk_bytes: approximate number of bytes decoded at a time
+
+    Yields:
+        rows: [num_rows, num_out] float32 array
+    '''
+    carry = np.zeros(0, dtype=np.float32)
+    for values in decode_chunks(file_name, chunk_bytes):
+        if len(carry):
+            values = np.concatenate((carry, values))
+        num_rows = len(values) // num_out
+        carry = values[num_rows*num_out:]
+        if num_rows:
+            yield values[:num_rows*num_out].reshape(num_rows, num_out)
+    if len(carry):
+        raise ValueError('%d values left over for %d output neurons'
+                % (len(carry), num_out))
+
+def count_words(file_name, chunk_bytes=CHUNK_BYTES):
+    '''count the hex words in a file without decoding them'''
+    if os.path.getsize(file_name) == 0:
+        return 0
+    buf = np.memmap(file_name, dtype=np.uint8, mode='r')
+    count = 0
+    prev_word = False
+    for start in range(0, len(buf), chunk_bytes):
+        is_word = ~WHITESPACE[buf[start:start+chunk_bytes]]
+        count += np.count_nonzero(is_word[1:] & ~is_word[:-1])
+        count += int(is_word[0] and not prev_word)
+        prev_word = is_word[-1]
+    del buf
+    return int(count)
+
+def load(file_name, num_out=1, chunk_bytes=CHUNK_BYTES):
+    '''decode a whole hex file
+
+    Returns:
+        values: [num_data, num_out] float32 array
+    '''
+    rows = list(decode_rows(file_name, num_out, chunk_bytes))
+    if not rows:
+        return np.zeros((0, num_out), dtype=np.float32)
+    return np.concatenate(rows)
+
+def convert_text(in_name, out_name, num_out=1, chunk_bytes=CHUNK_BYTES):
+    '''decode a hex file to a float text file, one data per line
+
+    Returns:
+        num_data: number of rows written
+    '''
+    num_data = 0
+    with open(out_name, 'w') as out_file:
+        for rows in decode_rows(in_name, num_out, chunk_bytes):
+            np.savetxt(out_file, rows, delimiter=" ")
+            num_data += len(rows)
+    return num_data
+
+def convert_npy(in_name, out_name, num_out=1, chunk_bytes=CHUNK_BYTES):
+    '''decode a hex file to a [num_data, num_out] float32 .npy file
+
+    Returns:
+        num_data: number of rows written
+    '''
+    num_data = count_words(in_name, chunk_bytes) // num_out
+    out = np.lib.format.open_memmap(out_name, mode='w+',
+            dtype=np.float32, shape=(num_data, num_out))
+    row = 0
+    for rows in decode_rows(in_name, num_out, chunk_bytes):
+        out[row:row+len(rows)] = rows
+        row += len(rows)
+    out.flush()
+    del out
+    return num_data
+
+def topology_outputs(topology):
+    '''number of output neurons of an i_h1_h2_o topology'''
+    return int(topology.split('_')[-1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=str, help='benchmark')
+    #parser.add_argument('-t', type=str, help='type of the file: data or nn_config')
+    parser.add_argument('-a', type=str, help='which architecture: pipelined_vector, vector or systolic')
+    parser.add_argument('-f', type=str, help='filename: i_h1_h2_o, reads <f>_hex.dat')
+    parser.add_argument('-t', type=str, default=None, help='topology: i_h1_h2_o (default: the filename)')
+    parser.add_argument('-o', type=str, default='txt', help='output format: txt or npy')
+    args = parser.parse_args()
+
+    file_name = "benchmark/"+args.b+"/data/"+args.a+"/"+args.f
+    num_out = topology_outputs(args.t if args.t else args.f)
+
+    if args.o == 'npy':
+        convert_npy(file_name+"_hex.dat", file_name+".npy", num_out)
+    else:
+        convert_text(file_name+"_hex.dat", file_name+".dat", num_out)
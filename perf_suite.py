@@ -0,0 +1,350 @@
+'''
+Description: speed and memory benchmark suite of the toolchain, over the
+shipped benchmarks (fft, hotspot, hotspot_5, inversek2j). per benchmark it
+times
+    load_text, load_cache: dataset.Datasets from the text files and from
+        the binary cache
+    next_batch: Dataset.next_batch
+    do_eval: util.do_eval of the validation data, per topology
+    train: batches of -n training steps, per topology
+    save_config: util.save_config, per topology
+    f_to_h, h_to_f: conversion of the input file to hex and back
+the topologies are the i_h1_h2_o.txt files of benchmark/<b>/nn_config/.
+every case runs in a fresh process (so its peak RSS is its own) with
+fixed seeds and one TensorFlow thread, and repeats its work until it has
+run for -min_time seconds; the best of -r repetitions is kept, with the
+spread of the repetitions. results are stored as a JSON baseline and
+compared against one, cases slower than the threshold, or than the spread
+of either run if it is wider, are reported as regressions, e.g.
+    python perf_suite.py -save perf_baseline.json
+    python perf_suite.py -compare perf_baseline.json -threshold 0.1
+benchmarks whose data files are missing are skipped.
+'''
+import argparse
+import os
+import re
+import sys
+import glob
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+import tensorflow as tf
+import dataset
+import util
+import train_dnn
+import f_to_h
+import h_to_f
+from pipelined_vector_model import parse_topology
+
+BENCHMARKS = ('fft', 'hotspot', 'hotspot_5', 'inversek2j')
+SEED = 0
+
+@contextlib.contextmanager
+def quiet():
+    '''silence the prints of the timed code'''
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def data_dir(benchmark):
+    return 'benchmark/' + benchmark + '/data/train/'
+
+def load_datasets(benchmark, cache):
+    with quiet():
+        return dataset.Datasets(data_dir(benchmark), False, 'float', 'float',
+                cache, False, SEED)
+
+def benchmark_topologies(benchmark, data_sets):
+    '''i_h1_h2_o topologies of nn_config/ that fit the data'''
+    topologies = []
+    for name in sorted(glob.glob('benchmark/' + benchmark + '/nn_config/*.txt')):
+        topology = os.path.basename(name)[:-4]
+        if not re.match(r'^\d+_\d+_\d+_\d+$', topology):
+            continue
+        layers = parse_topology(topology)
+        if layers[0] == data_sets.num_in_neuron and layers[-1] == data_sets.num_out_neuron:
+            topologies.append(topology)
+    return topologies
+
+def build(benchmark, data_sets, layers):
+    '''graph of a topology, built by the functions of train_dnn with the
+    defaults of its flags (datapath format, activation, learning rate)
+
+    Returns:
+        input_pl, golden_pl, train_op, error
+    '''
+    tf.set_random_seed(SEED)
+    input_pl, golden_pl = util.generate_placeholder(layers[0], layers[-1],
+            None, 'float', 'float')
+    in_frac, out_frac = train_dnn.quantization_frac_bits(data_sets)
+    layer_input, hidden_act, output_act, quantizer = train_dnn.layer_functions(
+            input_pl, in_frac, out_frac)
+    hidden1, hidden2 = (layers[1:-1] + [0, 0])[:2]
+    outputs = train_dnn.build_network(data_sets, layer_input, hidden1, hidden2,
+            hidden_act, output_act, quantizer)
+    loss = util.loss(outputs, golden_pl, benchmark)
+    train_op = util.training(loss, train_dnn.FLAGS.learning_rate)
+    error = util.error(outputs, golden_pl, benchmark)
+    return input_pl, golden_pl, train_op, error
+
+def session():
+    return tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=1,
+        inter_op_parallelism_threads=1))
+
+def timed(work, min_time):
+    '''run work until it has taken min_time seconds, as timeit's autorange
+
+    Args:
+        work: function doing one batch of the timed work, returns its units
+        min_time: minimum seconds of timed work
+
+    Returns:
+        seconds, units: totals over the runs
+    '''
+    seconds = 0.0
+    units = 0
+    while seconds < min_time:
+        start_time = time.time()
+        units += work()
+        seconds += time.time() - start_time
+    return seconds, units
+
+def run_case(job):
+    '''run one case in the current process
+
+    Args:
+        job: (benchmark, case, topology or None, options)
+
+    Returns:
+        seconds: time of the timed part, at least options['min_time']
+        units: amount of work done, e.g. rows loaded
+        peak_rss_mb: peak resident set size of the process
+    '''
+    benchmark, case, topology, options = job
+    np.random.seed(SEED)
+    min_time = options['min_time']
+    work_dir = tempfile.mkdtemp(prefix='perf_suite_')
+    try:
+        if case == 'load_text':
+            def work():
+                return len(load_datasets(benchmark, False).input_data)
+            seconds, units = timed(work, min_time)
+        elif case == 'load_cache':
+            # the first load builds the cache
+            load_datasets(benchmark, True)
+            def work():
+                return len(load_datasets(benchmark, True).input_data)
+            seconds, units = timed(work, min_time)
+        elif case == 'next_batch':
+            data_sets = load_datasets(benchmark, True)
+            def work():
+                for i in xrange(options['num_batches']):
+                    data_sets.train.next_batch(options['batch_size'])
+                return options['num_batches'] * options['batch_size']
+            seconds, units = timed(work, min_time)
+        elif case in ('do_eval', 'train', 'save_config'):
+            data_sets = load_datasets(benchmark, True)
+            layers = parse_topology(topology)
+            with tf.Graph().as_default():
+                input_pl, golden_pl, train_op, error = build(benchmark, data_sets, layers)
+                sess = session()
+                sess.run(tf.initialize_all_variables())
+                if case == 'do_eval':
+                    def work():
+                        with quiet():
+                            util.do_eval(sess, error, input_pl, golden_pl,
+                                    options['eval_chunk_size'], data_sets.validate)
+                        return len(data_sets.validate.input_data)
+                    # the first evaluation pays for the chunk cache
+                    work()
+                    seconds, units = timed(work, min_time)
+                elif case == 'train':
+                    def work():
+                        for step in xrange(options['num_steps']):
+                            sess.run(train_op, feed_dict=util.fill_feed_dict(data_sets.train,
+                                input_pl, golden_pl, options['batch_size']))
+                        return options['num_steps']
+                    # the first steps pay for the graph setup
+                    for step in xrange(10):
+                        sess.run(train_op, feed_dict=util.fill_feed_dict(data_sets.train,
+                            input_pl, golden_pl, options['batch_size']))
+                    seconds, units = timed(work, min_time)
+                else:
+                    def work():
+                        util.save_config(sess, len(layers), work_dir + '/', topology + '.txt')
+                        return 1
+                    seconds, units = timed(work, min_time)
+                sess.close()
+        elif case == 'f_to_h':
+            def work():
+                return f_to_h.convert_file(data_dir(benchmark) + 'input.txt',
+                        work_dir + '/input_hex.dat', 1)
+            seconds, units = timed(work, min_time)
+        elif case == 'h_to_f':
+            f_to_h.convert_file(data_dir(benchmark) + 'input.txt',
+                    work_dir + '/input_hex.dat', 1)
+            def work():
+                return h_to_f.convert_text(work_dir + '/input_hex.dat',
+                        work_dir + '/input.txt')
+            seconds, units = timed(work, min_time)
+        else:
+            raise ValueError('unknown case %s' % case)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return seconds, units, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+# case: unit of its throughput
+UNITS = {
+    'load_text': 'rows/sec',
+    'load_cache': 'rows/sec',
+    'next_batch': 'examples/sec',
+    'do_eval': 'examples/sec',
+    'train': 'steps/sec',
+    'save_config': 'saves/sec',
+    'f_to_h': 'values/sec',
+    'h_to_f': 'values/sec',
+}
+
+def cases(benchmarks):
+    '''(benchmark, case, topology) of every case that has its data'''
+    result = []
+    for benchmark in benchmarks:
+        if not (os.path.exists(data_dir(benchmark) + 'input.txt')
+                and os.path.exists(data_dir(benchmark) + 'golden.txt')):
+            print('%s: no data in %s, skipped' % (benchmark, data_dir(benchmark)))
+            continue
+        for case in ('load_text', 'load_cache', 'next_batch'):
+            result.append((benchmark, case, None))
+        topologies = benchmark_topologies(benchmark, load_datasets(benchmark, True))
+        for case in ('do_eval', 'train', 'save_config'):
+            for topology in topologies:
+                result.append((benchmark, case, topology))
+        for case in ('f_to_h', 'h_to_f'):
+            result.append((benchmark, case, None))
+    return result
+
+def case_key(benchmark, case, topology):
+    return '/'.join(k for k in (benchmark, case, topology) if k)
+
+def run_suite(benchmarks, options, repeat):
+    '''run every case repeat times, each run in a fresh process
+
+    Returns:
+        results: dict of case key to dict of throughput (best of the
+            repetitions), spread (relative difference of the best and the
+            worst throughput), unit, seconds and peak_rss_mb
+    '''
+    results = {}
+    for benchmark, case, topology in cases(benchmarks):
+        runs = []
+        for i in xrange(repeat):
+            pool = multiprocessing.Pool(1)
+            try:
+                runs.append(pool.apply(run_case, ((benchmark, case, topology, options),)))
+            finally:
+                pool.close()
+                pool.join()
+        throughputs = [ units / seconds if seconds > 0 else float('inf')
+                for seconds, units, _ in runs ]
+        best = max(xrange(len(runs)), key=lambda i: throughputs[i])
+        key = case_key(benchmark, case, topology)
+        results[key] = {
+            'throughput': throughputs[best],
+            'spread': 1.0 - min(throughputs) / throughputs[best],
+            'unit': UNITS[case],
+            'seconds': runs[best][0],
+            'peak_rss_mb': max(r[2] for r in runs),
+        }
+        print('%-40s %14.1f %-12s %8.3f sec %5.1f%% spread %8.1f MB' % (key,
+            results[key]['throughput'], results[key]['unit'], runs[best][0],
+            results[key]['spread'] * 100, results[key]['peak_rss_mb']))
+    return results
+
+def environment():
+    '''what the throughput depends on besides the code'''
+    return {
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'cpus': multiprocessing.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'tensorflow': tf.__version__,
+    }
+
+def compare(results, baseline, threshold):
+    '''compare results with a baseline
+
+    Returns:
+        regressions: list of (key, baseline throughput, throughput, change)
+            of the cases more than threshold, or than the spread of the
+            baseline or of the results if it is wider, slower than the
+            baseline
+    '''
+    regressions = []
+    print('%-40s %14s %14s %8s %8s' % ('case', 'baseline', 'current', 'change', 'limit'))
+    for key in sorted(results):
+        if key not in baseline['results']:
+            print('%-40s %14s %14.1f' % (key, 'new', results[key]['throughput']))
+            continue
+        old = baseline['results'][key]['throughput']
+        new = results[key]['throughput']
+        change = new / old - 1.0
+        limit = max(threshold, baseline['results'][key].get('spread', 0.0),
+                results[key]['spread'])
+        flag = ''
+        if change < -limit:
+            flag = ' REGRESSION'
+            regressions.append((key, old, new, change))
+        print('%-40s %14.1f %14.1f %+7.1f%% %7.1f%%%s' % (key, old, new, change * 100,
+            -limit * 100, flag))
+    if baseline['environment'] != environment():
+        print('note: the baseline was measured on %s' % json.dumps(baseline['environment'],
+            sort_keys=True))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=str, action='append', default=None, help='benchmark (default: all)')
+    parser.add_argument('-r', type=int, default=3, help='repetitions of every case, the best is kept')
+    parser.add_argument('-n', type=int, default=100, help='training steps per timed batch of the train cases')
+    parser.add_argument('-min_time', type=float, default=1.0, help='seconds every case repeats its work for')
+    parser.add_argument('-batch_size', type=int, default=100, help='batch size')
+    parser.add_argument('-save', type=str, default=None, help='store the results as a baseline in this file')
+    parser.add_argument('-compare', type=str, default=None, help='compare with the baseline in this file')
+    parser.add_argument('-threshold', type=float, default=0.1, help='slowdown reported as a regression, e.g. 0.1 for 10%%')
+    args = parser.parse_args()
+
+    options = {
+        'batch_size': args.batch_size,
+        'num_batches': 1000,
+        'num_steps': args.n,
+        'min_time': args.min_time,
+        'eval_chunk_size': 65536,
+    }
+    results = run_suite(args.b or BENCHMARKS, options, args.r)
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({'environment': environment(), 'options': options,
+                'results': results}, baseline_file, indent=1, sort_keys=True)
+        print('baseline saved to %s' % args.save)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['options'] != options:
+            print('note: the baseline was measured with %s' % json.dumps(baseline['options'],
+                sort_keys=True))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('%d regressions' % len(regressions))
+            sys.exit(1)
@@ -0,0 +1,399 @@
+'''
+Description: cycle-level performance model of the pipelined_vector NPU
+(pipelined_vector/npu.v controller driving pipelined_vector/pe.v PEs).
+The controller FSM (state, state_count, multadd_count, pe_count and the
+per-PE states PE_LOAD, PE_MA, PE_MAB, PE_MABO, PE_BIAS, PE_ACT, PE_ACT_CLR)
+is stepped cycle by cycle under the same stimulus the testbenches apply,
+which gives the per-inference latency, the steady-state throughput and the
+NUM_CALC value the testbenches hard-code, without running the RTL.
+'''
+import os
+import re
+import glob
+import argparse
+
+# pe.v latencies and sizing
+PE_PARAMS = {
+    'COUNT_FP_ADD': 2,          # 3 cycles
+    'COUNT_FP_DIV': 18,         # 19 cycles
+    'COUNT_MA': 3,              # FP multiply add; 4 cycles
+    'MAX_NEURONS_PER_STAGE': 32,
+    'MAX_NUM_STAGES': 3,
+    'NUM_TOTAL_PE': 8,
+}
+# npu.v controller counts
+NPU_PARAMS = {
+    'CYCLES_MA': 3,             # MA, MAB, BIAS
+    'CYCLES_ACT': 20,           # ACT, ACT_CLR
+}
+# testbench clock: `CYCLE 50 with `timescale 100ps
+CLOCK_MHZ = 200.0
+
+# controller states
+IDLE, CONFIG, LOAD_W1, LOAD_W2, LOAD_WO, LAYER_H1, LAYER_H2, LAYER_O, SEND_O = range(9)
+LOAD_STATES = (LOAD_W1, LOAD_W2, LOAD_WO)
+LAYER_STATES = (LAYER_H1, LAYER_H2, LAYER_O)
+ZERO_HIDDEN, ONE_HIDDEN, TWO_HIDDEN = range(3)
+# PE control signals
+PE_IDLE, PE_LOAD, PE_MA, PE_MAB, PE_MABO, PE_BIAS, PE_ACT, PE_ACT_CLR = range(8)
+
+def count_act(pe_params):
+    '''COUNT_ACT of pe.v: fast sigmoid = fp_add then fp_div'''
+    return pe_params['COUNT_FP_ADD'] + pe_params['COUNT_FP_DIV'] + 2
+
+def parse_topology(topology):
+    '''i_h1_h2_o string to a list of layer sizes, e.g. 10_4_0_1 -> [10, 4, 1]'''
+    sizes = [ int(n) for n in topology.split('_') ]
+    assert(len(sizes) == 4)
+    assert(sizes[1] > 0 or sizes[2] == 0)
+    return [ n for n in sizes if n > 0 ]
+
+def default_act(layers):
+    '''activation bitmask the testbenches use: hidden layers only'''
+    return (1 << (len(layers) - 2)) - 1
+
+def num_weights(layers):
+    '''number of weights and biases (NUM_W of the testbenches)'''
+    return sum((layers[k] + 1) * layers[k+1] for k in range(len(layers) - 1))
+
+def check_sizing(layers, pe_params=PE_PARAMS, npu_params=NPU_PARAMS, act=None):
+    '''list the parameters a topology overflows, and timing mismatches;
+    the activation window is only checked if some layer of act activates
+
+    Returns:
+        problems: list of strings, empty if the topology fits
+    '''
+    problems = []
+    num_pe = pe_params['NUM_TOTAL_PE']
+    max_neurons = pe_params['MAX_NEURONS_PER_STAGE']
+    wgt_arr_len = (max_neurons * max_neurons
+            * (pe_params['MAX_NUM_STAGES'] - 1) // num_pe)
+    out_buf_len = max_neurons // num_pe
+    # MAX_NUM_STAGES counts the input and the output stage
+    if len(layers) > pe_params['MAX_NUM_STAGES']:
+        problems.append('%d stages > MAX_NUM_STAGES=%d'
+                % (len(layers), pe_params['MAX_NUM_STAGES']))
+    for n in layers:
+        if n > max_neurons:
+            problems.append('%d neurons > MAX_NEURONS_PER_STAGE=%d' % (n, max_neurons))
+    # neuron j of every layer is loaded into PE j % NUM_TOTAL_PE
+    for pe in range(num_pe):
+        words = 0
+        for k in range(1, len(layers)):
+            neurons = len(range(pe, layers[k], num_pe))
+            words += neurons * (layers[k-1] + 1)
+            if neurons > out_buf_len:
+                problems.append('PE %d holds %d outputs > OUT_BUF_LEN=%d'
+                        % (pe, neurons, out_buf_len))
+        if words > wgt_arr_len:
+            problems.append('PE %d holds %d weights > WGT_ARR_LEN=%d'
+                    % (pe, words, wgt_arr_len))
+    if npu_params['CYCLES_MA'] != pe_params['COUNT_MA']:
+        problems.append('controller CYCLES_MA=%d != PE COUNT_MA=%d'
+                % (npu_params['CYCLES_MA'], pe_params['COUNT_MA']))
+    if act is None:
+        act = default_act(layers)
+    # ACT bits: 0 hidden 1, 1 hidden 2, 2 output
+    layer_bits = default_act(layers) | 4
+    if act & layer_bits and npu_params['CYCLES_ACT'] < count_act(pe_params):
+        problems.append('controller CYCLES_ACT=%d < PE COUNT_ACT=%d: '
+                'activation results are not written back'
+                % (npu_params['CYCLES_ACT'], count_act(pe_params)))
+    return problems
+
+class Controller:
+    '''npu.v control registers, stepped one clock edge at a time'''
+
+    def __init__(self, pe_params=PE_PARAMS, npu_params=NPU_PARAMS):
+        self.num_pe = pe_params['NUM_TOTAL_PE']
+        self.cycles_ma = npu_params['CYCLES_MA']
+        self.cycles_act = npu_params['CYCLES_ACT']
+        self.state = IDLE
+        self.state_count = 0
+        self.multadd_count = 0
+        self.pe_count = 0
+        self.num_layers = 0
+        self.num_neurons = [0, 0, 0, 0]
+        self.do_act = 0
+        self.pe_state = [PE_IDLE] * self.num_pe
+
+    def num_multadds(self):
+        n = self.num_neurons
+        if self.state == LOAD_W1:
+            return n[0] + 1
+        elif self.state == LOAD_W2:
+            return n[1] + 1
+        elif self.state == LOAD_WO:
+            return n[self.num_layers] + 1
+        elif self.state == LAYER_H1:
+            return n[0]
+        elif self.state == LAYER_H2:
+            return n[1]
+        elif self.state == LAYER_O:
+            return n[self.num_layers]
+        return 0
+
+    def layer(self):
+        '''(current_num_neurons, do_act) of the current layer'''
+        if self.state == LAYER_H1:
+            return self.num_neurons[1], self.do_act & 1
+        elif self.state == LAYER_H2:
+            return self.num_neurons[2], (self.do_act >> 1) & 1
+        elif self.state == LAYER_O:
+            return self.num_neurons[3], (self.do_act >> 2) & 1
+        return 0, 0
+
+    def step(self, we, oe, data):
+        '''one rising clock edge
+
+        Args:
+            we: write enable
+            oe: output enable
+            data: value on the data bus, only used during CONFIG
+        '''
+        num_multadds = self.num_multadds()
+        current_num_neurons, do_act = self.layer()
+        num_iterations = current_num_neurons // self.num_pe
+        num_busy_pes = current_num_neurons % self.num_pe
+        pe0 = self.pe_state[0]
+        act_done = (do_act and self.pe_count == self.cycles_act) or not do_act
+        loaded = self.multadd_count == num_multadds
+
+        # state
+        state_w = self.state
+        if self.state == IDLE:
+            if we:
+                state_w = CONFIG
+        elif self.state == CONFIG:
+            if self.state_count == 5:
+                state_w = LOAD_WO if self.num_layers == ZERO_HIDDEN else LOAD_W1
+        elif self.state == LOAD_W1:
+            if self.state_count == self.num_neurons[1] and loaded:
+                state_w = LOAD_WO if self.num_layers == ONE_HIDDEN else LOAD_W2
+        elif self.state == LOAD_W2:
+            if self.state_count == self.num_neurons[2] and loaded:
+                state_w = LOAD_WO
+        elif self.state == LOAD_WO:
+            if self.state_count == self.num_neurons[3] and loaded:
+                state_w = LAYER_O if self.num_layers == ZERO_HIDDEN else LAYER_H1
+        elif self.state in LAYER_STATES:
+            # PE 0 leaving PE_ACT_CLR ends the layer
+            if pe0 == PE_ACT_CLR and act_done:
+                if self.state == LAYER_H1:
+                    state_w = LAYER_O if self.num_layers == ONE_HIDDEN else LAYER_H2
+                elif self.state == LAYER_H2:
+                    state_w = LAYER_O
+                else:
+                    state_w = SEND_O
+        elif self.state == SEND_O:
+            if self.state_count == self.num_neurons[3] and oe:
+                state_w = IDLE
+
+        # state_count
+        state_count_w = self.state_count
+        if state_w != self.state:
+            state_count_w = 0
+        elif (self.state == CONFIG
+                or (self.state in LOAD_STATES and loaded)
+                or (pe0 == PE_ACT and self.pe_count == self.cycles_act)
+                or (self.state == SEND_O and oe)):
+            state_count_w = (self.state_count + 1) & 0x1f
+
+        # multadd_count
+        multadd_count_w = 0
+        if ((self.state in LOAD_STATES or pe0 in (PE_MA, PE_MAB, PE_MABO))
+                and not loaded):
+            multadd_count_w = (self.multadd_count + 1) & 0x3f
+
+        # pe_count
+        pe_count_w = 0
+        if ((pe0 == PE_BIAS and self.pe_count != self.cycles_ma)
+                or (pe0 in (PE_ACT, PE_ACT_CLR) and self.pe_count != self.cycles_act)):
+            pe_count_w = (self.pe_count + 1) & 0x1f
+
+        # pe_state
+        pe_w_id = state_count_w % self.num_pe
+        pe_state_w = list(self.pe_state)
+        for i, pe in enumerate(self.pe_state):
+            busy = i <= num_busy_pes or num_iterations > 0
+            if pe == PE_IDLE:
+                if state_w in LOAD_STATES and pe_w_id == i:
+                    pe_state_w[i] = PE_LOAD
+                elif state_w != self.state and state_w in LAYER_STATES and busy:
+                    pe_state_w[i] = PE_MA
+            elif pe == PE_LOAD:
+                if state_w in (LAYER_H1, LAYER_O):
+                    pe_state_w[i] = PE_MA
+                elif state_w in LOAD_STATES and pe_w_id != i:
+                    pe_state_w[i] = PE_IDLE
+            elif pe == PE_MA:
+                if loaded:
+                    pe_state_w[i] = PE_BIAS
+                elif (state_w in (LAYER_H2, LAYER_O) and (self.num_layers >> 1) & 1
+                        and state_count_w == 0
+                        and multadd_count_w % self.num_pe == i):
+                    pe_state_w[i] = PE_MABO
+            elif pe == PE_MABO:
+                pe_state_w[i] = PE_BIAS if loaded else PE_MA
+            elif pe == PE_MAB:
+                if loaded:
+                    pe_state_w[i] = PE_BIAS
+            elif pe == PE_BIAS:
+                if self.pe_count == self.cycles_ma:
+                    if (self.state_count == num_iterations
+                            or (i > num_busy_pes
+                                and self.state_count == (num_iterations - 1) & 0x1f)):
+                        pe_state_w[i] = PE_ACT_CLR
+                    else:
+                        pe_state_w[i] = PE_ACT
+            elif pe == PE_ACT:
+                if act_done:
+                    pe_state_w[i] = PE_MAB
+            elif pe == PE_ACT_CLR:
+                if act_done:
+                    if i == 0 and state_w != SEND_O:
+                        pe_state_w[i] = PE_MABO
+                    elif state_w != self.state and state_w != SEND_O and busy:
+                        pe_state_w[i] = PE_MA
+                    else:
+                        pe_state_w[i] = PE_IDLE
+
+        # configuration registers
+        if self.state == CONFIG:
+            if self.state_count == 0:
+                self.num_layers = data & 0x3
+            elif 1 <= self.state_count <= 4:
+                self.num_neurons[self.state_count - 1] = data & 0x1f
+            elif self.state_count == 5:
+                self.do_act = data & 0x7
+
+        self.state = state_w
+        self.state_count = state_count_w
+        self.multadd_count = multadd_count_w
+        self.pe_count = pe_count_w
+        self.pe_state = pe_state_w
+
+def simulate(layers, act=None, pe_params=PE_PARAMS, npu_params=NPU_PARAMS,
+        max_cycles=100000):
+    '''run one inference under the testbench stimulus
+
+    Args:
+        layers: layer sizes, e.g. [10, 4, 1]
+        act: activation bitmask (ACT of the testbenches), hidden layers if None
+        pe_params: pe.v parameters
+        npu_params: npu.v parameters
+        max_cycles: give up if the controller does not reach SEND_O
+
+    Returns:
+        result: dict of cycle counts:
+            config, load, input: cycles the testbench drives each phase
+            num_calc: minimum NUM_CALC, cycles between the input phase and output
+            output: cycles to read the outputs
+            latency: cycles from the first configuration word to the last output
+            pe_busy: PE-cycles spent in MA/MAB/MABO/BIAS/ACT/ACT_CLR
+    '''
+    if act is None:
+        act = default_act(layers)
+    hidden = len(layers) - 2
+    sizes = layers[:1] + layers[1:-1] + [0] * (2 - hidden) + layers[-1:]
+    config = [hidden] + [ max(n - 1, 0) for n in sizes ] + [act]
+    num_w = num_weights(layers)
+    # one word per slot: we=1 with the bus floating, config, weights, inputs,
+    # then we=0 with the bus floating
+    stimulus = [None] + config + [0] * (num_w + layers[0])
+    ctrl = Controller(pe_params, npu_params)
+    pe_busy = 0
+    for data in stimulus:
+        ctrl.step(True, False, data if data is not None else 0)
+        pe_busy += sum(1 for s in ctrl.pe_state if s >= PE_MA)
+    num_calc = 0
+    # the testbench raises oe NUM_CALC cycles after dropping we
+    while ctrl.state != SEND_O:
+        ctrl.step(False, False, 0)
+        pe_busy += sum(1 for s in ctrl.pe_state if s >= PE_MA)
+        num_calc += 1
+        if num_calc > max_cycles:
+            raise RuntimeError('controller never reaches SEND_O for %s'
+                    % '_'.join(str(n) for n in layers))
+    num_out = layers[-1]
+    for i in range(num_out):
+        ctrl.step(False, True, 0)
+    assert(ctrl.state == IDLE)
+    return {
+        'config': 1 + len(config),
+        'load': num_w,
+        'input': layers[0] + 1,
+        'num_calc': num_calc,
+        'output': num_out,
+        'latency': 1 + len(config) + num_w + layers[0] + 1 + num_calc + num_out,
+        'pe_busy': pe_busy,
+    }
+
+def predict(topology, act=None, num_data=1, clock_mhz=CLOCK_MHZ,
+        pe_params=PE_PARAMS, npu_params=NPU_PARAMS):
+    '''latency and throughput of a topology
+
+    Args:
+        topology: i_h1_h2_o
+        act: activation bitmask, hidden layers if None
+        num_data: number of inferences, e.g. NUM_DATA of the testbench
+        clock_mhz: clock frequency
+
+    Returns:
+        result: simulate() counts plus
+            samples_per_cycle: steady state; the testbench protocol reloads
+                the configuration and weights for every input
+            resident_samples_per_cycle: if the weights stayed loaded
+            total_cycles, seconds: for num_data inferences
+            utilization: PE busy share of the latency
+            problems: check_sizing() of the topology
+    '''
+    layers = parse_topology(topology)
+    result = simulate(layers, act, pe_params, npu_params)
+    latency = result['latency']
+    resident = result['input'] + result['num_calc'] + result['output']
+    result['topology'] = topology
+    result['samples_per_cycle'] = 1.0 / latency
+    result['resident_samples_per_cycle'] = 1.0 / resident
+    result['total_cycles'] = latency * num_data
+    result['seconds'] = latency * num_data / (clock_mhz * 1e6)
+    result['utilization'] = float(result['pe_busy']) / (latency * pe_params['NUM_TOTAL_PE'])
+    result['problems'] = check_sizing(layers, pe_params, npu_params, act)
+    return result
+
+def benchmark_topologies(root='benchmark'):
+    '''every i_h1_h2_o topology in benchmark/*/nn_config/'''
+    topologies = set()
+    for path in glob.glob(os.path.join(root, '*', 'nn_config', '*.txt')):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if re.match(r'^\d+_\d+_\d+_\d+$', name):
+            topologies.add(name)
+    return sorted(topologies)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('topologies', nargs='*', help='i_h1_h2_o (default: every topology in benchmark/*/nn_config)')
+    parser.add_argument('-act', type=int, default=None, help='activation bitmask (default: hidden layers)')
+    parser.add_argument('-n', type=int, default=65536, help='number of inferences (NUM_DATA)')
+    parser.add_argument('-f', type=float, default=CLOCK_MHZ, help='clock frequency in MHz')
+    parser.add_argument('-match_pe', action='store_true', help='set the controller ACT window to the PE COUNT_ACT')
+    args = parser.parse_args()
+
+    npu_params = dict(NPU_PARAMS)
+    if args.match_pe:
+        npu_params['CYCLES_ACT'] = count_act(PE_PARAMS)
+    topologies = args.topologies or benchmark_topologies()
+    print('%-12s %6s %6s %8s %10s %10s %12s %8s' % ('topology', 'load',
+        'calc', 'latency', 'samples/c', 'resident', 'total(ms)', 'util'))
+    for topology in topologies:
+        try:
+            r = predict(topology, args.act, args.n, args.f, PE_PARAMS, npu_params)
+        except RuntimeError as e:
+            print('%-12s %s' % (topology, e))
+            continue
+        print('%-12s %6d %6d %8d %10.5f %10.5f %12.3f %7.1f%%' % (topology,
+            r['load'], r['num_calc'], r['latency'], r['samples_per_cycle'],
+            r['resident_samples_per_cycle'], r['seconds'] * 1e3,
+            r['utilization'] * 100))
+        for problem in r['problems']:
+            print('    warning: %s' % problem)
@@ -0,0 +1,326 @@
+'''
+Description: sharded RTL simulation of a benchmark topology.
+a testbench is generated for the topology (same stimulus as the
+hand-written *_tb.v, file names and number of data passed as plusargs
+instead of absolute paths), compiled once, and run on N shards of the
+input hex file concurrently. the shard outputs are merged in order into
+the output file h_to_f.py reads, e.g.
+    python rtl_sim.py -b hotspot -a pipelined_vector -t 10_0_0_1 -j 8 \
+        -l fp_ip/fp_mac.v -l fp_ip/fp_add.v -l fp_ip/fp_div.v
+the floating-point IP (fp_mac, fp_add, fp_div) is not part of the repo;
+pass its simulation models with -l. only pipelined_vector is supported:
+vector/ has no pe sources, and NUM_CALC is predicted with the one
+multiply-add per cycle of pipelined_vector_model.py.
+'''
+import argparse
+import os
+import re
+import time
+import shutil
+import tempfile
+import subprocess
+import multiprocessing.pool
+import f_to_h
+import h_to_f
+from pipelined_vector_model import parse_topology, default_act, num_weights, predict
+
+ARCHITECTURES = {
+    'pipelined_vector': ['npu.v', 'pe.v'],
+}
+
+TESTBENCH = '''`timescale 100ps/1ps
+`define CYCLE 50
+`define NUM_LAYERS %(num_layers)d
+`define NUM_IN %(num_in)d
+`define NUM_H1 %(num_h1)d
+`define NUM_H2 %(num_h2)d
+`define NUM_OUT %(num_out)d
+`define ACT %(act)d
+`define NUM_W %(num_w)d // number of weights and biases
+`define NUM_CALC %(num_calc)d // number of cycles to calculate
+
+module npu_tb();
+	reg clk, rst;
+	reg we, oe;
+	reg [31:0] data;
+	wire [31:0] data_w;
+	wire ready;
+
+	reg signed [31:0] in[0:`NUM_IN];
+	reg signed [31:0] w[0:`NUM_W-1];
+	integer i;
+	integer infile, wfile, outfile;
+	integer iteration, num_data;
+	reg [8*1024-1:0] in_name, w_name, out_name;
+
+	assign data_w = data;
+
+	npu NPU(.rst(rst), .clk(clk), .we(we), .oe(oe), .data(data_w), .ready(ready));
+
+	always begin
+		#(`CYCLE/2) clk = ~clk;
+	end
+
+	initial begin
+		if(!$value$plusargs("IN_FILE=%%s", in_name) ||
+		   !$value$plusargs("W_FILE=%%s", w_name) ||
+		   !$value$plusargs("OUT_FILE=%%s", out_name) ||
+		   !$value$plusargs("NUM_DATA=%%d", num_data)) begin
+			$display("usage: +IN_FILE=<file> +W_FILE=<file> +OUT_FILE=<file> +NUM_DATA=<n>");
+			$finish;
+		end
+		infile = $fopen(in_name, "r");
+		wfile = $fopen(w_name, "r");
+		outfile = $fopen(out_name, "w");
+		for(i = 0; i < `NUM_W; i = i + 1) begin
+			$fscanf(wfile, "%%08x", w[i]);
+		end
+
+		/**** reset the NPU ****/
+		#0;
+		clk = 1'b1;
+		rst = 1'b0;
+		data = 32'bz;
+		we = 1'b0;
+		oe = 1'b0;
+
+		#(`CYCLE);
+		rst = 1'b1;
+
+		#(`CYCLE);
+		rst = 1'b0;
+
+		#(`CYCLE/2);
+
+		for(iteration = 0; iteration < num_data; iteration = iteration + 1) begin
+			for(i = 0; i <= `NUM_IN; i = i + 1) begin
+				$fscanf(infile, "%%08x", in[i]);
+			end
+
+			we = 1'b1;
+			/**** send configurations ****/
+			#(`CYCLE);
+			data = `NUM_LAYERS;
+
+			#(`CYCLE);
+			data = `NUM_IN;
+
+			#(`CYCLE);
+			data = `NUM_H1;
+
+			#(`CYCLE);
+			data = `NUM_H2;
+
+			#(`CYCLE);
+			data = `NUM_OUT;
+
+			#(`CYCLE);
+			data = `ACT;
+
+			/**** send weights ****/
+			for(i = 0; i < `NUM_W; i = i+1) begin
+				#(`CYCLE);
+				data = w[i];
+			end
+
+			/**** first layer: send inputs ****/
+			for(i = 0; i <= `NUM_IN; i = i+1) begin
+				#(`CYCLE);
+				data = in[i];
+			end
+			#(`CYCLE);
+			we = 1'b0;
+			data = 32'bz;
+
+			/**** rest of the layers calculation ****/
+			#(`CYCLE*`NUM_CALC);
+
+			/**** receive outputs and write output data ****/
+			oe = 1;
+			for(i = 0; i <= `NUM_OUT; i = i+1) begin
+				$fstrobe(outfile, "%%x", data_w);
+				#(`CYCLE);
+			end
+			oe = 0;
+		end
+
+		$fclose(infile);
+		$fclose(wfile);
+		$fclose(outfile);
+		$display("simulated cycles: %%0d", $time / `CYCLE);
+		$finish;
+	end
+endmodule
+'''
+
+def testbench(layers, act, num_calc):
+    '''testbench source for a topology
+
+    Args:
+        layers: layer sizes, e.g. [10, 4, 1]
+        act: activation bitmask
+        num_calc: cycles waited between the last input and the outputs
+    '''
+    hidden = layers[1:-1] + [1] * (4 - len(layers))
+    return TESTBENCH % {
+        'num_layers': len(layers) - 2,
+        'num_in': layers[0] - 1,
+        'num_h1': hidden[0] - 1,
+        'num_h2': hidden[1] - 1,
+        'num_out': layers[-1] - 1,
+        'act': act,
+        'num_w': num_weights(layers),
+        'num_calc': num_calc,
+    }
+
+def compile_command(simulator, tb_name, sources, binary):
+    '''command line building the simulation binary'''
+    if simulator == 'iverilog':
+        return ['iverilog', '-g2005', '-s', 'npu_tb', '-o', binary, tb_name] + sources
+    elif simulator == 'verilator':
+        return ['verilator', '--binary', '--timing', '-Wno-fatal', '--top-module', 'npu_tb',
+                '--Mdir', binary + '_obj', '-o', os.path.abspath(binary), tb_name] + sources
+    raise ValueError('unknown simulator %s' % simulator)
+
+def run_command(simulator, binary, plusargs):
+    '''command line running the simulation binary'''
+    args = [ '+%s=%s' % (k, v) for k, v in plusargs ]
+    if simulator == 'iverilog':
+        return ['vvp', '-n', binary] + args
+    return [binary] + args
+
+def shard_inputs(in_name, num_in, num_shards, work_dir):
+    '''split an input hex file into contiguous shards of whole data
+
+    Returns:
+        shards: list of (shard file name, number of data), empty shards left out
+    '''
+    inputs = h_to_f.load(in_name, num_in)
+    num_data = len(inputs)
+    shards = []
+    for i in range(num_shards):
+        begin = num_data * i // num_shards
+        end = num_data * (i + 1) // num_shards
+        if begin == end:
+            continue
+        shard_name = os.path.join(work_dir, 'input_%03d_hex.dat' % i)
+        with open(shard_name, 'wb') as shard_file:
+            shard_file.write(f_to_h.floats_to_hex(inputs[begin:end]))
+        shards.append((shard_name, end - begin))
+    return shards
+
+def run_shard(job):
+    '''run one shard; job is (command, out_name)
+
+    Returns:
+        out_name: shard output file
+        cycles: simulated cycles the testbench reported
+        wall_time: seconds
+    '''
+    command, out_name = job
+    start_time = time.time()
+    output = subprocess.check_output(command, stderr=subprocess.STDOUT)
+    match = re.search(br'simulated cycles: (\d+)', output)
+    if not match:
+        raise RuntimeError('%s did not finish:\n%s' % (' '.join(command), output.decode()))
+    return out_name, int(match.group(1)), time.time() - start_time
+
+def merge(out_names, out_name):
+    '''concatenate the shard outputs in order'''
+    with open(out_name, 'wb') as out_file:
+        for name in out_names:
+            with open(name, 'rb') as shard_file:
+                shutil.copyfileobj(shard_file, out_file)
+
+def simulate(benchmark, arch, topology, act=None, num_shards=None, num_procs=None,
+        simulator='iverilog', libraries=(), num_calc=None, keep=False):
+    '''simulate a whole input file of a benchmark
+
+    Args:
+        benchmark: benchmark name, e.g. hotspot
+        arch: pipelined_vector, see ARCHITECTURES
+        topology: i_h1_h2_o
+        act: activation bitmask, hidden layers if None
+        num_shards: number of shards, num_procs if None
+        num_procs: number of concurrent simulations, one per core if None
+        simulator: iverilog or verilator
+        libraries: additional source files, e.g. the floating-point IP models
+        num_calc: NUM_CALC, predicted by pipelined_vector_model if None
+        keep: keep the work directory
+
+    Returns:
+        result: dict of num_data, cycles (sum over the shards), wall_time,
+            shard_time (sum of the shard wall times, about what one
+            sequential simulation takes) and out_name
+    '''
+    if arch not in ARCHITECTURES:
+        raise ValueError('no RTL simulation of %s, only of %s'
+                % (arch, ', '.join(sorted(ARCHITECTURES))))
+    layers = parse_topology(topology)
+    if act is None:
+        act = default_act(layers)
+    if num_calc is None:
+        num_calc = predict(topology, act)['num_calc']
+    num_procs = num_procs or multiprocessing.cpu_count()
+    num_shards = num_shards or num_procs
+    data_dir = "benchmark/"+benchmark+"/data/"+arch+"/"
+    in_name = data_dir+"input_hex.dat"
+    w_name = "benchmark/"+benchmark+"/nn_config/"+arch+"/"+topology+"_hex.dat"
+    out_name = data_dir+topology+"_hex.dat"
+
+    start_time = time.time()
+    work_dir = tempfile.mkdtemp(prefix='rtl_sim_')
+    try:
+        tb_name = os.path.join(work_dir, '%s_%s_tb.v' % (benchmark, topology))
+        with open(tb_name, 'w') as tb_file:
+            tb_file.write(testbench(layers, act, num_calc))
+        sources = [ os.path.join(arch, name) for name in ARCHITECTURES[arch] ] + list(libraries)
+        binary = os.path.join(work_dir, 'npu_tb')
+        subprocess.check_call(compile_command(simulator, tb_name, sources, binary))
+
+        jobs = []
+        for i, (shard_name, num_data) in enumerate(
+                shard_inputs(in_name, layers[0], num_shards, work_dir)):
+            shard_out = os.path.join(work_dir, 'output_%03d_hex.dat' % i)
+            jobs.append((run_command(simulator, binary, [('IN_FILE', shard_name),
+                ('W_FILE', w_name), ('OUT_FILE', shard_out), ('NUM_DATA', num_data)]),
+                shard_out))
+        pool = multiprocessing.pool.ThreadPool(num_procs)
+        try:
+            results = pool.map(run_shard, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        merge([ r[0] for r in results ], out_name)
+    finally:
+        if keep:
+            print('work directory: %s' % work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        'num_data': h_to_f.count_words(in_name) // layers[0],
+        'cycles': sum(r[1] for r in results),
+        'wall_time': time.time() - start_time,
+        'shard_time': sum(r[2] for r in results),
+        'out_name': out_name,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=str, help='benchmark')
+    parser.add_argument('-a', type=str, default='pipelined_vector', help='which architecture: pipelined_vector')
+    parser.add_argument('-t', type=str, help='topology: i_h1_h2_o')
+    parser.add_argument('-act', type=int, default=None, help='activation bitmask (default: hidden layers)')
+    parser.add_argument('-n', type=int, default=None, help='number of shards (default: -j)')
+    parser.add_argument('-j', type=int, default=None, help='number of concurrent simulations (default: one per core)')
+    parser.add_argument('-s', type=str, default='iverilog', help='simulator: iverilog or verilator')
+    parser.add_argument('-l', type=str, action='append', default=[], help='additional source file, e.g. a floating-point IP model')
+    parser.add_argument('-c', type=int, default=None, help='NUM_CALC (default: predicted by pipelined_vector_model.py)')
+    parser.add_argument('-k', action='store_true', help='keep the work directory')
+    args = parser.parse_args()
+
+    result = simulate(args.b, args.a, args.t, args.act, args.n, args.j,
+            args.s, args.l, args.c, args.k)
+    print('%d data, %d simulated cycles, %.1f sec wall time (%.1f sec of shards) -> %s'
+            % (result['num_data'], result['cycles'], result['wall_time'],
+                result['shard_time'], result['out_name']))
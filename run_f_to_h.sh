@@ -1,9 +1,18 @@
 #!/bin/bash
-# this script calls f_to_h twice to convert both the weight file and the input file to hex files
+# this script copies the input file and the weight file of a benchmark and converts both to hex files;
+# files whose sources did not change since the last run are skipped (see the manifest in data/<architecture>/)
+# -all updates every benchmark, architecture and topology in parallel
+
+if [ "$1" == "-all" ]
+then
+    python f_to_h.py -all
+    exit $?
+fi
 
 if [ $# != 3 ]
 then
     echo "usage: ./run_f_to_h.sh -b=<benchmark> -a=<architecture> -t=<topology>"
+    echo "       ./run_f_to_h.sh -all"
     exit 1
 fi
 
@@ -25,10 +34,4 @@ do
     esac
 done
 
-mkdir -p benchmark/$BENCHMARK/data/$ARCHITECTURE
-mkdir -p benchmark/$BENCHMARK/nn_config/$ARCHITECTURE
-
-cp benchmark/$BENCHMARK/data/train/input.txt benchmark/$BENCHMARK/data/$ARCHITECTURE/input.dat
-cp benchmark/$BENCHMARK/nn_config/${TOPOLOGY}.txt benchmark/$BENCHMARK/nn_config/$ARCHITECTURE/${TOPOLOGY}.dat
-
-python f_to_h.py -t=$TOPOLOGY -b=$BENCHMARK -a=$ARCHITECTURE
+python f_to_h.py -update -t=$TOPOLOGY -b=$BENCHMARK -a=$ARCHITECTURE
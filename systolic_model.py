@@ -0,0 +1,346 @@
+'''
+Description: cycle-level throughput model of the systolic NPU
+(systolic/npu.v controller driving systolic/pe_systolic.v PEs). every
+inference goes IDLE -> CONFIG -> LOAD_W1/W2/WO -> LOAD_I -> LAYER_H1/H2/O
+-> SEND_O, as npu.v returns to IDLE after SEND_O and reloads the
+configuration and the weights; with resident weights, an option npu.v does
+not have, it starts at LOAD_I. the weights of a neuron are its inputs
+padded to a ring turn plus the bias, loaded over the bus into the PEs. in
+a layer every iteration of NUM_TOTAL_PE neurons passes the inputs around
+the ring:
+    PE_MAO/PE_MAI: every NUM_TOTAL_PE cycles each PE injects a value, from
+        its output buffer in the first iteration and from its input buffer
+        in the next ones
+    PE_MAR: the other cycles each PE multiply-adds the value of the ring
+    PE_BIAS: CYCLES_MA + 1 cycles
+    PE_ACT/PE_ACT_CLR: CYCLES_ACT + 1 cycles (1 without activation); PEs
+        without a neuron in the last iteration of a layer sit in PE_CLR
+the ring and the fp_mac (MA, BIAS, and the PEs during LOAD_W), the
+activation unit (fp_add, fp_div) and the data bus (CONFIG, LOAD_W, LOAD_I,
+the inputs past the first NUM_TOTAL_PE, SEND_O) are modeled as separate
+resources. with an interleave depth of 1 the
+inference drains before the next one starts, as in npu.v; a larger depth
+keeps that many inferences in flight and hands every free resource to the
+oldest one that can use it, e.g. the ring works on the next inference
+while the activation unit finishes the current one. the report gives the
+steady-state samples per cycle, the ring occupancy and the ring idle
+cycles by stall source, for reloaded and for resident weights, with the
+speedup over draining with the same weights and over npu.v (draining,
+reloaded weights), e.g.
+    python systolic_model.py -d 2
+    python systolic_model.py 10_4_0_1 -d 1,2,4 -w reload
+'''
+import argparse
+from pipelined_vector_model import (PE_PARAMS, NPU_PARAMS, CLOCK_MHZ,
+        count_act, default_act, parse_topology)
+from dse import benchmark_topologies
+
+# pe_systolic.v buffer lengths, in words per PE
+SYSTOLIC_PE_PARAMS = dict(PE_PARAMS,
+        IN_BUF_LEN=PE_PARAMS['MAX_NEURONS_PER_STAGE'],
+        OUT_BUF_LEN=PE_PARAMS['MAX_NEURONS_PER_STAGE'] // PE_PARAMS['NUM_TOTAL_PE'])
+# LOAD_I: npu.v loads the first inputs for 8 cycles
+CYCLES_LOAD_I = 8
+# IDLE (the cycle we is raised) and the 6 words of CONFIG
+CYCLES_CONFIG = 1 + 6
+
+# resources
+BUS, RING, ACT = 'bus', 'ring', 'act'
+# PE states of pe_systolic.v
+PE_STATES = ('IDLE', 'LOAD', 'MAO', 'MAI', 'MAR', 'BIAS', 'ACT', 'ACT_CLR', 'CLR')
+# why the ring is idle: what the oldest inference in flight is doing
+STALLS = ('load', 'act', 'bus', 'empty')
+WEIGHTS = ('reload', 'resident')
+
+def ceil_div(a, b):
+    return (a + b - 1) // b
+
+def operations(layers, act, num_pe, cycles_ma, cycles_act, resident=False):
+    '''the operations of one inference, in order
+
+    Args:
+        resident: start at LOAD_I with the weights loaded, instead of
+            CONFIG and LOAD_W1/W2/WO as npu.v
+
+    Returns:
+        ops: list of dicts of
+            resources: tuple of the resources held for the whole operation
+            cycles: duration
+            kind: config, load_w, load_i, ma, act or send_o
+            layer: index of the layer in layers (ma)
+            ring: multiply-adds per neuron, n_prev padded to ring turns (ma)
+            offset: multiply-adds of the neuron done before the operation (ma)
+            iteration: iteration of the layer (ma, act)
+            busy_pes: PEs holding a neuron of the iteration (ma, act)
+            last: last iteration of the layer (act)
+            macs: useful multiply-adds, bias included (ma)
+    '''
+    ops = []
+    if not resident:
+        ops.append({'resources': (BUS,), 'cycles': CYCLES_CONFIG, 'kind': 'config'})
+        # every neuron: its inputs padded to a ring turn, then the bias
+        for n_prev, n in zip(layers[:-1], layers[1:]):
+            ops.append({'resources': (BUS, RING), 'kind': 'load_w',
+                'cycles': n * (ceil_div(n_prev, num_pe) * num_pe + 1)})
+    ops.append({'resources': (BUS,), 'cycles': CYCLES_LOAD_I, 'kind': 'load_i'})
+    num_hidden = len(layers) - 2
+    for k in range(1, len(layers)):
+        n_prev, n = layers[k-1], layers[k]
+        bit = 2 if k == num_hidden + 1 else k - 1
+        do_act = (act >> bit) & 1
+        # every neuron multiply-adds a whole number of ring turns
+        ring = ceil_div(n_prev, num_pe) * num_pe
+        iterations = ceil_div(n, num_pe)
+        for i in range(iterations):
+            busy_pes = min(num_pe, n - i * num_pe)
+            ma = {'kind': 'ma', 'layer': k, 'ring': ring, 'iteration': i,
+                    'busy_pes': busy_pes, 'macs': busy_pes * (n_prev + 1)}
+            # the inputs past LOAD_I come over the bus during the first turns
+            streamed = layers[0] - CYCLES_LOAD_I if k == 1 and i == 0 else 0
+            if streamed > 0:
+                ops.append(dict(ma, resources=(RING, BUS), cycles=streamed,
+                    offset=0, macs=0))
+                ops.append(dict(ma, resources=(RING,), offset=streamed,
+                    cycles=ring - streamed + cycles_ma + 1))
+            else:
+                ops.append(dict(ma, resources=(RING,), offset=0,
+                    cycles=ring + cycles_ma + 1))
+            ops.append({'resources': (ACT,), 'kind': 'act', 'iteration': i,
+                'busy_pes': busy_pes, 'last': i == iterations - 1,
+                'cycles': cycles_act + 1 if do_act else 1})
+    ops.append({'resources': (BUS,), 'cycles': layers[-1], 'kind': 'send_o'})
+    return ops
+
+def ma_state(op, cycle, num_pe):
+    '''PE state of every PE in a cycle of an ma operation'''
+    c = op['offset'] + cycle
+    if c >= op['ring']:
+        return 'BIAS'
+    if c % num_pe == 0:
+        return 'MAO' if op['iteration'] == 0 else 'MAI'
+    return 'MAR'
+
+def buffer_depth(layers, pe_params=SYSTOLIC_PE_PARAMS):
+    '''inferences the pe_systolic.v buffers can hold in flight: each one
+    keeps the inputs of its layer in the input buffers and its outputs in
+    the output buffers'''
+    num_pe = pe_params['NUM_TOTAL_PE']
+    return min(min(pe_params['IN_BUF_LEN'] // ceil_div(n_prev, num_pe),
+        pe_params['OUT_BUF_LEN'] // ceil_div(n, num_pe))
+        for n_prev, n in zip(layers[:-1], layers[1:]))
+
+def simulate(layers, act=None, depth=1, num_data=64, pe_params=SYSTOLIC_PE_PARAMS,
+        npu_params=NPU_PARAMS, resident=False):
+    '''run num_data inferences with depth of them in flight
+
+    Args:
+        layers: layer sizes, e.g. [10, 4, 1]
+        act: activation bitmask, hidden layers if None
+        depth: inferences in flight, 1 drains every inference as npu.v does
+        num_data: number of inferences
+        pe_params: pe_systolic.v parameters
+        npu_params: npu.v parameters
+        resident: keep the weights loaded, see operations()
+
+    Returns:
+        result: dict of
+            cycles: cycles of the whole run
+            latency: mean cycles from CONFIG, or LOAD_I with resident
+                weights, to the last output word
+            samples_per_cycle: steady state, between the first and the last
+                completion
+            ring_busy: share of the cycles the ring is in MA or BIAS
+            ring_occupancy: useful multiply-adds per PE-cycle
+            stalls: ring idle cycles per STALLS source
+            lost_pe_cycles: PE-cycles of busy ring lost to 'width' (PEs
+                without a neuron in the last iteration) and to 'padding'
+                (multiply-adds of the inputs padded to a ring turn)
+            pe_states: PE-cycles per PE_STATES; with depth > 1 a PE can
+                be in a ring state and in ACT in the same cycle
+    '''
+    if act is None:
+        act = default_act(layers)
+    num_pe = pe_params['NUM_TOTAL_PE']
+    ops = operations(layers, act, num_pe, npu_params['CYCLES_MA'], npu_params['CYCLES_ACT'],
+            resident)
+    # in flight: [sample, op index, cycles done in the op, running, start cycle]
+    flight = []
+    admitted = 0
+    done_cycles = []
+    latencies = []
+    stalls = dict.fromkeys(STALLS, 0)
+    pe_states = dict.fromkeys(PE_STATES, 0)
+    lost = {'width': 0, 'padding': 0}
+    ring_busy = 0
+    macs = 0
+    cycle = 0
+    while len(done_cycles) < num_data:
+        while len(flight) < depth and admitted < num_data:
+            flight.append([admitted, 0, 0, False, cycle])
+            admitted += 1
+        # running operations keep their resources, the oldest waiting
+        # inference gets the free ones
+        held = set()
+        for f in flight:
+            if f[3]:
+                held.update(ops[f[1]]['resources'])
+        for f in flight:
+            if not f[3] and not held.intersection(ops[f[1]]['resources']):
+                f[3] = True
+                held.update(ops[f[1]]['resources'])
+
+        ring_state = act_state = None
+        for f in flight:
+            if not f[3]:
+                continue
+            op = ops[f[1]]
+            if op['kind'] == 'ma':
+                ring_state = ma_state(op, f[2], num_pe)
+                pe_states[ring_state] += num_pe
+                lost['width'] += num_pe - op['busy_pes']
+                # the last ring turn passes the padded inputs last
+                c = op['offset'] + f[2]
+                last_turn = op['ring'] - num_pe
+                if last_turn <= c < op['ring'] and c - last_turn >= layers[op['layer'] - 1] - last_turn:
+                    lost['padding'] += op['busy_pes']
+            elif op['kind'] == 'act':
+                act_state = 'ACT_CLR' if op['last'] else 'ACT'
+                pe_states[act_state] += op['busy_pes']
+                pe_states['CLR'] += num_pe - op['busy_pes']
+            elif op['kind'] == 'load_w':
+                act_state = 'LOAD'
+                pe_states['LOAD'] += num_pe
+        if ring_state is None and act_state is None:
+            pe_states['IDLE'] += num_pe
+        if ring_state is not None:
+            ring_busy += 1
+        else:
+            oldest = flight[0] if flight else None
+            if oldest is None:
+                stalls['empty'] += 1
+            elif ops[oldest[1]]['kind'] in ('config', 'load_w'):
+                stalls['load'] += 1
+            elif ops[oldest[1]]['kind'] == 'act':
+                stalls['act'] += 1
+            else:
+                stalls['bus'] += 1
+
+        cycle += 1
+        for f in list(flight):
+            if not f[3]:
+                continue
+            f[2] += 1
+            op = ops[f[1]]
+            if f[2] == op['cycles']:
+                macs += op.get('macs', 0)
+                f[1] += 1
+                f[2] = 0
+                f[3] = False
+                if f[1] == len(ops):
+                    flight.remove(f)
+                    done_cycles.append(cycle)
+                    latencies.append(cycle - f[4])
+    if num_data > 1 and done_cycles[-1] > done_cycles[0]:
+        samples_per_cycle = float(num_data - 1) / (done_cycles[-1] - done_cycles[0])
+    else:
+        samples_per_cycle = float(num_data) / cycle
+    return {
+        'cycles': cycle,
+        'latency': float(sum(latencies)) / len(latencies),
+        'samples_per_cycle': samples_per_cycle,
+        'ring_busy': float(ring_busy) / cycle,
+        'ring_occupancy': float(macs) / (num_pe * cycle),
+        'stalls': stalls,
+        'lost_pe_cycles': lost,
+        'pe_states': pe_states,
+    }
+
+def predict(topology, act=None, depth=1, num_data=64, clock_mhz=CLOCK_MHZ,
+        pe_params=SYSTOLIC_PE_PARAMS, npu_params=NPU_PARAMS, resident=False):
+    '''throughput of a topology with depth inferences in flight
+
+    Returns:
+        result: simulate() results plus
+            topology, depth, weights (reload or resident)
+            samples_per_sec: at clock_mhz
+            buffer_depth: inferences the current buffers can hold
+            problems: list of strings, e.g. a depth the buffers cannot hold
+    '''
+    layers = parse_topology(topology)
+    result = simulate(layers, act, depth, num_data, pe_params, npu_params, resident)
+    result['topology'] = topology
+    result['depth'] = depth
+    result['weights'] = 'resident' if resident else 'reload'
+    result['samples_per_sec'] = result['samples_per_cycle'] * clock_mhz * 1e6
+    result['buffer_depth'] = buffer_depth(layers, pe_params)
+    problems = []
+    if depth > result['buffer_depth']:
+        problems.append('depth %d > %d inferences the buffers hold (IN_BUF_LEN=%d, OUT_BUF_LEN=%d)'
+                % (depth, result['buffer_depth'], pe_params['IN_BUF_LEN'],
+                    pe_params['OUT_BUF_LEN']))
+    if max(layers) > pe_params['MAX_NEURONS_PER_STAGE']:
+        problems.append('%d neurons > MAX_NEURONS_PER_STAGE=%d'
+                % (max(layers), pe_params['MAX_NEURONS_PER_STAGE']))
+    result['problems'] = problems
+    return result
+
+def int_list(text):
+    return [ int(v) for v in text.split(',') ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('topologies', nargs='*', help='i_h1_h2_o (default: every topology in benchmark/*/nn_config)')
+    parser.add_argument('-d', type=int_list, default=[2], help='interleave depths compared with draining, comma separated')
+    parser.add_argument('-act', type=int, default=None, help='activation bitmask (default: hidden layers)')
+    parser.add_argument('-n', type=int, default=64, help='number of inferences simulated')
+    parser.add_argument('-f', type=float, default=CLOCK_MHZ, help='clock frequency in MHz')
+    parser.add_argument('-match_pe', action='store_true', help='set the controller ACT window to the PE COUNT_ACT')
+    parser.add_argument('-states', action='store_true', help='also print the PE-cycles per pe_systolic.v state')
+    parser.add_argument('-w', type=str, default='both', help='weights: reload (as npu.v), resident or both')
+    args = parser.parse_args()
+
+    npu_params = dict(NPU_PARAMS)
+    if args.match_pe:
+        npu_params['CYCLES_ACT'] = count_act(PE_PARAMS)
+    if args.topologies:
+        topologies = [ ('-', t) for t in args.topologies ]
+    else:
+        topologies = benchmark_topologies()
+    weights = WEIGHTS if args.w == 'both' else (args.w,)
+    if any(w not in WEIGHTS for w in weights):
+        parser.error('-w: reload, resident or both')
+    depths = [1] + [ d for d in args.d if d != 1 ]
+    print('%-10s %-12s %-8s %5s %8s %10s %12s %8s %8s %6s %6s %6s %6s %6s %6s %8s' % ('benchmark',
+        'topology', 'weights', 'depth', 'latency', 'samples/c', 'samples/sec', 'speedup',
+        'vs npu.v', 'ring', 'occ', 'load', 'act', 'bus', 'width', 'padding'))
+    for benchmark, topology in topologies:
+        # npu.v: draining, weights reloaded for every inference
+        npu = predict(topology, args.act, 1, args.n, args.f,
+                SYSTOLIC_PE_PARAMS, npu_params)['samples_per_cycle']
+        for w in weights:
+            base = None
+            for depth in depths:
+                r = predict(topology, args.act, depth, args.n, args.f,
+                        SYSTOLIC_PE_PARAMS, npu_params, w == 'resident')
+                if base is None:
+                    base = r['samples_per_cycle']
+                cycles = float(r['cycles'])
+                pe_cycles = cycles * SYSTOLIC_PE_PARAMS['NUM_TOTAL_PE']
+                print('%-10s %-12s %-8s %5d %8.1f %10.5f %12.0f %7.2fx %7.2fx %5.1f%% %5.1f%% %5.1f%% %5.1f%% %5.1f%% %5.1f%% %7.1f%%'
+                        % (benchmark, topology, w, depth, r['latency'], r['samples_per_cycle'],
+                            r['samples_per_sec'], r['samples_per_cycle'] / base,
+                            r['samples_per_cycle'] / npu,
+                            r['ring_busy'] * 100, r['ring_occupancy'] * 100,
+                            r['stalls']['load'] / cycles * 100,
+                            r['stalls']['act'] / cycles * 100, r['stalls']['bus'] / cycles * 100,
+                            r['lost_pe_cycles']['width'] / pe_cycles * 100,
+                            r['lost_pe_cycles']['padding'] / pe_cycles * 100))
+                if args.states:
+                    print('    ' + ' '.join('%s %.1f%%' % (state, r['pe_states'][state] / pe_cycles * 100)
+                        for state in PE_STATES))
+                for problem in r['problems']:
+                    print('    warning: %s' % problem)
+    print('speedup: over depth 1 with the same weights; vs npu.v: over depth 1 with reloaded weights')
+    print('ring: cycles in MA/BIAS; occ: useful multiply-adds per PE-cycle; '
+            'load/act/bus: ring idle cycles waiting on CONFIG and LOAD_W/the activation unit/the bus; '
+            'width/padding: PE-cycles of busy ring without a neuron/on padded inputs')